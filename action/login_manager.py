@@ -1,8 +1,10 @@
-import requests
+import time
 import threading
 
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from template.nosqlTemplate import UserData
 from template.httpTemplate import StandardReqDataTemplate
@@ -13,10 +15,12 @@ from enums.actionEnum import ActionEnum
 from enums.loglabelEnum import LogLabelEnum
 from enums.csvEnum import CsvReadEnmum
 from utils.logs import ExceptionLog
+from utils.container import Container
 from utils.csv_div import CsvOperator
 from utils.nosql import NosqlOperator
 from utils.file import get_env_val
 from utils.request import RequestAction
+from utils.limiter import TokenBucket
 from check.standar import standard_normal_check
 
 class LoginAction:
@@ -42,79 +46,26 @@ class LoginAction:
 
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance(),
-        csv: CsvOperator = CsvOperator.create(),
-        nosql: NosqlOperator = NosqlOperator.create()
+        e: ExceptionLog | None = None,
+        csv: CsvOperator | None = None,
+        nosql: NosqlOperator | None = None
     ) -> None:
         if hasattr(self, "__initialized") and self.__initialized:
             return
         else:
-            self._e: ExceptionLog = e
-            self._csv: CsvOperator = csv
-            self._nosql: NosqlOperator = nosql
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._csv: CsvOperator = csv or Container.get_instance().csv
+            self._nosql: NosqlOperator = nosql or Container.get_instance().nosql
             self.__initialized: bool = True
 
-    def action_login(self) -> None:
-        # 通过csv获取用户数据
-        csv_p: Path = Path(__file__).parent.parent / "csv_data"
-        if not csv_p.exists():
-            self._e.error("%s csv文件目录不存在", LogLabelEnum.ERROR.value)
-            return
-        csv_f_p: Path = csv_p / "csv_user_data.csv"
-        if not csv_f_p.exists() or not csv_f_p.is_file():
-            self._e.error("%s csv文件不存在", LogLabelEnum.ERROR.value)
-            return
-        if not str(csv_f_p).endswith(".csv"):
-            self._e.error("%s csv文件格式错误", LogLabelEnum.WARNING.value)
-            return
-        u_d: list = self._csv.get_csv_data(str(csv_f_p))
-        if not u_d:
-            self._e.error("%s csv文件数据为空", LogLabelEnum.INFO.value)
-            return
-        # 调用requests进行登录
+    def _build_login_req(self, username: str, password: str) -> StandardReqDataTemplate:
         host: str | None = get_env_val()
         uri: str = f"{host}{ActionEnum.LOGIN_TEST.value}"
-        for u in u_d:
-            if not u.get(CsvReadEnmum.PHONE.value) and not u.get(CsvReadEnmum.PASSWORD.value): break
-            login_body: dict = {
-                CsvReadEnmum.PHONE.value: u.get(CsvReadEnmum.PHONE.value),
-                CsvReadEnmum.PASSWORD.value: u.get(CsvReadEnmum.PASSWORD.value)
-            }
-            req_data: StandardReqDataTemplate = StandardReqDataTemplate(
-                url=uri,
-                method="POST",
-                params=None,
-                headers={"sec-ch-ua-platform": "apitest"},
-                form=None,
-                body=login_body
-            )
-            req: RequestAction = RequestAction(self._e)
-            resp: tuple | None = req.request_meta(req_data)
-            if resp is None: continue
-            res_data: UserData | None = standard_normal_check(resp[0], resp[1], resp[2])
-            if res_data is None: continue
-            else:
-                self._e.info("%s 登录成功,用户名: %s", LogLabelEnum.SUCCESS.value, u.get(CsvReadEnmum.PHONE.value))
-                self._nosql.insert(res_data)
-
-    def retry(self, auth: str) -> None:
-        if not auth:
-            self._e.error("%s token为空", LogLabelEnum.INFO.value)
-            return
-        ret_data: dict | None = self._nosql.get_data_by_auth(auth)
-        if ret_data is None:
-            self._e.error("%s token不在数据库中", LogLabelEnum.INFO.value)
-            return
-        # 调用requests进行登录
-        host: str | None = get_env_val()
-        uri: str = f"{host}{ActionEnum.LOGIN_TEST.value}"
-        username: str = list(ret_data.keys())[0]
-        password: str = ret_data.get(username).get(NosqlEnum.PASSWORD.value) # type: ignore
         login_body: dict = {
             CsvReadEnmum.PHONE.value: username,
             CsvReadEnmum.PASSWORD.value: password
         }
-        req_data: StandardReqDataTemplate = StandardReqDataTemplate(
+        return StandardReqDataTemplate(
             url=uri,
             method="POST",
             params=None,
@@ -122,8 +73,194 @@ class LoginAction:
             form=None,
             body=login_body
         )
+
+    def _login_one(self, u: dict, req: RequestAction, limiter: TokenBucket) -> UserData | None:
+        limiter.acquire()
+        try:
+            resp: tuple | None = req.request_lazy(
+                self._build_login_req(u.get(CsvReadEnmum.PHONE.value), u.get(CsvReadEnmum.PASSWORD.value)) # type: ignore
+            )
+        except Exception as err:
+            self._e.handle_exception(err)
+            self._e.error("%s 登录请求异常,用户名: %s", LogLabelEnum.ERROR.value, u.get(CsvReadEnmum.PHONE.value))
+            return
+        if resp is None: return
+        return standard_normal_check(resp[0], resp[1], resp[2])
+
+    def _is_fresh(self, u: dict, max_age: float) -> str | None:
+        '''
+        判断已存储的token是否仍然新鲜,新鲜时返回token,否则返回None
+        1.用户不存在或没有token
+        2.csv中的密码已变更
+        3.login_time超过max_age秒
+        '''
+        stored: dict | None = self._nosql.get_some_nosql_data(u.get(CsvReadEnmum.PHONE.value)) # type: ignore
+        if stored is None or not stored.get(NosqlEnum.AUTHORIZATION.value): return
+        if stored.get(NosqlEnum.PASSWORD.value) != u.get(CsvReadEnmum.PASSWORD.value): return
+        login_time: str | None = stored.get(NosqlEnum.LOGIN_TIME.value)
+        if not login_time: return
+        try:
+            age: float = (datetime.now() - datetime.fromisoformat(login_time)).total_seconds()
+        except ValueError:
+            return
+        if age > max_age: return
+        return stored.get(NosqlEnum.AUTHORIZATION.value)
+
+    def _probe_one(self, auth: str, req: RequestAction, limiter: TokenBucket) -> bool:
+        # 用轻量接口探测token是否仍然有效
+        limiter.acquire()
+        probe_data: StandardReqDataTemplate = StandardReqDataTemplate(
+            url=f"{get_env_val()}{ActionEnum.USER_INFO.value}",
+            method="GET",
+            params=None,
+            headers={"sec-ch-ua-platform": "apitest", NosqlEnum.AUTHORIZATION.value: auth},
+            form=None,
+            body=None
+        )
+        try:
+            resp: tuple | None = req.request_lazy(probe_data)
+        except Exception as err:
+            self._e.handle_exception(err)
+            return False
+        # 状态码不是200时不解析响应体
+        if resp is None or resp[0].status_code != 200: return False
+        return resp[1].get_field("code") == ServerEnum.SUCCESS.value
+
+    def _probe_or_login(self, u: dict, auth: str, req: RequestAction, limiter: TokenBucket) -> UserData | bool | None:
+        # 探测通过返回True,否则重新登录
+        if self._probe_one(auth, req, limiter): return True
+        self._e.info("%s token探测失败,重新登录,用户名: %s", LogLabelEnum.RETRY.value, u.get(CsvReadEnmum.PHONE.value))
+        return self._login_one(u, req, limiter)
+
+    def _collect_login(self, done: set, pending: list, batch_size: int) -> tuple:
+        # 收集已完成的登录结果,攒够一批后批量写入nosql.返回 (登录成功数, 探测通过跳过数)
+        success: int = 0
+        skipped: int = 0
+        for f in done:
+            res_data: UserData | bool | None = f.result()
+            if res_data is None: continue
+            if res_data is True:
+                skipped += 1
+                continue
+            self._e.info("%s 登录成功,用户名: %s", LogLabelEnum.SUCCESS.value, res_data.username) # type: ignore
+            pending.append(res_data)
+            success += 1
+        if len(pending) >= batch_size:
+            self._nosql.insert_many(pending)
+            pending.clear()
+        return success, skipped
+
+    def action_login(
+        self,
+        concurrency: int | None = None,
+        rate: float | None = None,
+        batch_size: int | None = None,
+        incremental: bool | None = None,
+        max_age: float | None = None,
+        probe: bool | None = None,
+        shard_index: int | None = None,
+        shard_count: int | None = None,
+        manifest: str | None = None
+    ) -> None:
+        '''
+        并发登录csv中的全部用户
+        1.concurrency - 并发数
+        2.rate - 每秒最多发起的登录请求数,0为不限流.所有请求共享进程内的http连接池
+        3.batch_size - 登录成功的数据攒够一批后批量写入nosql
+        4.incremental - 增量模式,跳过nosql中token仍然新鲜的用户,只登录缺失、过期或密码变更的用户
+        5.max_age - 增量模式下token的最长有效秒数,按login_time计算
+        6.probe - 增量模式下对新鲜的token再调用一次用户信息接口探测,探测失败的重新登录
+        7.shard_index/shard_count - 分布式运行时每个worker只登录自己的分片,分片之间不重不漏
+        8.manifest - 签名的csv清单文件,覆盖多个账号文件,未设置时读取csv_data/csv_user_data.csv
+        '''
+        tmp_shard_count: int = int(shard_count or get_env_val("LOGIN_SHARD_COUNT") or 1)
+        tmp_shard_index: int = int(shard_index if shard_index is not None else (get_env_val("LOGIN_SHARD_INDEX") or 0))
+        tmp_manifest: str = manifest or get_env_val("LOGIN_CSV_MANIFEST")
+        # 通过csv获取用户数据
+        csv_p: Path = Path(__file__).parent.parent / "csv_data"
+        csv_f_p: Path = csv_p / "csv_user_data.csv"
+        if tmp_manifest:
+            if not Path(tmp_manifest).is_file():
+                self._e.error("%s csv清单文件不存在: %s", LogLabelEnum.ERROR.value, tmp_manifest)
+                return
+        elif not csv_p.exists():
+            self._e.error("%s csv文件目录不存在", LogLabelEnum.ERROR.value)
+            return
+        elif not csv_f_p.exists() or not csv_f_p.is_file():
+            self._e.error("%s csv文件不存在", LogLabelEnum.ERROR.value)
+            return
+        # 边读取csv边提交登录任务,不等待整个文件加载完
+        if tmp_manifest: u_d: Iterator[dict] = self._csv.iter_manifest_shard(tmp_manifest, tmp_shard_index, tmp_shard_count)
+        elif tmp_shard_count > 1: u_d: Iterator[dict] = self._csv.iter_csv_shard(str(csv_f_p), tmp_shard_index, tmp_shard_count)
+        else: u_d: Iterator[dict] = self._csv.iter_csv_data(str(csv_f_p))
+        tmp_concurrency: int = int(concurrency or get_env_val("LOGIN_CONCURRENCY") or 16)
+        tmp_rate: float = float(rate if rate is not None else (get_env_val("LOGIN_RATE") or 0))
+        tmp_batch_size: int = int(batch_size or get_env_val("LOGIN_BATCH_SIZE") or 200)
+        tmp_incremental: bool = incremental if incremental is not None else get_env_val("LOGIN_INCREMENTAL").lower() in ("1", "true")
+        tmp_max_age: float = float(max_age or get_env_val("LOGIN_MAX_AGE") or 3600)
+        tmp_probe: bool = probe if probe is not None else get_env_val("LOGIN_PROBE").lower() in ("1", "true")
         req: RequestAction = RequestAction(self._e)
-        resp: tuple | None = req.request_meta(req_data)
+        limiter: TokenBucket = TokenBucket(tmp_rate)
+        s_time: float = time.time()
+        total: int = 0
+        success: int = 0
+        skipped: int = 0
+        pending: list = []
+        in_flight: set = set()
+        # 调用requests进行登录 - 在途任务数有上限,边读取边提交
+        with ThreadPoolExecutor(max_workers=tmp_concurrency, thread_name_prefix="login") as pool:
+            for u in u_d:
+                if not u.get(CsvReadEnmum.PHONE.value) and not u.get(CsvReadEnmum.PASSWORD.value): break
+                total += 1
+                fresh_auth: str | None = self._is_fresh(u, tmp_max_age) if tmp_incremental else None
+                if fresh_auth and not tmp_probe:
+                    skipped += 1
+                    continue
+                if len(in_flight) >= tmp_concurrency * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    done_success, done_skipped = self._collect_login(done, pending, tmp_batch_size)
+                    success += done_success
+                    skipped += done_skipped
+                if fresh_auth: in_flight.add(pool.submit(self._probe_or_login, u, fresh_auth, req, limiter))
+                else: in_flight.add(pool.submit(self._login_one, u, req, limiter))
+            if total == 0:
+                self._e.error("%s csv文件数据为空", LogLabelEnum.INFO.value)
+                return
+            done, _ = wait(in_flight)
+            done_success, done_skipped = self._collect_login(done, pending, tmp_batch_size)
+            success += done_success
+            skipped += done_skipped
+        if pending: self._nosql.insert_many(pending)
+        cost: float = time.time() - s_time
+        self._e.info(
+            "%s 批量登录完成,分片: %s/%s, 总数: %s, 成功: %s, 跳过: %s, 失败: %s, 耗时: %.2fs, 吞吐: %.2f次/s, 并发数: %s",
+            LogLabelEnum.COUNT_TABLE.value,
+            tmp_shard_index + 1,
+            tmp_shard_count,
+            total,
+            success,
+            skipped,
+            total - success - skipped,
+            cost,
+            total / cost if cost > 0 else 0.0,
+            tmp_concurrency
+        )
+
+    def relogin(self, username: str) -> str | None:
+        '''
+        使用存储中的密码重新登录,成功后原子替换存储中的token,占用状态和租约不变.返回新token
+        '''
+        stored: dict | None = self._nosql.get_some_nosql_data(username)
+        if stored is None:
+            self._e.error("%s 用户不在数据库中: %s", LogLabelEnum.INFO.value, username)
+            return
+        password: str = stored.get(NosqlEnum.PASSWORD.value, "")
+        req_data: StandardReqDataTemplate = self._build_login_req(username, password)
+        try:
+            resp: tuple | None = RequestAction(self._e).request_lazy(req_data)
+        except Exception as err:
+            self._e.handle_exception(err)
+            resp = None
         if resp is None:
             self._e.error("%s 重登失败,请检查网络", LogLabelEnum.ERROR.value)
             return
@@ -131,6 +268,19 @@ class LoginAction:
         if res_data is None:
             self._e.error("%s 重登请求成功,业务响应校验失败", LogLabelEnum.ERROR.value)
             return
-        else:
-            self._e.info("%s 重登成功,用户名: %s", LogLabelEnum.RETRY.value, username)
-            self._nosql.update(username, res_data.metadata)
+        new_auth: str = res_data.metadata.Authorization
+        if not self._nosql.refresh_auth(username, new_auth): return
+        self._e.info("%s 重登成功,用户名: %s", LogLabelEnum.RETRY.value, username)
+        return new_auth
+
+    def retry(self, auth: str) -> str | None:
+        # 按旧token重新登录,返回新token
+        if not auth:
+            self._e.error("%s token为空", LogLabelEnum.INFO.value)
+            return
+        ret_data: dict | None = self._nosql.get_data_by_auth(auth)
+        # 数据库为空时返回None,token不存在时返回空字典
+        if not ret_data:
+            self._e.error("%s token不在数据库中", LogLabelEnum.INFO.value)
+            return
+        return self.relogin(list(ret_data.keys())[0])
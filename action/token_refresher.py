@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import heapq
+import base64
+import random
+import threading
+
+from pathlib import Path
+from typing import Callable, Optional
+from datetime import datetime
+
+from enums.nosqlEnum import NosqlEnum, NosqlStorageEnum
+from enums.loglabelEnum import LogLabelEnum
+from utils.logs import ExceptionLog
+from utils.container import Container
+from utils.nosql import NosqlOperator
+from utils.file import get_env_val
+from utils.limiter import TokenBucket
+from action.login_manager import LoginAction
+
+try:
+    import fcntl
+except ImportError: # 非POSIX系统没有fcntl,不做跨进程选主
+    fcntl = None
+
+class TokenRefresher:
+    '''
+    token主动刷新
+    1.到期时间优先取JWT中的exp,不是JWT时按login_time + ttl计算
+    2.在到期前lead秒内的随机时刻刷新,把同一时间登录的一批token的刷新时间打散
+    3.重新登录经令牌桶限流,按到期先后依次执行,不会在同一时刻集中重登
+    4.新token原子写入存储后通知订阅了该账号的回调,例如BrowseOnly更新请求头
+    5.同一份存储只由一个进程刷新:代理模式下由token代理进程启动;sqlite存储由多个worker共享,
+      start时抢占数据目录下的文件锁,抢到锁的进程成为刷新进程,其余进程不启动;
+      json/journal存储每个进程各自持有一份内存数据,不选主,只应在单进程运行时启动
+    '''
+    __instance: Optional['TokenRefresher'] = None
+    __lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def get_instance() -> 'TokenRefresher':
+        if TokenRefresher.__instance: return TokenRefresher.__instance
+        else:
+            with TokenRefresher.__lock:
+                if not TokenRefresher.__instance: TokenRefresher.__instance = TokenRefresher()
+            return TokenRefresher.__instance
+
+    def __init__(
+        self,
+        e: ExceptionLog | None = None,
+        nosql: NosqlOperator | None = None,
+        login: LoginAction | None = None,
+        ttl: float | None = None,
+        lead: float | None = None,
+        rate: float | None = None,
+        scan_interval: float | None = None,
+        shared_store: bool | None = None
+    ) -> None:
+        if hasattr(self, "__initialized") and self.__initialized:
+            return
+        else:
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._nosql: NosqlOperator = nosql or Container.get_instance().nosql
+            self._login: LoginAction = login or LoginAction.get_instance()
+            self._ttl: float = float(ttl or get_env_val("TOKEN_TTL") or get_env_val("LOGIN_MAX_AGE") or 3600)
+            self._lead: float = float(lead or get_env_val("TOKEN_REFRESH_LEAD") or max(self._ttl / 10, 60.0))
+            self._limiter: TokenBucket = TokenBucket(float(rate or get_env_val("TOKEN_REFRESH_RATE") or 5))
+            self._scan_interval: float = float(scan_interval or get_env_val("TOKEN_REFRESH_SCAN") or 30)
+            # 刷新计划 - 小根堆 (刷新时间, 用户名, 计划时的token),token已变化的条目出堆时丢弃
+            self._schedule: list = []
+            self._scheduled: dict = {} # 用户名 -> 计划时的token
+            self._listeners: dict = {} # 用户名 -> 回调列表
+            self._listener_lock: threading.Lock = threading.Lock()
+            self._stop_event: threading.Event = threading.Event()
+            self._worker: threading.Thread | None = None
+            self._leader_fp = None
+            # 只有多进程共享的存储才需要选主
+            self._shared_store: bool = shared_store if shared_store is not None else TokenRefresher.is_shared_store()
+            self.__initialized: bool = True
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return get_env_val("TOKEN_REFRESH").lower() in ("1", "true")
+
+    @staticmethod
+    def is_shared_store() -> bool:
+        # sqlite存储由同一台机器上的多个进程共享,json/journal存储每个进程各自加载一份
+        return NosqlStorageEnum.get_storage(get_env_val("NOSQL_STORAGE") or NosqlStorageEnum.JSON.value) == NosqlStorageEnum.SQLITE
+
+    @staticmethod
+    def get_running() -> Optional['TokenRefresher']:
+        # 本进程是刷新进程时返回实例,否则返回None,不会创建实例
+        instance: TokenRefresher | None = TokenRefresher.__instance
+        if instance is not None and instance.is_running: return instance
+        return
+
+    @property
+    def is_running(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def _acquire_leader(self) -> bool:
+        # 非阻塞抢占文件锁,进程退出时锁随文件描述符自动释放
+        if fcntl is None or self._leader_fp is not None: return True
+        lock_dir: Path = Path(get_env_val("NOSQL_DATA_DIR") or Path(__file__).parent.parent / "nosql")
+        lock_dir.mkdir(parents=True, exist_ok=True)
+        lock_fp = open(lock_dir / "token_refresher.lock", "a+")
+        try:
+            fcntl.flock(lock_fp.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_fp.close()
+            return False
+        lock_fp.seek(0)
+        lock_fp.truncate()
+        lock_fp.write(str(os.getpid()))
+        lock_fp.flush()
+        self._leader_fp = lock_fp
+        return True
+
+    def _release_leader(self) -> None:
+        if self._leader_fp is None: return
+        self._leader_fp.close()
+        self._leader_fp = None
+
+    @staticmethod
+    def decode_jwt_exp(auth: str) -> float | None:
+        # 只解析载荷中的exp,不校验签名
+        token: str = auth.split(" ", 1)[1] if auth.lower().startswith("bearer ") else auth
+        parts: list = token.split(".")
+        if len(parts) != 3: return
+        try:
+            payload: dict = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+            exp = payload.get("exp") if isinstance(payload, dict) else None
+            return float(exp) if isinstance(exp, (int, float)) else None
+        except ValueError:
+            return
+
+    def token_expiry(self, auth: str, login_time: str | None) -> float | None:
+        exp: float | None = self.decode_jwt_exp(auth)
+        if exp is not None: return exp
+        if not login_time: return
+        try:
+            return datetime.fromisoformat(login_time).timestamp() + self._ttl
+        except ValueError:
+            return
+
+    def subscribe(self, username: str, callback: Callable[[str, str], None]) -> None:
+        # 回调参数为 (用户名, 新token)
+        with self._listener_lock: self._listeners.setdefault(username, []).append(callback)
+
+    def unsubscribe(self, username: str, callback: Callable[[str, str], None]) -> None:
+        with self._listener_lock:
+            callbacks: list = self._listeners.get(username, [])
+            if callback in callbacks: callbacks.remove(callback)
+            if not callbacks: self._listeners.pop(username, None)
+
+    def _notify(self, username: str, new_auth: str) -> None:
+        with self._listener_lock: callbacks: list = list(self._listeners.get(username, []))
+        for callback in callbacks:
+            try:
+                callback(username, new_auth)
+            except Exception as err:
+                self._e.handle_exception(err)
+
+    def _rescan(self) -> None:
+        all_data: dict | None = self._nosql.get_all_nosql_data()
+        if not all_data: return
+        added: int = 0
+        for username, info in all_data.items():
+            auth: str | None = info.get(NosqlEnum.AUTHORIZATION.value)
+            if not auth or self._scheduled.get(username) == auth: continue
+            expiry: float | None = self.token_expiry(auth, info.get(NosqlEnum.LOGIN_TIME.value))
+            if expiry is None: continue
+            # 刷新时刻在 [到期前lead秒, 到期前lead/2秒] 内随机分布
+            refresh_at: float = expiry - self._lead * (0.5 + 0.5 * random.random())
+            heapq.heappush(self._schedule, (refresh_at, username, auth))
+            self._scheduled[username] = auth
+            added += 1
+        if added: self._e.info("%s token刷新计划新增: %s, 计划总数: %s", LogLabelEnum.COUNT.value, added, len(self._scheduled))
+
+    def _refresh_one(self, username: str, auth: str) -> None:
+        stored: dict | None = self._nosql.get_some_nosql_data(username)
+        # token已被其他途径刷新或用户已删除,放弃本次计划
+        if stored is None or stored.get(NosqlEnum.AUTHORIZATION.value) != auth:
+            if self._scheduled.get(username) == auth: self._scheduled.pop(username, None)
+            return
+        self._limiter.acquire()
+        new_auth: str | None = self._login.relogin(username)
+        if self._scheduled.get(username) == auth: self._scheduled.pop(username, None)
+        if new_auth is None:
+            self._e.error("%s 主动刷新token失败,用户名: %s", LogLabelEnum.ERROR.value, username)
+            return
+        # 新token直接加入计划,不必等待下一次扫描
+        expiry: float | None = self.token_expiry(new_auth, str(datetime.now().isoformat()))
+        if expiry is not None:
+            heapq.heappush(self._schedule, (expiry - self._lead * (0.5 + 0.5 * random.random()), username, new_auth))
+            self._scheduled[username] = new_auth
+        self._notify(username, new_auth)
+
+    def _refresh_loop(self) -> None:
+        next_scan: float = 0.0
+        while not self._stop_event.is_set():
+            now: float = time.time()
+            if now >= next_scan:
+                self._rescan()
+                next_scan = now + self._scan_interval
+            while self._schedule and self._schedule[0][0] <= time.time() and not self._stop_event.is_set():
+                _, username, auth = heapq.heappop(self._schedule)
+                try:
+                    self._refresh_one(username, auth)
+                except Exception as err:
+                    self._e.handle_exception(err)
+            wait_until: float = min(next_scan, self._schedule[0][0]) if self._schedule else next_scan
+            self._stop_event.wait(max(wait_until - time.time(), 0.05))
+
+    def start(self) -> bool:
+        '''
+        启动刷新线程,返回本进程是否为刷新进程
+        '''
+        with TokenRefresher.__lock:
+            if self.is_running: return True
+            if self._shared_store and not self._acquire_leader():
+                self._e.info("%s 其他进程已在刷新token,本进程不启动刷新", LogLabelEnum.INFO.value)
+                return False
+            self._stop_event.clear()
+            self._worker = threading.Thread(target=self._refresh_loop, name="token-refresher", daemon=True)
+            self._worker.start()
+        self._e.info("%s token主动刷新已启动,ttl: %ss, 提前: %ss, 限速: %s次/s", LogLabelEnum.GREENLIGHT.value, self._ttl, self._lead, self._limiter.rate)
+        return True
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._worker is not None: self._worker.join()
+        self._worker = None
+        self._release_leader()
@@ -0,0 +1,67 @@
+import os
+import re
+import sys
+import subprocess
+
+from pathlib import Path
+
+from utils.logs import ExceptionLog
+from utils.file import get_env_val
+from enums.loglabelEnum import LogLabelEnum
+
+_IMPORT_TIME_LINE: re.Pattern = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+_PROJECT_PACKAGES: tuple = ("action", "check", "enums", "flow", "template", "utils")
+
+def measure_import_cost(modules: list) -> dict:
+    '''
+    在新的解释器中用 -X importtime 导入模块,返回项目内每个模块的 (自身耗时ms, 累计耗时ms)
+    累计耗时包含模块顶层代码和默认参数的执行时间
+    '''
+    root: Path = Path(__file__).parent.parent
+    env: dict = dict(os.environ, PYTHONPATH=str(root))
+    proc: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "; ".join(f"import {m}" for m in modules)],
+        cwd=str(root),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    if proc.returncode != 0: raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    costs: dict = {}
+    for line in proc.stderr.splitlines():
+        matched: re.Match | None = _IMPORT_TIME_LINE.match(line)
+        if matched is None: continue
+        name: str = matched.group(4)
+        if name.split(".")[0] not in _PROJECT_PACKAGES: continue
+        costs[name] = (int(matched.group(1)) / 1000, int(matched.group(2)) / 1000)
+    return costs
+
+def check_import_budget(
+    modules: list | None = None,
+    budget_ms: float | None = None
+) -> bool:
+    '''
+    导入耗时检查,累计耗时超过budget_ms的入口模块视为超出预算
+    1.modules - 入口模块,默认为压测脚本和登录模块
+    2.budget_ms - 每个入口模块的累计导入耗时上限
+    '''
+    e: ExceptionLog = ExceptionLog.get_instance()
+    tmp_modules: list = modules or (get_env_val("IMPORT_BUDGET_MODULES") or "flow.user,action.login_manager").split(",")
+    tmp_budget: float = float(budget_ms or get_env_val("IMPORT_BUDGET_MS") or 1000)
+    ok: bool = True
+    for module in tmp_modules:
+        # 每个入口单独启动解释器,避免共享的依赖只计入第一个模块
+        costs: dict = measure_import_cost([module])
+        for name, (self_ms, cumulative_ms) in sorted(costs.items(), key=lambda item: item[1][1], reverse=True):
+            e.info("%s 模块导入耗时: %s, 自身: %.2fms, 累计: %.2fms", LogLabelEnum.COUNT.value, name, self_ms, cumulative_ms)
+        total_ms: float = costs.get(module, (0.0, 0.0))[1]
+        if total_ms > tmp_budget:
+            ok = False
+            e.error("%s 模块导入耗时超出预算: %s, 累计: %.2fms, 预算: %.2fms", LogLabelEnum.ERROR.value, module, total_ms, tmp_budget)
+        else:
+            e.info("%s 模块导入耗时符合预算: %s, 累计: %.2fms, 预算: %.2fms", LogLabelEnum.SUCCESS.value, module, total_ms, tmp_budget)
+    return ok
+
+# 在项目根目录执行: python -m check.import_budget
+if __name__ == "__main__":
+    sys.exit(0 if check_import_budget() else 1)
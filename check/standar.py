@@ -1,6 +1,7 @@
 from requests import Response
 
 from utils.logs import ExceptionLog
+from utils.response import ResponseDiv
 from template.httpTemplate import StandardReqDataTemplate
 from template.nosqlTemplate import UserData, MetaUserData
 from enums.loglabelEnum import LogLabelEnum
@@ -8,7 +9,7 @@ from enums.serverEnum import ServerEnum
 
 def standard_normal_check(
     real_resp: Response,
-    parse_resp: dict | str | None,
+    parse_resp: ResponseDiv | dict | str | None,
     data: StandardReqDataTemplate
 ) -> UserData | None:
     e: ExceptionLog = ExceptionLog.get_instance()
@@ -21,6 +22,8 @@ def standard_normal_check(
     if real_resp.status_code != 200:
         e.error("%s 请求失败,服务端状态码: %s", LogLabelEnum.ERROR.value, real_resp.status_code)
         return
+    # 状态码正确时才解析响应体
+    if isinstance(parse_resp, ResponseDiv): parse_resp = parse_resp.get_serialize_client_resp()
     if parse_resp is None:
         e.error("%s 解析响应信息失败", LogLabelEnum.ERROR.value)
         return
@@ -3,3 +3,4 @@ from enum import Enum
 class ActionEnum(Enum):
     LOGIN = "/interior/auth/login"
     LOGIN_TEST = "/user/login"
+    USER_INFO = "/user/info"
@@ -0,0 +1,23 @@
+from enum import Enum
+
+class LogQueuePolicyEnum(Enum):
+    # 定义日志队列写满时的处理方式
+    DROP = "drop" # 丢弃新日志并计数,调用方不阻塞
+    BLOCK = "block" # 调用方阻塞等待队列有空位
+
+    @classmethod
+    def get_policy(cls, name: str) -> 'LogQueuePolicyEnum':
+        for policy in cls:
+            if policy.value == str(name).lower(): return policy
+        return cls.DROP
+
+class LogSinkFormatEnum(Enum):
+    # 定义结构化日志的编码格式
+    JSONL = "jsonl" # 每行一条json记录
+    MSGPACK = "msgpack" # msgpack记录首尾相接,需要安装msgpack
+
+    @classmethod
+    def get_format(cls, name: str) -> 'LogSinkFormatEnum | None':
+        for fmt in cls:
+            if fmt.value == str(name).lower(): return fmt
+        return
@@ -0,0 +1,30 @@
+from enum import Enum
+
+class TokenCheckoutEnum(Enum):
+    # 定义token管理器取用token的方式
+    RANDOM = "random" # 全局锁 + 随机选择,每次取用同步写缓存数据库
+    QUEUE = "queue" # 打乱的空闲队列,O(1)取用/归还,占用状态异步同步到缓存数据库
+    BROKER = "broker" # 由本机的token代理进程统一管理租约,管理器只作为客户端转发请求
+
+    @classmethod
+    def get_mode(cls, name: str) -> 'TokenCheckoutEnum':
+        for mode in cls:
+            if mode.value == str(name).lower(): return mode
+        return cls.RANDOM
+
+class BrokerOpEnum(Enum):
+    # 定义token代理支持的操作
+    ACQUIRE = "acquire"
+    RELEASE = "release"
+    RENEW = "renew"
+    ACQUIRE_MANY = "acquire_many"
+    RELEASE_MANY = "release_many"
+    LEASE_TTL = "lease_ttl"
+    REFRESH = "refresh" # 认证失效后由代理进程重新登录
+    PING = "ping"
+
+    @classmethod
+    def get_op(cls, name: str) -> 'BrokerOpEnum | None':
+        for op in cls:
+            if op.value == name: return op
+        return
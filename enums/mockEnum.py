@@ -0,0 +1,15 @@
+from enum import Enum
+
+class MockLatencyEnum(Enum):
+    # 定义模拟服务的延迟分布,参数单位为毫秒
+    FIXED = "fixed" # fixed:延迟
+    UNIFORM = "uniform" # uniform:最小值,最大值
+    NORMAL = "normal" # normal:均值,标准差
+    EXP = "exp" # exp:均值
+    LOGNORMAL = "lognormal" # lognormal:中位数,形状参数sigma
+
+    @classmethod
+    def get_dist(cls, name: str) -> 'MockLatencyEnum | None':
+        for dist in cls:
+            if dist.value == str(name).lower(): return dist
+        return
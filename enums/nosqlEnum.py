@@ -7,6 +7,7 @@ class NosqlEnum(Enum):
     STATUS = "is_occupancy"
     LOGIN_TIME = "login_time"
     UPDATE_TIME = "update_time"
+    LEASE_EXPIRE = "lease_expire"
 
     @classmethod
     def is_in_nosql_field(cls, key: str) -> bool:
@@ -21,3 +22,15 @@ class NosqlEnum(Enum):
         for field in cls:
             if field.value in kwarg: field_list.append(field.value)
         return field_list
+
+class NosqlStorageEnum(Enum):
+    # 定义缓存数据库的持久化方式
+    JSON = "json"
+    JOURNAL = "journal"
+    SQLITE = "sqlite"
+
+    @classmethod
+    def get_storage(cls, name: str) -> 'NosqlStorageEnum':
+        for storage in cls:
+            if storage.value == str(name).lower(): return storage
+        return cls.JSON
@@ -0,0 +1,85 @@
+import threading
+import gevent
+import gevent.lock
+
+from gevent.lock import Semaphore
+from gevent.event import AsyncResult
+from typing import Optional
+
+from enums.loglabelEnum import LogLabelEnum
+from utils.logs import ExceptionLog
+from utils.container import Container
+from utils.nosql import NosqlOperator
+from utils.manager import StandardTokenManager
+from action.login_manager import LoginAction
+
+class AuthRecovery:
+    '''
+    认证失效后的恢复,同一账号同一时刻只重新登录一次
+    1.存储中的token已经不是失效的token时(已被刷新器或其他用户刷新),直接返回存储中的新token
+    2.否则第一个调用方重新登录,其余调用方等待同一次登录的结果
+    3.代理模式下整个恢复过程转发给token代理,由代理进程登录并写入存储,单飞对同一台机器上的所有worker生效,
+      worker进程不打开缓存数据库
+    4.offload为True时登录在线程池中执行,用于未打猴子补丁的代理进程,登录期间不阻塞其他协程
+    '''
+    __instance: Optional['AuthRecovery'] = None
+    __lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def get_instance() -> 'AuthRecovery':
+        if AuthRecovery.__instance: return AuthRecovery.__instance
+        else:
+            with AuthRecovery.__lock:
+                if not AuthRecovery.__instance: AuthRecovery.__instance = AuthRecovery()
+            return AuthRecovery.__instance
+
+    def __init__(
+        self,
+        e: ExceptionLog | None = None,
+        nosql: NosqlOperator | None = None,
+        login: LoginAction | None = None,
+        manager: StandardTokenManager | None = None,
+        timeout: float = 30.0,
+        offload: bool = False
+    ) -> None:
+        if hasattr(self, "__initialized") and self.__initialized:
+            return
+        else:
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._manager: StandardTokenManager = manager or Container.get_instance().token_manager
+            self._timeout: float = timeout
+            self._offload: bool = offload
+            self._flights: dict = {} # 用户名 -> 进行中的登录结果
+            self._flight_lock: Semaphore = gevent.lock.Semaphore()
+            if not self._manager.is_broker:
+                self._nosql: NosqlOperator = nosql or Container.get_instance().nosql
+                self._login: LoginAction = login or LoginAction.get_instance()
+            self.__initialized: bool = True
+
+    def recover(self, username: str, stale_auth: str) -> str | None:
+        '''
+        返回可用的新token,重新登录失败时返回None
+        '''
+        if self._manager.is_broker: return self._manager.refresh(username, stale_auth, self._timeout)
+        current: str | None = self._nosql.get_auth(username)
+        if current and current != stale_auth: return current
+        with self._flight_lock:
+            flight: AsyncResult | None = self._flights.get(username)
+            is_leader: bool = flight is None
+            if is_leader:
+                flight = AsyncResult()
+                self._flights[username] = flight
+        if not is_leader:
+            flight.wait(timeout=self._timeout) # type: ignore
+            return flight.get() if flight.ready() else None # type: ignore
+        new_auth: str | None = None
+        try:
+            self._e.info("%s 用户: %s 认证失效,重新登录", LogLabelEnum.AUTH.value, username)
+            if self._offload: new_auth = gevent.get_hub().threadpool.apply(self._login.retry, (stale_auth,))
+            else: new_auth = self._login.retry(stale_auth)
+        except Exception as err:
+            self._e.handle_exception(err)
+        finally:
+            with self._flight_lock: self._flights.pop(username, None)
+            flight.set(new_auth) # type: ignore
+        return new_auth
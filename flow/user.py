@@ -1,15 +1,37 @@
-from locust import HttpUser, task, between
+import time
+import uuid
+
+from locust import HttpUser, task, between, events
+from locust.runners import MasterRunner, WorkerRunner
 
 from enums.loglabelEnum import LogLabelEnum
 from enums.nosqlEnum import NosqlEnum
 from utils.logs import ExceptionLog
 from utils.manager import StandardTokenManager
+from action.token_refresher import TokenRefresher
+from flow.auth_recovery import AuthRecovery
 from utils.file import get_env_val
 from enums.serverEnum import ServerEnum
 
+@events.init.add_listener
+def _start_token_refresher(environment, **kwargs) -> None:
+    '''
+    token主动刷新每台机器只运行一个
+    1.代理模式由代理进程负责
+    2.sqlite存储由抢到文件锁的worker负责
+    3.json/journal存储每个worker各自持有内存数据,刷新结果无法共享,多worker时不启动
+    '''
+    if not TokenRefresher.is_enabled() or isinstance(environment.runner, MasterRunner): return
+    if StandardTokenManager.get_instance().is_broker: return
+    if isinstance(environment.runner, WorkerRunner) and not TokenRefresher.is_shared_store():
+        ExceptionLog.get_instance().info(
+            "%s 多worker运行时json/journal存储无法共享刷新结果,本进程不启动token主动刷新,请使用sqlite存储或代理模式",
+            LogLabelEnum.WARNING.value
+        )
+        return
+    TokenRefresher.get_instance().start()
+
 class BrowseOnly(HttpUser):
-    # 多实例共享同一个用户池
-    __user_pool: set = set()
     host: str | None = get_env_val()
     wait_time = between(0, 5) # constant(2)为固定时间执行动作
 
@@ -18,43 +40,89 @@ class BrowseOnly(HttpUser):
         self._e: ExceptionLog = ExceptionLog.get_instance()
         self._headers: dict = {}
         self._token_pool: StandardTokenManager = StandardTokenManager.get_instance()
+        self._user: str | None = None
+        # 持有方标识,租约过期被回收后本实例迟到的归还和续约会被忽略
+        self._holder: str = uuid.uuid4().hex
+        self._lease_renew_at: float = 0.0
+        # 本进程是刷新进程时订阅刷新回调更新请求头;其他进程的token由刷新进程写入存储,401时经认证恢复取得
+        self._refresher: TokenRefresher | None = TokenRefresher.get_running()
 
     def on_start(self) -> None:
-        result: tuple | None = self._token_pool.get_access_token()
+        # 同一批启动的用户合并为一次批量取用
+        result: tuple | None = self._token_pool.checkout(holder=self._holder)
         if result is None:
             self._e.error("%s 可用token为空,提供测试数据不足", LogLabelEnum.ERROR.value)
             self.stop()
             return
         user, auth_token = result
-        self.__user_pool.add(user)
+        self._user = user
+        self._lease_renew_at = time.time() + self._token_pool.lease_ttl / 3
         self._headers.setdefault(NosqlEnum.AUTHORIZATION.value, auth_token)
         self._headers.setdefault("sec-ch-ua-platform", "apitest")
         self.client.headers.update(self._headers)
+        if self._refresher is not None: self._refresher.subscribe(user, self._on_token_refreshed)
         self._e.info("%s 获取用户token成功,用户ID: %s 绑定账号: %s", LogLabelEnum.GREENLIGHT.value, id(self), user)
 
     def on_stop(self):
-        if self.__user_pool:
-            for user in self.__user_pool:
-                self._token_pool.cast_token(user)
-                self._e.info("%s 释放用户token成功,用户ID: %s 释放账号: %s", LogLabelEnum.RETRY.value, id(self), user)
+        # 每个实例只归还自己持有的账号
+        if self._user is None: return
+        if self._refresher is not None: self._refresher.unsubscribe(self._user, self._on_token_refreshed)
+        self._token_pool.checkin(self._user, self._holder)
+        self._e.info("%s 释放用户token成功,用户ID: %s 释放账号: %s", LogLabelEnum.RETRY.value, id(self), self._user)
+        self._user = None
+
+    def _on_token_refreshed(self, username: str, new_auth: str) -> None:
+        # 刷新器回调,替换当前实例请求头中的token
+        if username != self._user: return
+        self._headers[NosqlEnum.AUTHORIZATION.value] = new_auth
+        self.client.headers[NosqlEnum.AUTHORIZATION.value] = new_auth
+
+    def _heartbeat(self) -> None:
+        # 租约过去三分之一时续约,避免持有的账号被回收
+        if self._user is None or time.time() < self._lease_renew_at: return
+        self._lease_renew_at = time.time() + self._token_pool.lease_ttl / 3
+        if not self._token_pool.renew(self._user, self._holder):
+            self._e.error("%s 续约失败,用户ID: %s 绑定账号: %s", LogLabelEnum.ERROR.value, id(self), self._user)
+
+    def _recover_auth(self) -> bool:
+        # 认证失效时重新登录,同一账号的并发恢复只登录一次
+        if self._user is None: return False
+        stale_auth: str = self._headers.get(NosqlEnum.AUTHORIZATION.value, "")
+        new_auth: str | None = AuthRecovery.get_instance().recover(self._user, stale_auth)
+        if new_auth is None: return False
+        self._on_token_refreshed(self._user, new_auth)
+        return True
+
+    def _get_user_info(self, is_retry: bool = False) -> None:
+        need_retry: bool = False
+        with self.client.get(
+            "/user/info",
+            headers=self._headers,
+            catch_response=True,
+            name="%s 测试获取用户信息" % LogLabelEnum.TEST.value
+        ) as resp:
+            if resp.status_code == 401 and not is_retry:
+                resp.failure(f"{LogLabelEnum.AUTH.value} 认证失效")
+                need_retry = True
+            elif resp.status_code != 200 or resp.json().get("code") != ServerEnum.SUCCESS.value:
+                fail_mess: str = f"{LogLabelEnum.ERROR.value} 获取用户信息失败,失败原因: {resp.text}"
+                self._e.error(fail_mess)
+                resp.failure(fail_mess)
+            else:
+                self._e.info("%s 获取用户信息成功,用户信息: %s", LogLabelEnum.SUCCESS.value, resp.text)
+                resp.success()
+        if not need_retry: return
+        # token失效 → 恢复认证后使用新的请求头重试一次
+        if not self._recover_auth():
+            self._e.error("%s 认证恢复失败,绑定账号: %s", LogLabelEnum.ERROR.value, self._user)
+            return
+        self._get_user_info(is_retry=True)
 
     @task(5)
     def view_home_page(self) -> None:
+        self._heartbeat()
         try:
-            with self.client.get(
-                "/user/info",
-                headers=self._headers,
-                catch_response=True,
-                name="%s 测试获取用户信息" % LogLabelEnum.TEST.value
-            ) as resp:
-                if resp.status_code != 200 or not resp.json().get("code") != ServerEnum.SUCCESS.value:
-                    fail_mess: str = f"{LogLabelEnum.ERROR.value} 获取用户信息失败,失败原因: {resp.text}" 
-                    self._e.error(fail_mess)
-                    resp.failure(fail_mess)
-                else:
-                    self._e.info("%s 获取用户信息成功,用户信息: %s", LogLabelEnum.SUCCESS.value, resp.text)
-                    resp.success()
+            self._get_user_info()
         except Exception as err:
             self._e.handle_exception(err)
             self._e.error("%s 获取用户信息异常,异常原因: %s", LogLabelEnum.ERROR.value, err)
-            self.stop()
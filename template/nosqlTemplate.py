@@ -7,10 +7,14 @@ class MetaUserData:
     is_occupancy: bool = False
     login_time: str | None = None
     update_time: str | None = None
+    lease_expire: str | None = None
 
     @property
     def info(self) -> dict:
-        return self.__dict__.copy()
+        # 未设置的租约不输出,避免update时把存储中已有的租约覆盖为空
+        info: dict = self.__dict__.copy()
+        if info.get("lease_expire") is None: info.pop("lease_expire", None)
+        return info
 
 @dataclass
 class UserData:
@@ -0,0 +1,100 @@
+import os
+import sys
+import csv
+import pytest
+import gevent
+
+from pathlib import Path
+
+# 测试在项目根目录下导入业务模块
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.nosql import NosqlCore, NosqlOperator
+from utils.manager import StandardTokenManager
+from utils.mock_server import MockServer
+from utils.encry import UnitEncry
+from utils.csv_div import CsvCore, CsvOperator
+from utils.logs import ExceptionLog
+from enums.csvEnum import CsvMetaEnum, CsvHeaderEnum
+from template.nosqlTemplate import UserData, MetaUserData
+from cryptography.fernet import Fernet
+
+def build_nosql(data_dir: str, storage: str = "json", **kwargs) -> NosqlOperator:
+    # 每个用例使用独立数据目录的NosqlCore,不经过进程内单例
+    nosql_core: NosqlCore = NosqlCore(data_dir=data_dir, storage=storage, **kwargs)
+    nosql_op: NosqlOperator = NosqlOperator.__new__(NosqlOperator)
+    nosql_op._nosql_core = nosql_core # type: ignore
+    return nosql_op
+
+def seed_users(nosql: NosqlOperator, count: int, prefix: str = "u") -> list:
+    users: list = [UserData(f"{prefix}{i}", MetaUserData(password="pwd", Authorization=f"token-{prefix}{i}")) for i in range(count)]
+    nosql.insert_many(users)
+    return [user.username for user in users]
+
+def build_encry() -> UnitEncry:
+    # 密钥只在内存中生成,不在项目根目录写入密钥文件;密钥对象置空,首次使用时与读取密钥文件时一样从PEM加载
+    encry: UnitEncry = UnitEncry.__new__(UnitEncry)
+    encry._e = ExceptionLog.get_instance()
+    encry._key = Fernet.generate_key()
+    encry._frenet = Fernet(encry._key)
+    encry._verified = {}
+    encry._decrypted = {}
+    encry._generate_rsa_key_pair()
+    encry._public_key = None
+    encry._private_key = None
+    return encry
+
+def build_csv(encry: UnitEncry) -> CsvOperator:
+    # 每个用例使用独立的CsvCore,不经过进程内单例
+    csv_op: CsvOperator = CsvOperator.__new__(CsvOperator)
+    csv_op._csv_core = CsvCore(encry=encry) # type: ignore
+    return csv_op
+
+def write_signed_csv(encry: UnitEncry, path: str, rows: list) -> str:
+    # 与csv模板相同的三行元数据,之后是 (用户名, 密码) 数据行
+    headers: list = CsvHeaderEnum.get_headers_list()
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([f"#{CsvMetaEnum.SIG.value}:{encry.generate_signature_str(headers)}"])
+        writer.writerow([f"#{CsvMetaEnum.PUB_ENCRY_KEY.value}:{encry.generate_encry_str(encry.rsa_pub_key)}"])
+        writer.writerow(headers)
+        writer.writerows(rows)
+    return path
+
+@pytest.fixture(scope="session")
+def encry() -> UnitEncry:
+    return build_encry()
+
+@pytest.fixture(scope="session", autouse=True)
+def work_dir(tmp_path_factory: pytest.TempPathFactory):
+    # 日志等目录按当前工作目录创建,测试期间切换到临时目录,不在项目中留下文件
+    origin: str = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("work"))
+    yield
+    os.chdir(origin)
+
+@pytest.fixture
+def nosql(tmp_path: Path) -> NosqlOperator:
+    return build_nosql(str(tmp_path / "nosql"))
+
+@pytest.fixture
+def queue_manager(nosql: NosqlOperator) -> StandardTokenManager:
+    return StandardTokenManager(nosql=nosql, checkout_mode="queue")
+
+@pytest.fixture
+def broker_addr(tmp_path: Path) -> str:
+    # Unix域套接字路径长度有限,使用短路径
+    return f"unix:{tmp_path}/b.sock" if len(str(tmp_path)) < 90 else f"unix:/tmp/broker-{os.getpid()}.sock"
+
+def in_thread(func, *args):
+    # 测试进程未打猴子补丁,阻塞的http请求放到线程中执行,模拟服务所在的协程可以继续响应
+    return gevent.get_hub().threadpool.apply(func, args)
+
+@pytest.fixture
+def mock_server(monkeypatch: pytest.MonkeyPatch):
+    # 启动本地模拟服务,登录等请求的host指向该服务
+    server: MockServer = MockServer(host="127.0.0.1", port=0, seed=1)
+    server.start()
+    monkeypatch.setenv("LQZENTAOHOST", server.url)
+    yield server
+    server.stop()
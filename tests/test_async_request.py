@@ -0,0 +1,37 @@
+import asyncio
+
+from utils.async_request import AsyncRequestAction
+from utils.mock_server import MockServer
+from utils.response import ResponseDiv
+from template.httpTemplate import StandardReqDataTemplate
+from conftest import in_thread
+
+def _login_req(url: str, phone: str) -> StandardReqDataTemplate:
+    return StandardReqDataTemplate(url=f"{url}/user/login", method="POST", params=None, headers=None, form=None, body={"phone": phone, "password": "pwd"})
+
+def _run(coro_func, *args):
+    # 事件循环放到线程中运行,模拟服务所在的协程可以继续响应
+    return in_thread(asyncio.run, coro_func(*args))
+
+def test_request_many_keeps_order_and_shape(mock_server):
+    async def run() -> tuple:
+        async with AsyncRequestAction(concurrency=2) as req:
+            many: list = await req.request_many([_login_req(mock_server.url, f"u{i}") for i in range(5)] + ["bad"])
+            lazy: tuple | None = await req.request_lazy(_login_req(mock_server.url, "u9"))
+        return many, lazy
+    many, lazy = _run(run)
+    # 返回值与RequestAction.request_meta相同,类型错误的请求对应位置为None
+    assert [item[1]["code"] for item in many[:5]] == [1001] * 5
+    assert [item[2].body["phone"] for item in many[:5]] == [f"u{i}" for i in range(5)]
+    assert many[5] is None
+    assert isinstance(lazy[1], ResponseDiv) and lazy[1].get_field("code") == 1001
+
+def test_request_timeout_returns_none():
+    server: MockServer = MockServer(host="127.0.0.1", port=0, latency="fixed:500")
+    server.start()
+    try:
+        async def run() -> tuple | None:
+            async with AsyncRequestAction(timeout=0.1) as req: return await req.request_meta(_login_req(server.url, "u0"))
+        assert _run(run) is None
+    finally:
+        server.stop()
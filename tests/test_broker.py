@@ -0,0 +1,100 @@
+import gevent
+
+from utils.broker import TokenBroker
+from utils.broker_client import TokenBrokerClient
+from conftest import seed_users
+
+def test_close_releases_tokens_to_waiting_client(nosql, queue_manager, broker_addr):
+    # 持有方关闭连接后,代理立即归还其持有的token并交给等待中的客户端
+    seed_users(nosql, 1)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager)
+    broker.start()
+    holder: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    waiter: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    try:
+        held: tuple | None = holder.acquire(timeout=1.0)
+        assert held == ("u0", "token-u0")
+        pending: gevent.Greenlet = gevent.spawn(waiter.acquire, 5.0)
+        gevent.sleep(0.2)
+        assert not pending.ready()
+        holder.close()
+        assert pending.get(timeout=3.0) == held
+    finally:
+        waiter.close()
+        holder.close()
+        broker.stop()
+
+def test_acquire_many_is_exclusive_across_clients(nosql, queue_manager, broker_addr):
+    seed_users(nosql, 6)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager)
+    broker.start()
+    clients: list = [TokenBrokerClient(addr=broker_addr) for _ in range(3)]
+    try:
+        batches: list = [client.acquire_many(2) for client in clients]
+        usernames: list = [username for batch in batches for username, _ in batch]
+        assert sorted(usernames) == [f"u{i}" for i in range(6)]
+        assert clients[0].acquire(timeout=0.2) is None
+    finally:
+        for client in clients: client.close()
+        broker.stop()
+
+def test_refresh_is_single_flight_and_owner_only(nosql, queue_manager, broker_addr, mock_server):
+    # worker的认证恢复转发给代理,并发的恢复请求只登录一次,非持有方不能刷新
+    from flow.auth_recovery import AuthRecovery
+    from action.login_manager import LoginAction
+    seed_users(nosql, 1)
+    login: LoginAction = LoginAction(nosql=nosql, csv=object()) # type: ignore
+    recovery: AuthRecovery = AuthRecovery(nosql=nosql, login=login, manager=queue_manager, offload=True)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager, recovery=recovery)
+    broker.start()
+    holder: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    other: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    try:
+        username, stale_auth = holder.acquire(timeout=1.0) # type: ignore
+        assert other.refresh(username, stale_auth, timeout=2.0) is None
+        flights: list = [gevent.spawn(holder.refresh, username, stale_auth, 5.0) for _ in range(20)]
+        gevent.joinall(flights, timeout=10.0)
+        new_auths: set = {flight.value for flight in flights}
+        assert len(new_auths) == 1 and None not in new_auths and stale_auth not in new_auths
+        assert mock_server.stats["login"] == 1
+        assert nosql.get_auth(username) in new_auths
+    finally:
+        other.close()
+        holder.close()
+        broker.stop()
+
+def test_release_checks_holder_within_one_connection(nosql, queue_manager, broker_addr):
+    # 同一连接上的两个持有方,过期回收后原持有方的归还不能释放新持有方的token
+    seed_users(nosql, 1)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager)
+    broker.start()
+    client: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    try:
+        assert client.acquire(1.0, "old") == ("u0", "token-u0")
+        pending: gevent.Greenlet = gevent.spawn(client.acquire, 5.0, "new")
+        gevent.sleep(0.2)
+        queue_manager.cast_token("u0")
+        assert pending.get(timeout=3.0) == ("u0", "token-u0")
+        assert client.release("u0", "old") is False
+        assert client.release_many(["u0"], {"u0": "old"}) == []
+        assert client.release("u0", "new") is True
+    finally:
+        client.close()
+        broker.stop()
+
+def test_timed_out_acquire_returns_late_token(nosql, queue_manager, broker_addr):
+    # 客户端取用超时后代理才交接的token被自动归还,不会一直被超时的连接占用
+    from enums.managerEnum import BrokerOpEnum
+    seed_users(nosql, 1)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager)
+    broker.start()
+    clients: list = [TokenBrokerClient(addr=broker_addr) for _ in range(3)]
+    holder, late, other = clients
+    try:
+        assert holder.acquire(timeout=1.0) == ("u0", "token-u0")
+        assert late.call(BrokerOpEnum.ACQUIRE, {"timeout": 5}, 0.2) is None
+        assert holder.release("u0")
+        assert other.acquire(timeout=3.0) == ("u0", "token-u0")
+    finally:
+        for client in clients: client.close()
+        broker.stop()
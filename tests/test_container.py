@@ -0,0 +1,54 @@
+import sys
+import time
+import pytest
+import threading
+import subprocess
+
+from pathlib import Path
+
+from utils.container import Container
+from check.import_budget import measure_import_cost, check_import_budget
+
+def test_components_are_created_once_on_first_use():
+    container: Container = Container()
+    calls: list = []
+    def slow_factory() -> object:
+        calls.append(1)
+        time.sleep(0.05)
+        return object()
+    container.register("slow", slow_factory)
+    results: list = []
+    workers: list = [threading.Thread(target=lambda: results.append(container.get("slow"))) for _ in range(8)]
+    for worker in workers: worker.start()
+    for worker in workers: worker.join(timeout=5.0)
+    # 并发首次访问只创建一次
+    assert len(calls) == 1 and len(results) == 8 and all(result is results[0] for result in results)
+    # 替换创建方法后需要reset才会重新创建
+    container.register("slow", lambda: "new")
+    assert container.get("slow") is results[0]
+    container.reset("slow")
+    assert container.get("slow") == "new"
+    with pytest.raises(KeyError): container.get("missing")
+
+def test_factories_can_depend_on_other_components():
+    container: Container = Container()
+    container.register("base", lambda: ["base"])
+    container.register("derived", lambda: container.get("base") + ["derived"])
+    assert container.get("derived") == ["base", "derived"]
+    container.reset()
+    assert container._instances == {}
+
+def test_importing_entry_modules_builds_nothing():
+    # 导入登录模块和csv模块时不创建任何组件,不读写密钥文件和缓存数据库
+    code: str = "import action.login_manager, utils.csv_div, utils.manager; from utils.container import Container; print(sorted(Container.get_instance()._instances))"
+    proc: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-c", code], cwd=str(Path(__file__).parent.parent), capture_output=True, text=True, timeout=60
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip().splitlines()[-1] == "[]"
+
+def test_import_budget_reports_project_modules():
+    costs: dict = measure_import_cost(["utils.container"])
+    assert "utils.container" in costs and costs["utils.container"][1] >= costs["utils.container"][0] >= 0
+    assert check_import_budget(["utils.container"], budget_ms=10000)
+    assert not check_import_budget(["utils.container"], budget_ms=0.001)
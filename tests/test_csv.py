@@ -0,0 +1,63 @@
+import os
+import json
+
+from conftest import build_csv, build_encry, write_signed_csv
+
+def test_iter_csv_data_streams_rows_and_skips_incomplete(tmp_path, encry):
+    csv_file: str = write_signed_csv(encry, str(tmp_path / "users.csv"), [("u0", "p0"), ("u1", ""), (" u2 ", "p2")])
+    csv_op = build_csv(encry)
+    rows = csv_op.iter_csv_data(csv_file)
+    # 逐行产出,取第一行时不需要读完整个文件
+    assert next(rows) == {"phone": "u0", "password": "p0"}
+    assert list(rows) == [{"phone": "u2", "password": "p2"}]
+    assert csv_op.get_csv_data(csv_file) == [{"phone": "u0", "password": "p0"}, {"phone": "u2", "password": "p2"}]
+    assert csv_op.validate_csv(csv_file)
+
+def test_iter_csv_data_rejects_foreign_signature(tmp_path, encry):
+    # 其他密钥签名的文件校验失败,不产出任何数据
+    csv_file: str = write_signed_csv(build_encry(), str(tmp_path / "users.csv"), [("u0", "p0")])
+    csv_op = build_csv(encry)
+    assert list(csv_op.iter_csv_data(csv_file)) == []
+    assert list(csv_op.iter_csv_data(str(tmp_path / "missing.csv"))) == []
+    assert not csv_op.validate_csv(csv_file)
+
+def _shard_rows(tmp_path, encry) -> tuple:
+    # 用户名长度不一,分片边界会落在行中间
+    files: list = []
+    for n, count in enumerate((17, 1, 30)):
+        rows: list = [(f"f{n}-u{i}" + "x" * (i % 5), f"p{i}") for i in range(count)]
+        files.append(write_signed_csv(encry, str(tmp_path / f"users{n}.csv"), rows))
+    return files, build_csv(encry)
+
+def test_byte_range_shards_cover_file_exactly(tmp_path, encry):
+    files, csv_op = _shard_rows(tmp_path, encry)
+    full: list = csv_op.get_csv_data(files[0])
+    for count in (1, 3, 4, 7, 9):
+        shards: list = [list(csv_op.iter_csv_shard(files[0], index, count)) for index in range(count)]
+        assert [row for shard in shards for row in shard] == full, count
+    assert list(csv_op.iter_csv_shard(files[0], 3, 3)) == [] and list(csv_op.iter_csv_shard(files[0], 0, 0)) == []
+    # 任意字节范围相接时同样不重不漏,切分点落在数据区中间
+    split: int = os.path.getsize(files[0]) - 100
+    assert list(csv_op.iter_csv_range(files[0], 0, split)) + list(csv_op.iter_csv_range(files[0], split, split + 1000)) == full
+    assert 0 < len(list(csv_op.iter_csv_range(files[0], split, split + 1000))) < len(full)
+
+def test_manifest_shards_cover_all_files_exactly(tmp_path, encry):
+    files, csv_op = _shard_rows(tmp_path, encry)
+    manifest: str = str(tmp_path / "manifest.json")
+    assert csv_op.generate_csv_manifest(files, manifest)
+    full: list = [row for csv_file in files for row in csv_op.get_csv_data(csv_file)]
+    for count in (1, 3, 4, 7, 9):
+        shards: list = [list(csv_op.iter_manifest_shard(manifest, index, count)) for index in range(count)]
+        assert [row for shard in shards for row in shard] == full, count
+    # 清单生成后文件被修改,分片读取拒绝使用
+    with open(files[1], "a", encoding="utf-8") as f: f.write("extra,pwd\n")
+    assert list(csv_op.iter_manifest_shard(manifest, 0, 1)) == []
+
+def test_manifest_with_bad_signature_is_rejected(tmp_path, encry):
+    files, csv_op = _shard_rows(tmp_path, encry)
+    manifest: str = str(tmp_path / "manifest.json")
+    assert csv_op.generate_csv_manifest(files, manifest)
+    with open(manifest, encoding="utf-8") as f: data: dict = json.load(f)
+    data["files"] = data["files"][:1]
+    with open(manifest, "w", encoding="utf-8") as f: json.dump(data, f)
+    assert list(csv_op.iter_manifest_shard(manifest, 0, 1)) == []
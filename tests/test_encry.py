@@ -0,0 +1,43 @@
+import os
+
+from conftest import build_csv, build_encry, write_signed_csv
+
+def test_key_objects_and_results_are_cached(monkeypatch):
+    encry = build_encry()
+    data: list = ["username", "password"]
+    signature: str = encry.generate_signature_str(data)
+    # 私钥和公钥对象只从PEM解析一次
+    assert encry._get_private_key() is encry._get_private_key()
+    assert encry.verify_signature(data, signature) and encry._get_public_key() is encry._get_public_key()
+    calls: list = []
+    uncached = encry._verify_signature_uncached
+    monkeypatch.setattr(encry, "_verify_signature_uncached", lambda d, s: calls.append(s) or uncached(d, s))
+    for _ in range(3): assert encry.verify_signature(data, signature)
+    for _ in range(2): assert not encry.verify_signature(data, "00")
+    assert calls == ["00"]
+    token: str = encry.generate_encry_str("secret")
+    assert encry.parse_encry_str(token) == "secret" and token in encry._decrypted
+    assert encry.parse_encry_str("not-a-token") is None and "not-a-token" not in encry._decrypted
+
+def test_result_caches_are_bounded(monkeypatch):
+    encry = build_encry()
+    monkeypatch.setattr(encry, "_cache_size", 2)
+    for i in range(5): encry.verify_signature([str(i)], "00")
+    assert len(encry._verified) == 2 and ("['4']", "00") in encry._verified
+
+def test_csv_validation_is_cached_until_file_changes(tmp_path, encry, monkeypatch):
+    csv_file: str = write_signed_csv(encry, str(tmp_path / "users.csv"), [("u0", "p0")])
+    csv_op = build_csv(encry)
+    core = csv_op._csv_core
+    calls: list = []
+    verify = core._verify_csv_meta
+    monkeypatch.setattr(core, "_verify_csv_meta", lambda *meta: calls.append(meta) or verify(*meta))
+    for _ in range(3): assert csv_op.validate_csv(csv_file)
+    assert list(csv_op.iter_csv_data(csv_file)) == [{"phone": "u0", "password": "p0"}]
+    assert len(calls) == 1
+    # 文件内容变化后重新校验;被替换为其他密钥签名的文件校验失败
+    write_signed_csv(build_encry(), csv_file, [("u0", "p0"), ("u1", "p1")])
+    os.utime(csv_file, ns=(0, 10**9))
+    assert not csv_op.validate_csv(csv_file)
+    assert not csv_op.validate_csv(csv_file)
+    assert len(calls) == 2
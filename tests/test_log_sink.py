@@ -0,0 +1,45 @@
+import os
+import sys
+import gzip
+import json
+import logging
+
+from utils.log_sink import StructuredLogHandler
+from enums.loglabelEnum import LogLabelEnum
+
+def _emit(handler: StructuredLogHandler, msg: str, *args, exc_info=None) -> None:
+    handler.handle(logging.LogRecord("test", logging.INFO, __file__, 0, msg, args, exc_info))
+
+def _read_segments(log_dir: str) -> list:
+    # 按分段序号顺序读取全部记录
+    names: list = sorted(os.listdir(log_dir), key=lambda name: int(name.split("-")[-1].split(".")[0]))
+    records: list = []
+    for name in names:
+        opener = gzip.open if name.endswith(".gz") else open
+        with opener(os.path.join(log_dir, name), "rb") as f: records.extend(json.loads(line) for line in f)
+    return records
+
+def test_size_rotation_compresses_closed_segments(tmp_path):
+    log_dir: str = str(tmp_path / "sink")
+    handler: StructuredLogHandler = StructuredLogHandler(log_dir, max_bytes=400, rotate_seconds=3600)
+    for i in range(10): _emit(handler, "%s 第 %s 条", LogLabelEnum.SUCCESS.value, i)
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        _emit(handler, "失败", exc_info=sys.exc_info())
+    handler.close()
+    names: list = os.listdir(log_dir)
+    assert len(names) > 1 and all(name.endswith(".jsonl.gz") for name in names)
+    records: list = _read_segments(log_dir)
+    assert [record["msg"] for record in records[:10]] == [f"{LogLabelEnum.SUCCESS.value} 第 {i} 条" for i in range(10)]
+    assert records[0]["label"] == "SUCCESS" and records[0]["level"] == "INFO"
+    assert records[-1]["label"] is None and "ValueError: boom" in records[-1]["exc"]
+
+def test_time_rotation_without_compression(tmp_path):
+    log_dir: str = str(tmp_path / "sink")
+    handler: StructuredLogHandler = StructuredLogHandler(log_dir, rotate_seconds=0, compress=False)
+    for i in range(3): _emit(handler, "msg %s", i)
+    handler.close()
+    names: list = os.listdir(log_dir)
+    assert len(names) == 3 and all(name.endswith(".jsonl") for name in names)
+    assert [record["msg"] for record in _read_segments(log_dir)] == ["msg 0", "msg 1", "msg 2"]
@@ -0,0 +1,28 @@
+from action.login_manager import LoginAction
+from conftest import seed_users, in_thread
+
+def test_retry_unknown_token_returns_none(nosql):
+    seed_users(nosql, 1)
+    assert LoginAction(nosql=nosql, csv=object()).retry("nope") is None # type: ignore
+
+def test_probe_and_relogin_against_mock_server(nosql, mock_server):
+    # 探测使用延迟解析的响应,401的响应不解析;重登后存储中的token被替换
+    from utils.request import RequestAction
+    from utils.limiter import TokenBucket
+    seed_users(nosql, 1)
+    login: LoginAction = LoginAction(nosql=nosql, csv=object()) # type: ignore
+    limiter: TokenBucket = TokenBucket(0)
+    assert in_thread(login._probe_one, "token-u0", RequestAction(), limiter) is False
+    new_auth: str | None = in_thread(login.retry, "token-u0")
+    assert new_auth and nosql.get_auth("u0") == new_auth
+    assert in_thread(login._probe_one, new_auth, RequestAction(), limiter) is True
+
+def test_request_meta_keeps_parsed_shape(mock_server):
+    # request_meta仍然返回解析后的数据,延迟解析走request_lazy
+    from utils.request import RequestAction
+    from utils.response import ResponseDiv
+    req_data = LoginAction(nosql=object(), csv=object())._build_login_req("u0", "pwd") # type: ignore
+    eager: tuple = in_thread(RequestAction().request_meta, req_data)
+    lazy: tuple = in_thread(RequestAction().request_lazy, req_data)
+    assert isinstance(eager[1], dict) and eager[1]["code"] == lazy[1].get_field("code")
+    assert isinstance(lazy[1], ResponseDiv)
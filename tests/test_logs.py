@@ -0,0 +1,88 @@
+import queue
+import logging
+import threading
+
+from utils.logs import BoundedQueueHandler, LogSampler
+from enums.logEnum import LogQueuePolicyEnum
+from enums.loglabelEnum import LogLabelEnum
+
+def _record(level: int, msg: str, *args) -> logging.LogRecord:
+    return logging.LogRecord("test", level, __file__, 0, msg, args, None)
+
+def test_drop_policy_counts_dropped_records():
+    # 队列满时丢弃INFO并按级别计数,参数在入队前合并
+    log_queue: queue.Queue = queue.Queue(maxsize=1)
+    handler: BoundedQueueHandler = BoundedQueueHandler(log_queue)
+    args: list = ["a"]
+    handler.handle(_record(logging.INFO, "first %s", args))
+    args.append("b")
+    handler.handle(_record(logging.INFO, "second"))
+    handler.handle(_record(logging.WARNING, "third"))
+    assert handler.dropped == {"INFO": 1, "WARNING": 1}
+    queued: logging.LogRecord = log_queue.get_nowait()
+    assert queued.msg == "first ['a']" and queued.args is None
+
+def test_errors_and_block_policy_wait_for_room():
+    # ERROR级别和BLOCK策略不丢弃,等待监听线程取走记录后入队
+    for policy, level in ((LogQueuePolicyEnum.DROP, logging.ERROR), (LogQueuePolicyEnum.BLOCK, logging.INFO)):
+        log_queue: queue.Queue = queue.Queue(maxsize=1)
+        handler: BoundedQueueHandler = BoundedQueueHandler(log_queue, policy)
+        handler.handle(_record(level, "first"))
+        worker: threading.Thread = threading.Thread(target=handler.handle, args=(_record(level, "second"),), daemon=True)
+        worker.start()
+        worker.join(timeout=0.2)
+        assert worker.is_alive()
+        assert log_queue.get(timeout=1.0).msg == "first"
+        worker.join(timeout=1.0)
+        assert log_queue.get(timeout=1.0).msg == "second"
+        assert handler.dropped == {}
+
+class _ListHandler(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__()
+        self.records: list = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(record)
+
+def _sampled_logger(name: str, summary_interval: float = 3600.0) -> tuple:
+    logger: logging.Logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    handler: _ListHandler = _ListHandler()
+    logger.addHandler(handler)
+    sampler: LogSampler = LogSampler(logger, summary_interval)
+    logger.addFilter(sampler)
+    return logger, sampler, handler
+
+def test_sampler_keeps_evenly_by_format_and_label():
+    # 格式字符串规则每4条保留1条,标签规则按第一个参数匹配,ERROR不采样
+    logger, sampler, handler = _sampled_logger("test_sampler_rate")
+    sampler.set_rule("hot %s", 0.25)
+    sampler.set_rule(LogLabelEnum.SUCCESS, 0.5)
+    for i in range(8): logger.info("hot %s", i)
+    for i in range(4): logger.info("%s done %s", LogLabelEnum.SUCCESS.value, i)
+    for i in range(3): logger.error("hot %s", i)
+    logger.info("cold")
+    kept: list = [record.getMessage() for record in handler.records]
+    assert [msg for msg in kept if msg.startswith("hot")] == ["hot 3", "hot 7", "hot 0", "hot 1", "hot 2"]
+    assert len([msg for msg in kept if "done" in msg]) == 2 and "cold" in kept
+    # 汇总按规则输出被抑制的条数
+    handler.records.clear()
+    sampler.flush()
+    assert sorted(record.args[1:] for record in handler.records) == [("SUCCESS", 2), ("hot %s", 6)]
+    # 取消规则后不再采样
+    sampler.set_rule("hot %s")
+    handler.records.clear()
+    for i in range(4): logger.info("hot %s", i)
+    assert len(handler.records) == 4
+
+def test_sampler_rate_limits_and_emits_periodic_summary():
+    logger, sampler, handler = _sampled_logger("test_sampler_limit", summary_interval=0.0)
+    sampler.set_rule("burst %s", rate=2)
+    for i in range(10): logger.info("burst %s", i)
+    kept: list = [record.getMessage() for record in handler.records if record.msg == "burst %s"]
+    summaries: list = [record for record in handler.records if record.msg != "burst %s"]
+    assert 1 <= len(kept) <= 3
+    # 汇总间隔为0时每条被抑制的日志之后立即汇总,合计等于被抑制的条数
+    assert sum(record.args[2] for record in summaries) == 10 - len(kept)
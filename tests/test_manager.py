@@ -0,0 +1,95 @@
+import gevent
+
+from conftest import seed_users
+
+def test_refill_keeps_tokens_released_before_sync(nosql, queue_manager):
+    # 内存中归还但尚未同步到存储的token,补充队列时不能丢失
+    seed_users(nosql, 1)
+    assert queue_manager.acquire_many(1) == [("u0", "token-u0")]
+    # 占用状态已同步到存储,归还只发生在内存中
+    gevent.sleep(0.05)
+    assert nosql.get_some_nosql_data("u0")["is_occupancy"] is True
+    queue_manager.cast_token("u0")
+    assert queue_manager.acquire_many(2) == [("u0", "token-u0")]
+
+def test_refill_appends_idle_users_without_duplicates(nosql, queue_manager):
+    seed_users(nosql, 3)
+    first: list = queue_manager.acquire_many(2)
+    gevent.sleep(0.05)
+    queue_manager.release_many([username for username, _ in first])
+    # 队列中已有2个归还的用户,补充时只追加存储中剩余的空闲用户
+    usernames: list = [username for username, _ in queue_manager.acquire_many(5)]
+    assert sorted(usernames) == ["u0", "u1", "u2"]
+
+def test_checkout_wave_uses_one_batch(nosql, queue_manager, monkeypatch):
+    # 同一批启动的用户合并为一次批量取用,不足的部分退回等待取用
+    seed_users(nosql, 4)
+    calls: list = []
+    acquire_many = queue_manager.acquire_many
+    monkeypatch.setattr(queue_manager, "acquire_many", lambda n, holders=None: calls.append(n) or acquire_many(n, holders))
+    wave: list = [gevent.spawn(queue_manager.checkout, 0.5) for _ in range(5)]
+    gevent.joinall(wave, timeout=3.0)
+    results: list = [greenlet.value for greenlet in wave]
+    assert calls == [5]
+    assert sorted(result[0] for result in results if result) == ["u0", "u1", "u2", "u3"]
+    assert results.count(None) == 1
+    # 批量归还后全部token可以再次取用
+    for result in results:
+        if result: queue_manager.checkin(result[0])
+    gevent.sleep(0.05)
+    assert len(queue_manager.acquire_many(4)) == 4
+
+def _handoff_lease(nosql, manager) -> tuple:
+    # 返回 (交接前存储中的租约, 交接后存储中的租约)
+    seed_users(nosql, 1)
+    assert manager.get_access_token(0.5) == ("u0", "token-u0")
+    gevent.sleep(0.05)
+    before: str = nosql.get_some_nosql_data("u0")["lease_expire"]
+    waiter: gevent.Greenlet = gevent.spawn(manager.get_access_token, 3.0)
+    gevent.sleep(0.05)
+    manager.cast_token("u0")
+    assert waiter.get(timeout=3.0) == ("u0", "token-u0")
+    gevent.sleep(0.05)
+    return before, nosql.get_some_nosql_data("u0")
+
+def test_handoff_persists_new_lease_in_queue_mode(nosql, queue_manager):
+    before, after = _handoff_lease(nosql, queue_manager)
+    assert after["is_occupancy"] is True and after["lease_expire"] > before
+
+def test_handoff_persists_new_lease_in_random_mode(nosql):
+    from utils.manager import StandardTokenManager
+    before, after = _handoff_lease(nosql, StandardTokenManager(nosql=nosql, checkout_mode="random"))
+    assert after["is_occupancy"] is True and after["lease_expire"] > before
+
+def test_update_keeps_lease_and_release_clears_it(nosql):
+    # 未设置租约的update不能清空占用中用户的租约,随机模式归还时租约被清空
+    from utils.manager import StandardTokenManager
+    from template.nosqlTemplate import MetaUserData
+    manager: StandardTokenManager = StandardTokenManager(nosql=nosql, checkout_mode="random")
+    seed_users(nosql, 1)
+    assert manager.get_access_token(0.5) == ("u0", "token-u0")
+    gevent.sleep(0.05)
+    lease: str = nosql.get_some_nosql_data("u0")["lease_expire"]
+    assert lease
+    nosql.update("u0", MetaUserData(password="pwd", Authorization="token-new", is_occupancy=True))
+    assert nosql.get_some_nosql_data("u0")["lease_expire"] == lease
+    manager.cast_token("u0")
+    assert nosql.get_some_nosql_data("u0")["lease_expire"] is None
+
+def test_late_checkin_after_reap_keeps_new_holder(nosql, queue_manager):
+    # 租约过期被回收并交给新持有方后,原持有方迟到的归还被忽略
+    seed_users(nosql, 1)
+    assert queue_manager.get_access_token(0.5, "old") == ("u0", "token-u0")
+    waiter: gevent.Greenlet = gevent.spawn(queue_manager.get_access_token, 3.0, "new")
+    gevent.sleep(0.05)
+    # 回收协程不带持有方标识,无条件归还
+    queue_manager.cast_token("u0")
+    assert waiter.get(timeout=3.0) == ("u0", "token-u0")
+    queue_manager.checkin("u0", "old")
+    assert not queue_manager.renew("u0", "old")
+    gevent.sleep(0.05)
+    assert queue_manager.acquire_many(1) == []
+    assert queue_manager.renew("u0", "new")
+    queue_manager.checkin("u0", "new")
+    gevent.sleep(0.05)
+    assert queue_manager.acquire_many(1) == [("u0", "token-u0")]
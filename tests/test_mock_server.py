@@ -0,0 +1,71 @@
+import random
+import gevent
+import requests
+
+from utils.mock_server import MockServer, parse_latency
+from utils.broker import TokenBroker
+from utils.broker_client import TokenBrokerClient
+from flow.auth_recovery import AuthRecovery
+from action.login_manager import LoginAction
+from conftest import seed_users, in_thread
+
+def _login(server: MockServer, phone: str = "u0") -> requests.Response:
+    return requests.post(f"{server.url}/user/login", json={"phone": phone, "password": "pwd"}, timeout=5)
+
+def _info(server: MockServer, auth: str) -> requests.Response:
+    return requests.get(f"{server.url}/user/info", headers={"Authorization": auth}, timeout=5)
+
+def test_parse_latency_is_seeded():
+    first: list = [parse_latency("exp:10", random.Random(7))() for _ in range(5)]
+    second: list = [parse_latency("exp:10", random.Random(7))() for _ in range(5)]
+    assert first == second and all(delay >= 0 for delay in first)
+    assert parse_latency("fixed:20", random.Random())() == 0.02
+    assert 0.001 <= parse_latency("uniform:1,3", random.Random())() <= 0.003
+
+def test_login_info_and_expiry():
+    server: MockServer = MockServer(host="127.0.0.1", port=0, token_ttl=1, payload_size=32)
+    server.start()
+    try:
+        body: dict = in_thread(_login, server).json()
+        assert body["code"] == 1001
+        auth: str = body["data"]["token"]
+        info = in_thread(_info, server, auth)
+        assert info.status_code == 200 and len(info.json()["data"]["payload"]) == 32
+        assert in_thread(_info, server, "forged.token.value").status_code == 401
+        gevent.sleep(2.1)
+        assert in_thread(_info, server, auth).status_code == 401
+        assert server.stats == {"login": 1, "info": 1, "unauthorized": 2, "error": 0}
+    finally:
+        server.stop()
+
+def test_error_rate_is_deterministic():
+    def run() -> list:
+        server: MockServer = MockServer(host="127.0.0.1", port=0, error_rate=0.3, seed=42)
+        server.start()
+        try:
+            return [in_thread(_login, server).status_code for _ in range(50)]
+        finally:
+            server.stop()
+    codes: list = run()
+    assert codes == run() and 0 < codes.count(500) < 50
+
+def test_expired_token_recovers_through_broker(nosql, queue_manager, broker_addr, mock_server):
+    # 端到端:经代理取用token,访问接口401后通过代理恢复认证,重试成功
+    seed_users(nosql, 2)
+    login: LoginAction = LoginAction(nosql=nosql, csv=object()) # type: ignore
+    recovery: AuthRecovery = AuthRecovery(nosql=nosql, login=login, manager=queue_manager, offload=True)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager, recovery=recovery)
+    broker.start()
+    client: TokenBrokerClient = TokenBrokerClient(addr=broker_addr)
+    try:
+        username, auth = client.acquire(timeout=1.0) # type: ignore
+        assert in_thread(_info, mock_server, auth).status_code == 401
+        new_auth: str | None = client.refresh(username, auth, timeout=5.0)
+        assert new_auth and in_thread(_info, mock_server, new_auth).status_code == 200
+        # 归还后再次取用拿到的是刷新后的token
+        assert client.release(username)
+        again: list = client.acquire_many(2)
+        assert (username, new_auth) in again
+    finally:
+        client.close()
+        broker.stop()
@@ -0,0 +1,46 @@
+import threading
+
+from template.nosqlTemplate import MetaUserData
+from conftest import build_nosql, seed_users
+
+def test_journal_replays_after_crash(tmp_path):
+    # 未压缩的日志在重新打开时回放,结果与崩溃前的内存数据一致
+    data_dir: str = str(tmp_path / "nosql")
+    nosql = build_nosql(data_dir, storage="journal", compact_records=1000)
+    seed_users(nosql, 5)
+    nosql.update_by_key("u1", "is_occupancy", True)
+    nosql.refresh_auth("u2", "token-new")
+    nosql.delete("u3")
+    assert nosql.flush()
+    reopened = build_nosql(data_dir, storage="journal", compact_records=1000)
+    assert reopened.get_all_nosql_data() == nosql.get_all_nosql_data()
+    assert reopened.get_auth("u2") == "token-new"
+    assert reopened.get_some_nosql_data("u3") is None
+
+def test_journal_sync_and_compaction_do_not_race(tmp_path):
+    # 写入线程持续追加日志,同时多个线程落盘,落盘会频繁触发压缩
+    data_dir: str = str(tmp_path / "nosql")
+    nosql = build_nosql(data_dir, storage="journal", compact_records=20, flush_interval=3600)
+    users: list = seed_users(nosql, 10)
+    failures: list = []
+    stop: threading.Event = threading.Event()
+
+    def writer() -> None:
+        i: int = 0
+        while not stop.is_set():
+            nosql.update(users[i % len(users)], MetaUserData(password="pwd", Authorization=f"token-{i}"))
+            i += 1
+
+    def syncer() -> None:
+        for _ in range(200):
+            if not nosql.flush(): failures.append(True)
+
+    threads: list = [threading.Thread(target=writer)] + [threading.Thread(target=syncer) for _ in range(3)]
+    for thread in threads: thread.start()
+    for thread in threads[1:]: thread.join()
+    stop.set()
+    threads[0].join()
+    assert nosql.flush()
+    assert not failures
+    reopened = build_nosql(data_dir, storage="journal", compact_records=20)
+    assert reopened.get_all_nosql_data() == nosql.get_all_nosql_data()
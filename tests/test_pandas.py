@@ -0,0 +1,73 @@
+import asyncio
+import threading
+
+from utils.pandas import InsertManager
+
+def test_env_stream_file_starts_stream_from_get_instance(tmp_path, monkeypatch):
+    # RESULT_STREAM_FILE开启时,通过get_instance创建实例不会死锁
+    stream_file: str = str(tmp_path / "stream.csv")
+    monkeypatch.setenv("RESULT_STREAM_FILE", stream_file)
+    monkeypatch.setattr(InsertManager, "_InsertManager__instance", None)
+    result: list = []
+    worker: threading.Thread = threading.Thread(target=lambda: result.append(asyncio.run(InsertManager.get_instance())), daemon=True)
+    worker.start()
+    worker.join(timeout=5.0)
+    assert result, "get_instance死锁"
+    manager: InsertManager = result[0]
+    manager.add_test_result_bf({"a": 1})
+    assert manager.stop_stream() == stream_file
+    assert open(stream_file, encoding="utf-8-sig").read().split() == ["a", "1"]
+
+def test_parquet_stream_survives_column_type_changes(tmp_path):
+    # 第一个分块全为空值或为整数的列,之后的分块出现字符串时写出不中断
+    pq = __import__("pytest").importorskip("pyarrow.parquet")
+    from utils.pandas import ResultStreamWriter
+    import pandas as pd
+    writer: ResultStreamWriter = ResultStreamWriter(str(tmp_path / "out.parquet"))
+    assert writer.start()
+    writer.put(pd.DataFrame({"msg": [None, None], "code": [1, 2]}))
+    writer.put(pd.DataFrame({"msg": ["ok", None], "code": ["3", "bad"]}))
+    assert writer.close()
+    table = pq.read_table(str(tmp_path / "out.parquet"))
+    assert table.column("msg").to_pylist() == [None, None, "ok", None]
+    assert table.column("code").to_pylist() == [1, 2, 3, None]
+
+def test_columnar_buffer_pads_missing_columns_and_seals_chunks(tmp_path):
+    # 新出现的列在之前的行补空值,缺少的列在本行补空值,每满chunk_size行生成一个分块
+    manager: InsertManager = InsertManager(chunk_size=2)
+    manager.add_test_result_bf({"a": 1})
+    manager.add_test_result_bf({"a": 2, "b": "x"})
+    manager.add_test_result_bf({"b": "y"})
+    manager.add_test_result_bf("bad") # type: ignore
+    assert len(manager._chunks) == 1 and manager._row_count == 1
+    df = manager._test_result_bf
+    assert df["a"].tolist()[:2] == [1, 2] and df["b"].tolist() == [None, "x", "y"]
+    assert len(manager._chunks) == 1
+    manager.save_test_result(str(tmp_path / "out.csv"))
+    assert open(tmp_path / "out.csv", encoding="utf-8-sig").read().split() == ["a,b", "1.0,", "2.0,x", ",y"]
+    manager.del_test_result()
+    assert manager.is_test_result_bf_empty
+
+def test_csv_stream_writes_chunks_and_copies_on_save(tmp_path):
+    # 开启前已缓存的结果先写出,分块交给写出线程;保存为另一个csv时直接复制流式文件
+    manager: InsertManager = InsertManager(chunk_size=2)
+    manager.add_test_result_bf({"a": 0})
+    stream_file: str = str(tmp_path / "stream.csv")
+    assert manager.start_stream(stream_file)
+    assert not manager.start_stream(str(tmp_path / "other.csv"))
+    for i in range(1, 5): manager.add_test_result_bf({"a": i})
+    # 满分块后交给写出线程,内存中不保留
+    assert manager.is_test_result_bf_empty
+    manager.save_test_result(str(tmp_path / "saved.csv"))
+    assert manager._stream is None
+    expected: list = ["a"] + [str(i) for i in range(5)]
+    assert open(stream_file, encoding="utf-8-sig").read().split() == expected
+    assert open(tmp_path / "saved.csv", encoding="utf-8-sig").read().split() == expected
+
+def test_parquet_stream_copies_to_csv_by_row_group(tmp_path):
+    __import__("pytest").importorskip("pyarrow.parquet")
+    manager: InsertManager = InsertManager(chunk_size=2)
+    assert manager.start_stream(str(tmp_path / "stream.parquet"))
+    for i in range(5): manager.add_test_result_bf({"a": i, "b": f"r{i}"})
+    manager.save_test_result(str(tmp_path / "saved.csv"))
+    assert open(tmp_path / "saved.csv", encoding="utf-8-sig").read().split() == ["a,b"] + [f"{i},r{i}" for i in range(5)]
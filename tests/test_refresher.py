@@ -0,0 +1,82 @@
+import os
+import sys
+import subprocess
+
+from pathlib import Path
+from action.token_refresher import TokenRefresher
+from action.login_manager import LoginAction
+from utils.broker import TokenBroker
+
+def _refresher(nosql) -> TokenRefresher:
+    return TokenRefresher(nosql=nosql, login=LoginAction(nosql=nosql, csv=object()), scan_interval=60) # type: ignore
+
+def test_only_one_refresher_runs_per_store(nosql, tmp_path, monkeypatch):
+    # sqlite存储在同一数据目录只有抢到文件锁的刷新器运行,停止后其他进程可以接管
+    monkeypatch.setenv("NOSQL_DATA_DIR", str(tmp_path / "nosql"))
+    monkeypatch.setenv("NOSQL_STORAGE", "sqlite")
+    leader: TokenRefresher = _refresher(nosql)
+    follower: TokenRefresher = _refresher(nosql)
+    try:
+        assert leader.start() is True
+        assert follower.start() is False and not follower.is_running
+        leader.stop()
+        assert follower.start() is True
+    finally:
+        leader.stop()
+        follower.stop()
+
+def test_broker_owns_the_refresher(nosql, queue_manager, broker_addr, tmp_path, monkeypatch):
+    monkeypatch.setenv("NOSQL_DATA_DIR", str(tmp_path / "nosql"))
+    refresher: TokenRefresher = _refresher(nosql)
+    broker: TokenBroker = TokenBroker(addr=broker_addr, manager=queue_manager, refresher=refresher)
+    broker.start()
+    try:
+        assert refresher.is_running
+    finally:
+        broker.stop()
+    assert not refresher.is_running
+
+def test_json_store_does_not_elect(nosql, tmp_path, monkeypatch):
+    # json存储每个进程各自持有数据,不抢占文件锁
+    monkeypatch.setenv("NOSQL_DATA_DIR", str(tmp_path / "nosql"))
+    monkeypatch.setenv("NOSQL_STORAGE", "json")
+    first: TokenRefresher = _refresher(nosql)
+    second: TokenRefresher = _refresher(nosql)
+    try:
+        assert first.start() is True and second.start() is True
+    finally:
+        first.stop()
+        second.stop()
+
+_HOOK_SCRIPT: str = '''
+import os, sys
+from types import SimpleNamespace
+from locust.runners import WorkerRunner, LocalRunner
+from utils.manager import StandardTokenManager
+from action.token_refresher import TokenRefresher
+from flow.user import _start_token_refresher
+
+started: list = []
+class FakeRefresher:
+    def start(self) -> bool:
+        started.append(os.environ["NOSQL_STORAGE"])
+        return True
+
+StandardTokenManager.get_instance = staticmethod(lambda: SimpleNamespace(is_broker=False))
+TokenRefresher.get_instance = staticmethod(lambda: FakeRefresher())
+worker = SimpleNamespace(runner=WorkerRunner.__new__(WorkerRunner))
+local = SimpleNamespace(runner=LocalRunner.__new__(LocalRunner))
+for storage in ("json", "journal", "sqlite"):
+    os.environ["NOSQL_STORAGE"] = storage
+    _start_token_refresher(worker)
+os.environ["NOSQL_STORAGE"] = "json"
+_start_token_refresher(local)
+print(",".join(started))
+'''
+
+def test_locust_hook_refuses_json_store_on_workers(tmp_path):
+    # locust导入时打猴子补丁,需要在独立进程中最先导入
+    env: dict = {**os.environ, "TOKEN_REFRESH": "1", "PYTHONPATH": str(Path(__file__).parent.parent)}
+    res = subprocess.run([sys.executable, "-c", _HOOK_SCRIPT], cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+    assert res.returncode == 0, res.stderr
+    assert res.stdout.strip().splitlines()[-1] == "sqlite,json"
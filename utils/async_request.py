@@ -0,0 +1,134 @@
+import asyncio
+
+from typing import Union
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+from utils.logs import ExceptionLog
+from utils.response import ResponseDiv
+from utils.file import get_env_val
+from utils.request import HttpClientPool
+from enums.loglabelEnum import LogLabelEnum
+from template.httpTemplate import StandardReqDataTemplate
+
+try:
+    import aiohttp
+except ImportError: # aiohttp为可选依赖,未安装时退化为线程池执行同步请求
+    aiohttp = None
+
+class AsyncRequestAction:
+    '''
+    RequestAction的asyncio版本,返回值与request_meta相同,可以直接交给standard_normal_check校验
+    1.安装了aiohttp时使用aiohttp连接池,单进程可保持数千个在途请求
+    2.未安装时在线程中执行共享连接池的同步请求
+    3.信号量限制在途请求数,超时的请求会被取消
+    连接池和信号量绑定创建时所在的事件循环,需要在同一个事件循环中使用
+    '''
+    def __init__(
+        self,
+        e: ExceptionLog | None = None,
+        concurrency: int | None = None,
+        timeout: float | None = None
+    ) -> None:
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._concurrency: int = int(concurrency or get_env_val("ASYNC_HTTP_CONCURRENCY") or 1000)
+        self._timeout: float = float(timeout or get_env_val("HTTP_TIMEOUT") or 30)
+        self._semaphore: asyncio.Semaphore | None = None
+        self._session = None
+
+    async def __aenter__(self) -> 'AsyncRequestAction':
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None: self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._semaphore
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector( # type: ignore
+                limit=self._concurrency,
+                limit_per_host=self._concurrency,
+                keepalive_timeout=30
+            )
+            self._session = aiohttp.ClientSession(connector=connector) # type: ignore
+        return self._session
+
+    async def _aiohttp_request(self, data: StandardReqDataTemplate) -> Response:
+        async with self._get_session().request(
+            method=data.method,
+            url=data.url,
+            params=data.params,
+            headers=data.headers,
+            json=data.body
+        ) as a_resp:
+            body: bytes = await a_resp.read()
+            # 转换为requests.Response,保证下游校验逻辑不变
+            resp: Response = Response()
+            resp.status_code = a_resp.status
+            resp.reason = a_resp.reason # type: ignore
+            resp.headers = CaseInsensitiveDict(a_resp.headers)
+            resp.url = str(a_resp.url)
+            resp.encoding = a_resp.get_encoding() if body else "utf-8"
+            resp._content = body
+            return resp
+
+    def _thread_request(self, data: StandardReqDataTemplate) -> Response:
+        return HttpClientPool.get_instance().session.request(
+            method=data.method,
+            url=data.url,
+            params=data.params,
+            headers=data.headers,
+            json=data.body,
+            timeout=self._timeout
+        )
+
+    async def request_meta(
+        self,
+        data: StandardReqDataTemplate
+    ) -> tuple[Response, Union[dict, str, None], StandardReqDataTemplate] | None:
+        '''
+        1.仅支持json传参
+        '''
+        resp: tuple | None = await self.request_lazy(data)
+        if resp is None: return
+        return resp[0], resp[1].get_serialize_client_resp(), resp[2]
+
+    async def request_lazy(
+        self,
+        data: StandardReqDataTemplate
+    ) -> tuple[Response, ResponseDiv, StandardReqDataTemplate] | None:
+        '''
+        与request_meta相同,但响应体不在这里解析,返回ResponseDiv由调用方按需解析
+        '''
+        if not isinstance(data, StandardReqDataTemplate):
+            self._e.error("%s 请求数据类型错误,需要的类型为: %s, 实际的类型为: %s", LogLabelEnum.ERROR.value, "StandardReqDataTemplate", type(data))
+            return
+        async with self._get_semaphore():
+            try:
+                async with asyncio.timeout(self._timeout):
+                    if aiohttp is not None: resp: Response = await self._aiohttp_request(data)
+                    else: resp: Response = await asyncio.to_thread(self._thread_request, data)
+            except TimeoutError:
+                self._e.error("%s 请求超时已取消,超时时间: %ss, 请求地址: %s", LogLabelEnum.ERROR.value, self._timeout, data.url)
+                return
+        if resp.encoding is None: resp.encoding = "utf-8"
+        return resp, ResponseDiv(resp), data
+
+    async def request_many(self, datas: list) -> list:
+        # 并发发起一批请求,结果顺序与传入顺序一致,单个请求异常时对应位置为None
+        results: list = await asyncio.gather(*(self.request_meta(data) for data in datas), return_exceptions=True)
+        res: list = []
+        for data, result in zip(datas, results):
+            if isinstance(result, BaseException):
+                if isinstance(result, Exception): self._e.handle_exception(result)
+                self._e.error("%s 请求异常,请求地址: %s, 异常原因: %s", LogLabelEnum.ERROR.value, data.url, result)
+                res.append(None)
+            else:
+                res.append(result)
+        return res
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed: await self._session.close()
@@ -0,0 +1,212 @@
+import os
+import json
+import socket
+import itertools
+import gevent
+import gevent.lock
+import gevent.socket
+
+from gevent.lock import Semaphore
+from gevent.server import StreamServer
+from typing import Any, TYPE_CHECKING
+
+from enums.managerEnum import TokenCheckoutEnum, BrokerOpEnum
+from enums.loglabelEnum import LogLabelEnum
+from utils.logs import ExceptionLog
+from utils.file import get_env_val
+from utils.manager import StandardTokenManager
+from utils.broker_client import parse_broker_addr
+
+if TYPE_CHECKING:
+    from flow.auth_recovery import AuthRecovery
+    from action.token_refresher import TokenRefresher
+
+class _BrokerSession:
+    # 一条客户端连接的状态
+    def __init__(self, session_id: int, sock: gevent.socket.socket) -> None:
+        self.session_id: int = session_id
+        self.sock: gevent.socket.socket = sock
+        self.held: set = set()
+        self.closed: bool = False
+        self.write_lock: Semaphore = gevent.lock.Semaphore()
+
+class TokenBroker:
+    '''
+    本机token代理,独占租约状态,同一台机器上的所有locust worker通过它取用/归还token
+    1.监听Unix域套接字(unix:/path)或本机TCP(host:port),协议为按行分隔的json
+    2.同一连接上的请求各自在协程中处理,响应按id返回,客户端可以批量发送请求
+    3.代理记录每个token的持有连接,只有持有方可以归还和续约;连接断开时归还它持有的全部token.
+      请求带持有方标识时再按标识校验,同一连接上的协程之间也不会误还对方的token
+    4.内部使用queue模式的StandardTokenManager,只有代理进程读写缓存数据库
+    5.worker的认证恢复转发到代理,由代理单飞重新登录并写入存储,之后取用的都是新token
+    6.开启TOKEN_REFRESH时token主动刷新只在代理进程中运行,worker不再各自刷新
+    '''
+    def __init__(
+        self,
+        addr: str | None = None,
+        e: ExceptionLog | None = None,
+        manager: StandardTokenManager | None = None,
+        recovery: 'AuthRecovery | None' = None,
+        refresher: 'TokenRefresher | None' = None
+    ) -> None:
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._addr: str = addr or get_env_val("TOKEN_BROKER_ADDR") or "127.0.0.1:7070"
+        if manager is None:
+            mode: TokenCheckoutEnum = TokenCheckoutEnum.get_mode(get_env_val("TOKEN_BROKER_MODE") or TokenCheckoutEnum.QUEUE.value)
+            # 代理自身不能再以代理模式运行
+            if mode == TokenCheckoutEnum.BROKER: mode = TokenCheckoutEnum.QUEUE
+            manager = StandardTokenManager(e=self._e, checkout_mode=mode.value)
+        self._manager: StandardTokenManager = manager
+        self._owners: dict = {} # 用户名 -> 持有连接的id
+        self._ids: itertools.count = itertools.count(1)
+        self._server: StreamServer | None = None
+        self._recovery = recovery
+        self._refresher = refresher
+
+    @property
+    def addr(self) -> str:
+        return self._addr
+
+    def _listen(self) -> gevent.socket.socket:
+        family, address = parse_broker_addr(self._addr)
+        listener: gevent.socket.socket = gevent.socket.socket(family, socket.SOCK_STREAM)
+        if family == socket.AF_UNIX:
+            # 清理上一次运行遗留的套接字文件
+            if os.path.exists(address): os.remove(address)
+        else:
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind(address)
+        listener.listen(1024)
+        return listener
+
+    def start(self) -> None:
+        self._server = StreamServer(self._listen(), self._handle)
+        self._server.start()
+        self._e.info("%s token代理已启动,监听地址: %s", LogLabelEnum.GREENLIGHT.value, self._addr)
+        self._start_refresher()
+
+    def _start_refresher(self) -> None:
+        if self._refresher is None:
+            from action.token_refresher import TokenRefresher
+            if not TokenRefresher.is_enabled(): return
+            self._refresher = TokenRefresher.get_instance()
+        self._refresher.start()
+
+    def serve_forever(self) -> None:
+        if self._server is None: self.start()
+        self._server.serve_forever() # type: ignore
+
+    def stop(self) -> None:
+        if self._server is None: return
+        self._server.stop()
+        self._server = None
+        if self._refresher is not None: self._refresher.stop()
+        family, address = parse_broker_addr(self._addr)
+        if family == socket.AF_UNIX and os.path.exists(address): os.remove(address)
+        self._e.info("%s token代理已停止: %s", LogLabelEnum.REDLIGHT.value, self._addr)
+
+    def _handle(self, sock: gevent.socket.socket, address: Any) -> None:
+        session: _BrokerSession = _BrokerSession(next(self._ids), sock)
+        rfile = sock.makefile("rb")
+        try:
+            for line in rfile:
+                try:
+                    req: dict = json.loads(line)
+                except ValueError:
+                    self._e.error("%s token代理收到无法解析的请求: %s", LogLabelEnum.ERROR.value, line[:200])
+                    continue
+                gevent.spawn(self._dispatch, session, req)
+        except OSError as err:
+            self._e.handle_exception(err)
+        finally:
+            rfile.close()
+            self._close_session(session)
+
+    def _close_session(self, session: _BrokerSession) -> None:
+        session.closed = True
+        released: list = [username for username in session.held if self._owners.get(username) == session.session_id]
+        for username in released:
+            self._owners.pop(username, None)
+            self._manager.cast_token(username)
+        session.held.clear()
+        if released: self._e.info("%s token代理连接断开,归还其持有的token数: %s", LogLabelEnum.RETRY.value, len(released))
+
+    def _get_recovery(self) -> 'AuthRecovery':
+        # 第一次刷新时才创建,代理进程未打猴子补丁,登录放到线程池执行
+        if self._recovery is None:
+            from flow.auth_recovery import AuthRecovery
+            self._recovery = AuthRecovery(e=self._e, manager=self._manager, offload=True)
+        return self._recovery
+
+    def _own(self, session: _BrokerSession, username: str) -> None:
+        if session.closed:
+            # 等待期间连接已断开,取到的token直接归还
+            self._manager.cast_token(username)
+            return
+        self._owners[username] = session.session_id
+        session.held.add(username)
+
+    def _disown(self, session: _BrokerSession, username: str) -> bool:
+        if self._owners.get(username) != session.session_id:
+            self._e.info("%s 用户: %s 不属于当前连接,拒绝操作", LogLabelEnum.WARNING.value, username)
+            return False
+        self._owners.pop(username, None)
+        session.held.discard(username)
+        return True
+
+    def _execute(self, session: _BrokerSession, op: BrokerOpEnum | None, args: dict) -> Any:
+        match op:
+            case BrokerOpEnum.ACQUIRE:
+                result: tuple | None = self._manager.get_access_token(float(args.get("timeout", 10.0)), args.get("holder"))
+                if result is None: return
+                self._own(session, result[0])
+                return list(result)
+            case BrokerOpEnum.RELEASE:
+                username: str = args.get("username", "")
+                # 先校验持有方标识,过期被回收的持有方不能解除新持有方的占用
+                if not self._manager.holds(username, args.get("holder")) or not self._disown(session, username): return False
+                self._manager.cast_token(username, args.get("holder"))
+                return True
+            case BrokerOpEnum.RENEW:
+                username: str = args.get("username", "")
+                if self._owners.get(username) != session.session_id: return False
+                return self._manager.renew(username, args.get("holder"))
+            case BrokerOpEnum.ACQUIRE_MANY:
+                results: list = self._manager.acquire_many(int(args.get("n", 0)), args.get("holders"))
+                for username, _ in results: self._own(session, username)
+                return [list(item) for item in results]
+            case BrokerOpEnum.RELEASE_MANY:
+                holders: dict = args.get("holders") or {}
+                owned: list = [
+                    username for username in args.get("usernames", [])
+                    if self._manager.holds(username, holders.get(username)) and self._disown(session, username)
+                ]
+                return self._manager.release_many(owned, holders or None)
+            case BrokerOpEnum.REFRESH:
+                username: str = args.get("username", "")
+                if self._owners.get(username) != session.session_id:
+                    self._e.info("%s 用户: %s 不属于当前连接,拒绝刷新", LogLabelEnum.WARNING.value, username)
+                    return
+                return self._get_recovery().recover(username, args.get("stale_auth", ""))
+            case BrokerOpEnum.LEASE_TTL:
+                return self._manager.lease_ttl
+            case BrokerOpEnum.PING:
+                return "pong"
+            case _:
+                raise ValueError("不支持的操作")
+
+    def _dispatch(self, session: _BrokerSession, req: dict) -> None:
+        try:
+            resp: dict = {"id": req.get("id"), "ok": True, "result": self._execute(session, BrokerOpEnum.get_op(req.get("op", "")), req.get("args") or {})}
+        except Exception as err:
+            self._e.handle_exception(err)
+            resp: dict = {"id": req.get("id"), "ok": False, "error": str(err)}
+        if session.closed: return
+        try:
+            with session.write_lock: session.sock.sendall((json.dumps(resp, ensure_ascii=False) + "\n").encode("utf-8"))
+        except OSError as err:
+            self._e.handle_exception(err)
+
+# 在项目根目录执行: python -m utils.broker
+if __name__ == "__main__":
+    TokenBroker().serve_forever()
@@ -0,0 +1,187 @@
+import json
+import time
+import socket
+import functools
+import itertools
+import gevent
+import gevent.lock
+import gevent.socket
+
+from gevent.lock import Semaphore
+from gevent.event import AsyncResult
+from typing import Any
+
+from enums.managerEnum import BrokerOpEnum
+from enums.loglabelEnum import LogLabelEnum
+from utils.logs import ExceptionLog
+from utils.file import get_env_val
+
+def parse_broker_addr(addr: str) -> tuple:
+    '''
+    unix:/path/to.sock - Unix域套接字
+    host:port - 本机TCP
+    '''
+    if addr.startswith("unix:"): return socket.AF_UNIX, addr[len("unix:"):]
+    host, _, port = addr.rpartition(":")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+class TokenBrokerClient:
+    '''
+    token代理客户端,进程内所有协程共用一条连接
+    1.请求按行发送json,带自增id,读取协程按id把响应交给对应的等待者,多个请求可以同时在途
+    2.pipeline把一批请求合并为一次发送,响应按请求顺序返回
+    3.连接断开时在途请求全部失败,下一次请求自动重连
+    4.取用请求超时后仍等待代理的响应,迟到的响应中取到的token直接归还,不会一直被本连接占用
+    '''
+    def __init__(
+        self,
+        addr: str | None = None,
+        e: ExceptionLog | None = None,
+        timeout: float | None = None
+    ) -> None:
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._addr: str = addr or get_env_val("TOKEN_BROKER_ADDR") or "127.0.0.1:7070"
+        self._timeout: float = float(timeout or get_env_val("TOKEN_BROKER_TIMEOUT") or 10)
+        self._ids: itertools.count = itertools.count(1)
+        self._pending: dict = {}
+        self._sock: gevent.socket.socket | None = None
+        self._reader: gevent.Greenlet | None = None
+        self._connect_lock: Semaphore = gevent.lock.Semaphore()
+        self._send_lock: Semaphore = gevent.lock.Semaphore()
+
+    @property
+    def addr(self) -> str:
+        return self._addr
+
+    def _ensure_connected(self) -> gevent.socket.socket:
+        with self._connect_lock:
+            if self._sock is not None: return self._sock
+            family, address = parse_broker_addr(self._addr)
+            sock: gevent.socket.socket = gevent.socket.socket(family, socket.SOCK_STREAM)
+            sock.connect(address)
+            if family == socket.AF_INET: sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._reader = gevent.spawn(self._read_loop, sock)
+            self._e.info("%s 已连接token代理: %s", LogLabelEnum.GREENLIGHT.value, self._addr)
+            return sock
+
+    def _read_loop(self, sock: gevent.socket.socket) -> None:
+        rfile = sock.makefile("rb")
+        try:
+            for line in rfile:
+                resp: dict = json.loads(line)
+                waiter: AsyncResult | None = self._pending.pop(resp.get("id"), None)
+                if waiter is not None: waiter.set(resp)
+        except (OSError, ValueError) as err:
+            self._e.handle_exception(err)
+        finally:
+            rfile.close()
+            self._disconnect(sock)
+
+    def _disconnect(self, sock: gevent.socket.socket, is_closed: bool = False) -> None:
+        if self._sock is not sock: return
+        self._sock = None
+        try:
+            # 读取协程持有的makefile会保持文件描述符打开,只调用close时代理收不到EOF,
+            # 先shutdown让代理立即感知断开并归还本连接持有的token,读取协程随之退出并关闭rfile
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+        pending: dict = self._pending
+        self._pending = {}
+        for waiter in pending.values(): waiter.set({"ok": False, "error": "连接已断开"})
+        if not is_closed: self._e.error("%s token代理连接已断开: %s, 失败的在途请求数: %s", LogLabelEnum.REDLIGHT.value, self._addr, len(pending))
+
+    def pipeline(self, calls: list, timeout: float | None = None) -> list:
+        '''
+        calls为 [(BrokerOpEnum, 参数字典), ...],一次发送,返回与calls顺序一致的结果,失败的请求结果为None
+        '''
+        if not calls: return []
+        try:
+            sock: gevent.socket.socket = self._ensure_connected()
+        except OSError as err:
+            self._e.handle_exception(err)
+            self._e.error("%s 连接token代理失败: %s", LogLabelEnum.ERROR.value, self._addr)
+            return [None] * len(calls)
+        waiters: list = []
+        lines: list = []
+        for op, args in calls:
+            req_id: int = next(self._ids)
+            waiter: AsyncResult = AsyncResult()
+            self._pending[req_id] = waiter
+            waiters.append((req_id, op, args, waiter))
+            lines.append(json.dumps({"id": req_id, "op": op.value, "args": args or {}}, ensure_ascii=False))
+        try:
+            with self._send_lock: sock.sendall(("\n".join(lines) + "\n").encode("utf-8"))
+        except OSError as err:
+            self._e.handle_exception(err)
+            self._disconnect(sock)
+        deadline: float = time.monotonic() + (timeout or self._timeout)
+        res: list = []
+        for req_id, op, args, waiter in waiters:
+            waiter.wait(timeout=max(deadline - time.monotonic(), 0))
+            resp: dict | None = waiter.get() if waiter.ready() else None
+            if resp is None:
+                # 代理端仍可能取到token,保留等待者,响应到达后归还
+                if op in (BrokerOpEnum.ACQUIRE, BrokerOpEnum.ACQUIRE_MANY): waiter.rawlink(functools.partial(self._on_late_reply, op, args))
+                else: self._pending.pop(req_id, None)
+            if resp is None or not resp.get("ok"):
+                self._e.error("%s token代理请求失败: %s", LogLabelEnum.ERROR.value, resp.get("error") if resp else "请求超时")
+                res.append(None)
+            else:
+                res.append(resp.get("result"))
+        return res
+
+    def _on_late_reply(self, op: BrokerOpEnum, args: dict | None, waiter: AsyncResult) -> None:
+        # rawlink回调在hub中执行,不能阻塞,归还放到新协程中
+        gevent.spawn(self._release_late, op, args, waiter.get())
+
+    def _release_late(self, op: BrokerOpEnum, args: dict | None, resp: dict) -> None:
+        if not resp.get("ok") or not resp.get("result"): return
+        args = args or {}
+        if op == BrokerOpEnum.ACQUIRE:
+            usernames: list = [resp["result"][0]]
+            holders: dict = {usernames[0]: args.get("holder")} if args.get("holder") is not None else {}
+        else:
+            usernames: list = [item[0] for item in resp["result"]]
+            holders: dict = {username: holder for username, holder in zip(usernames, args.get("holders") or []) if holder is not None}
+        released: list = self.release_many(usernames, holders or None)
+        self._e.error("%s 取用请求超时后收到代理响应,归还迟到的token: %s", LogLabelEnum.WARNING.value, released)
+
+    def call(self, op: BrokerOpEnum, args: dict | None = None, timeout: float | None = None) -> Any:
+        return self.pipeline([(op, args)], timeout)[0]
+
+    def acquire(self, timeout: float = 10.0, holder: str | None = None) -> tuple | None:
+        # 代理端最多等待timeout秒,客户端多等一秒用于网络往返
+        res: list | None = self.call(BrokerOpEnum.ACQUIRE, {"timeout": timeout, "holder": holder}, timeout + 1.0)
+        return tuple(res) if res else None
+
+    def release(self, username: str, holder: str | None = None) -> bool:
+        return bool(self.call(BrokerOpEnum.RELEASE, {"username": username, "holder": holder}))
+
+    def renew(self, username: str, holder: str | None = None) -> bool:
+        return bool(self.call(BrokerOpEnum.RENEW, {"username": username, "holder": holder}))
+
+    def acquire_many(self, n: int, holders: list | None = None) -> list:
+        return [tuple(item) for item in self.call(BrokerOpEnum.ACQUIRE_MANY, {"n": n, "holders": holders}) or []]
+
+    def release_many(self, usernames: list, holders: dict | None = None) -> list:
+        return self.call(BrokerOpEnum.RELEASE_MANY, {"usernames": list(usernames), "holders": holders}) or []
+
+    def refresh(self, username: str, stale_auth: str, timeout: float = 30.0) -> str | None:
+        # 代理端单飞重新登录,返回可用的新token
+        return self.call(BrokerOpEnum.REFRESH, {"username": username, "stale_auth": stale_auth}, timeout + 1.0)
+
+    def lease_ttl(self) -> float | None:
+        return self.call(BrokerOpEnum.LEASE_TTL)
+
+    def close(self) -> None:
+        if self._sock is not None: self._disconnect(self._sock, is_closed=True)
+        # 等待读取协程读到EOF退出,rfile随之关闭,连接占用的文件描述符全部释放
+        if self._reader is not None:
+            self._reader.join(timeout=1.0)
+            self._reader = None
@@ -0,0 +1,104 @@
+import threading
+
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from utils.logs import ExceptionLog
+    from utils.encry import UnitEncry
+    from utils.csv_div import CsvOperator
+    from utils.nosql import NosqlOperator
+    from utils.manager import StandardTokenManager
+
+def _create_log() -> 'ExceptionLog':
+    from utils.logs import ExceptionLog
+    return ExceptionLog.get_instance()
+
+def _create_encry() -> 'UnitEncry':
+    from utils.encry import UnitEncry
+    return UnitEncry()
+
+def _create_csv() -> 'CsvOperator':
+    from utils.csv_div import CsvOperator
+    return CsvOperator.create()
+
+def _create_nosql() -> 'NosqlOperator':
+    from utils.nosql import NosqlOperator
+    return NosqlOperator.create()
+
+def _create_token_manager() -> 'StandardTokenManager':
+    from utils.manager import StandardTokenManager
+    return StandardTokenManager.get_instance()
+
+class Container:
+    '''
+    懒加载依赖容器
+    1.组件在第一次使用时才创建,导入模块时不再读写密钥文件、初始化日志和缓存数据库
+    2.每个组件只创建一次,并发首次访问时只有一个线程执行创建
+    3.register可以替换组件的创建方法,已创建的组件需要reset后才会重新创建
+    '''
+    __instance: Optional['Container'] = None
+    __lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def get_instance() -> 'Container':
+        if Container.__instance: return Container.__instance
+        else:
+            with Container.__lock:
+                if not Container.__instance: Container.__instance = Container()
+            return Container.__instance
+
+    def __init__(self) -> None:
+        if hasattr(self, "__initialized") and self.__initialized:
+            return
+        else:
+            self._providers: dict = {
+                "log": _create_log,
+                "encry": _create_encry,
+                "csv": _create_csv,
+                "nosql": _create_nosql,
+                "token_manager": _create_token_manager
+            }
+            self._instances: dict = {}
+            # 组件创建时可能依赖其他组件,使用可重入锁
+            self._lock: threading.RLock = threading.RLock()
+            self.__initialized: bool = True
+
+    def register(self, name: str, factory: Callable[[], Any]) -> None:
+        with self._lock: self._providers[name] = factory
+
+    def reset(self, name: str | None = None) -> None:
+        with self._lock:
+            if name is None: self._instances.clear()
+            else: self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        instance: Any = self._instances.get(name)
+        if instance is not None: return instance
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is None:
+                factory: Callable[[], Any] | None = self._providers.get(name)
+                if factory is None: raise KeyError(f"未注册的组件: {name}")
+                instance = factory()
+                self._instances[name] = instance
+            return instance
+
+    @property
+    def log(self) -> 'ExceptionLog':
+        return self.get("log")
+
+    @property
+    def encry(self) -> 'UnitEncry':
+        return self.get("encry")
+
+    @property
+    def csv(self) -> 'CsvOperator':
+        return self.get("csv")
+
+    @property
+    def nosql(self) -> 'NosqlOperator':
+        return self.get("nosql")
+
+    @property
+    def token_manager(self) -> 'StandardTokenManager':
+        return self.get("token_manager")
@@ -1,13 +1,15 @@
 import os
 import csv
-import copy
+import json
+import hashlib
 import threading
 
 from pathlib import Path
-from typing import Optional, Sequence
+from typing import Iterator, Optional
 
 from utils.encry import UnitEncry
 from utils.logs import ExceptionLog
+from utils.container import Container
 from enums.csvEnum import CsvMetaEnum, CsvHeaderEnum
 from enums.loglabelEnum import LogLabelEnum
 from template.csvTemplate import CsvData
@@ -34,13 +36,15 @@ class CsvCore:
 
     def __init__(
         self,
-        encry: UnitEncry = UnitEncry()
+        encry: UnitEncry | None = None
     ) -> None:
         if hasattr(self, "__initialized") and self.__initialized:
             return
         else:
             self._e: ExceptionLog = ExceptionLog.get_instance()
-            self._key_manager: UnitEncry = encry
+            self._key_manager: UnitEncry = encry or Container.get_instance().encry
+            # 校验结果缓存: 文件绝对路径 -> (文件大小, 修改时间, 元数据哈希, 校验结果)
+            self._validated: dict = {}
             self.__initialized: bool = True
 
     @property
@@ -80,40 +84,67 @@ class CsvCore:
             self._e.error("%s 写入csv元数据失败", LogLabelEnum.ERROR.value)
             return
 
+    def _read_csv_meta(self, f) -> tuple | None:
+        '''
+        从已打开的文件中只读取前三行: 签名、加密公钥、表头,读取后文件位置停在第一行数据
+        '''
+        meta_sig: str = ""
+        meta_pub: str = ""
+        meta_header: list = []
+        for row_count in range(1, 4):
+            line: str = f.readline()
+            if not line:
+                self._e.error("%s csv文件格式错误", LogLabelEnum.UNSPORTED.value)
+                return
+            row: list = next(csv.reader([line]), [])
+            if not row: continue
+            if row[0].startswith(f"#{CsvMetaEnum.SIG.value}"): meta_sig = row[0].split(":")[1].strip()
+            elif row[0].startswith(f"#{CsvMetaEnum.PUB_ENCRY_KEY.value}"): meta_pub = row[0].split(":")[1].strip()
+            elif row[0].startswith("#"): continue
+            elif row_count == 3: meta_header = row
+        if not meta_sig or not meta_pub or not meta_header:
+            self._e.error("%s csv文件错误", LogLabelEnum.UNSPORTED.value)
+            return
+        return meta_sig, meta_pub, meta_header
+
+    def _verify_csv_meta(self, meta_sig: str, meta_pub: str, meta_header: list) -> bool:
+        # 验证公钥是否相同
+        if self._key_manager.parse_encry_str(meta_pub) != self._key_manager.rsa_pub_key:
+            self._e.error("%s csv文件公钥错误", LogLabelEnum.ERROR.value)
+            return False
+        # 验证签名
+        if not self._key_manager.verify_signature(meta_header, meta_sig):
+            self._e.error("%s csv文件签名错误", LogLabelEnum.ERROR.value)
+            return False
+        return True
+
+    def _check_csv_meta(self, csv_file: str, f) -> list | None:
+        '''
+        校验已打开文件的前三行,通过时返回表头
+        文件大小、修改时间和元数据哈希都未变化时直接使用上一次的校验结果
+        '''
+        meta: tuple | None = self._read_csv_meta(f)
+        if meta is None: return
+        stat: os.stat_result = os.fstat(f.fileno())
+        meta_hash: str = hashlib.sha256("\n".join([meta[0], meta[1], str(meta[2])]).encode("utf-8")).hexdigest()
+        cache_key: str = os.path.abspath(csv_file)
+        cached: tuple | None = self._validated.get(cache_key)
+        if cached is not None and cached[:3] == (stat.st_size, stat.st_mtime_ns, meta_hash):
+            return meta[2] if cached[3] else None
+        res: bool = self._verify_csv_meta(*meta)
+        self._validated[cache_key] = (stat.st_size, stat.st_mtime_ns, meta_hash, res)
+        return meta[2] if res else None
+
     def _is_source_csv(self, csv_file: str) -> bool:
         if not csv_file: return False
         if not os.path.exists(csv_file):
             self._e.error("%s csv文件不存在", LogLabelEnum.ERROR.value)
             return False
         try:
-            csv_bytes: bytes = Path(csv_file).read_bytes()
-            lines: list = csv_bytes.decode("utf-8").splitlines()
-            if len(lines) < 3:
-                self._e.error("%s csv文件格式错误", LogLabelEnum.UNSPORTED.value)
-                return False
-            reader = csv.reader(lines)
-            meta_sig: str = ""
-            meta_pub: str = ""
-            meta_header: list = []
-            row_count: int = 0
             # 只取前三行数据进行数据校验
-            for row in reader:
-                row_count += 1
-                if row[0].startswith(f"#{CsvMetaEnum.SIG.value}"): meta_sig = row[0].split(":")[1].strip()
-                elif row[0].startswith(f"#{CsvMetaEnum.PUB_ENCRY_KEY.value}"): meta_pub = row[0].split(":")[1].strip()
-                elif row[0].startswith("#"): continue
-                elif row_count == 3 and not row[0].startswith("#") : meta_header = row
-            if not meta_sig or not meta_pub or not meta_header:
-                self._e.error("%s csv文件错误", LogLabelEnum.UNSPORTED.value)
-                return False
-            # 验证公钥是否相同
-            if self._key_manager.parse_encry_str(meta_pub) != self._key_manager.rsa_pub_key:
-                self._e.error("%s csv文件公钥错误", LogLabelEnum.ERROR.value)
-                return False
-            # 验证签名
-            if not self._key_manager.verify_signature(meta_header, meta_sig):
-                self._e.error("%s csv文件签名错误", LogLabelEnum.ERROR.value)
-                return False
+            with open(csv_file, "r", encoding="utf-8-sig", newline="") as f:
+                meta_header: list | None = self._check_csv_meta(csv_file, f)
+            if meta_header is None: return False
             self._e.info("%s csv文件验证成功", LogLabelEnum.SIGNATURE.value)
             # 记录文件路径
             self._csv: str = csv_file
@@ -123,40 +154,186 @@ class CsvCore:
             self._e.error("%s 验证csv文件失败", LogLabelEnum.ERROR.value)
             return False
 
-    def _get_csv_data(self, csv_file: str) -> list:
-        if not csv_file: 
+    def _iter_csv_data(self, csv_file: str) -> Iterator[dict]:
+        '''
+        逐行读取csv数据,只打开一次文件,前三行校验通过后按行产出,内存占用与文件大小无关
+        产出的数据与_get_csv_data的元素相同,为CsvData.info字典
+        '''
+        if not csv_file:
             self._e.error("%s csv文件名为空", LogLabelEnum.ERROR.value)
-            return []
+            return
         if not os.path.exists(csv_file):
             self._e.error("%s csv文件不存在", LogLabelEnum.ERROR.value)
-            return []
-        if not self._is_source_csv(csv_file): return []
+            return
         try:
-            csv_bytes: bytes = Path(csv_file).read_bytes()
-            lines: list = csv_bytes.decode("utf-8-sig").splitlines()
-            if len(lines) < 3:
-                self._e.error("%s CSV文件行数不足", LogLabelEnum.ERROR.value)
-                return []
-            data_line: list = lines[2:]
-            reader = csv.DictReader(data_line)
-            field_headers: Sequence[str] | None = reader.fieldnames
-            if not field_headers or CsvHeaderEnum.USERNAME.value not in field_headers or CsvHeaderEnum.PASSWORD.value not in field_headers:
+            with open(csv_file, "r", encoding="utf-8-sig", newline="") as f:
+                field_headers: list | None = self._check_csv_meta(csv_file, f)
+                if field_headers is None: return
+                self._e.info("%s csv文件验证成功", LogLabelEnum.SIGNATURE.value)
+                self._csv: str = csv_file
+                if CsvHeaderEnum.USERNAME.value not in field_headers or CsvHeaderEnum.PASSWORD.value not in field_headers:
+                    self._e.error("%s CSV文件缺少必要字段", LogLabelEnum.WARNING.value)
+                    return
+                reader = csv.DictReader(f, fieldnames=field_headers)
+                for row_num, row in enumerate(reader, start=4): # 第三行是表头
+                    tmp_p: str = (row.get(CsvHeaderEnum.USERNAME.value) or "").strip()
+                    tmp_password: str = (row.get(CsvHeaderEnum.PASSWORD.value) or "").strip()
+
+                    if not tmp_p or not tmp_password:
+                        self._e.info("%s CSV文件第%s行数据不完整", LogLabelEnum.INFO.value, row_num)
+                        continue
+                    yield CsvData(tmp_p, tmp_password).info
+        except Exception as err:
+            self._e.handle_exception(err)
+            self._e.error("%s 获取csv数据失败", LogLabelEnum.ERROR.value)
+            return
+
+    def _get_csv_data(self, csv_file: str) -> list:
+        return list(self._iter_csv_data(csv_file))
+
+    def _prepare_csv_shard(self, csv_file: str) -> tuple | None:
+        '''
+        校验文件并返回 (表头, 数据区起始字节, 文件大小),数据区从第四行开始
+        '''
+        if not csv_file or not os.path.exists(csv_file):
+            self._e.error("%s csv文件不存在: %s", LogLabelEnum.ERROR.value, csv_file)
+            return
+        try:
+            with open(csv_file, "r", encoding="utf-8-sig", newline="") as f:
+                field_headers: list | None = self._check_csv_meta(csv_file, f)
+            if field_headers is None: return
+            if CsvHeaderEnum.USERNAME.value not in field_headers or CsvHeaderEnum.PASSWORD.value not in field_headers:
                 self._e.error("%s CSV文件缺少必要字段", LogLabelEnum.WARNING.value)
-                return []
-            res: list = []
-            for row_num, row in enumerate(reader, start=4): # 第三行是表头
-                tmp_p: str = (row.get(CsvHeaderEnum.USERNAME.value, "").strip())
-                tmp_password: str = (row.get(CsvHeaderEnum.PASSWORD.value, "").strip())
+                return
+            with open(csv_file, "rb") as f:
+                for _ in range(3): f.readline()
+                data_start: int = f.tell()
+            return field_headers, data_start, os.path.getsize(csv_file)
+        except Exception as err:
+            self._e.handle_exception(err)
+            self._e.error("%s 验证csv文件失败", LogLabelEnum.ERROR.value)
+            return
+
+    def _check_shard(self, index: int, count: int) -> bool:
+        if count < 1 or not 0 <= index < count:
+            self._e.error("%s 分片参数错误,分片序号: %s, 分片总数: %s", LogLabelEnum.ERROR.value, index, count)
+            return False
+        return True
 
+    def _iter_byte_range(self, csv_file: str, field_headers: list, data_start: int, start: int, end: int) -> Iterator[dict]:
+        '''
+        读取[start, end)字节范围内开始的行,一行属于它起始字节所在的范围,相邻范围不重不漏
+        按字节定位,不解析范围之前的内容;要求数据行中不包含换行符
+        '''
+        start = max(start, data_start)
+        with open(csv_file, "rb") as f:
+            if start > data_start:
+                # 跳过起点所在的半行,它属于上一个范围
+                f.seek(start - 1)
+                f.readline()
+            else:
+                f.seek(start)
+            while f.tell() < end:
+                pos: int = f.tell()
+                line: bytes = f.readline()
+                if not line: break
+                row: list = next(csv.reader([line.decode("utf-8")]), [])
+                if not row: continue
+                record: dict = dict(zip(field_headers, row))
+                tmp_p: str = (record.get(CsvHeaderEnum.USERNAME.value) or "").strip()
+                tmp_password: str = (record.get(CsvHeaderEnum.PASSWORD.value) or "").strip()
                 if not tmp_p or not tmp_password:
-                    self._e.info("%s CSV文件第%s行数据不完整", LogLabelEnum.INFO.value, row_num)
+                    self._e.info("%s CSV文件第%s字节处数据不完整", LogLabelEnum.INFO.value, pos)
                     continue
-                res.append(CsvData(tmp_p, tmp_password).info)
-            return copy.deepcopy(res)
+                yield CsvData(tmp_p, tmp_password).info
+
+    def _iter_csv_range(self, csv_file: str, start: int, end: int) -> Iterator[dict]:
+        # 按字节范围读取,范围以文件起始为0计算,落在元数据行内的部分自动跳过
+        meta: tuple | None = self._prepare_csv_shard(csv_file)
+        if meta is None: return
+        field_headers, data_start, size = meta
+        yield from self._iter_byte_range(csv_file, field_headers, data_start, start, min(end, size))
+
+    def _iter_csv_shard(self, csv_file: str, index: int, count: int) -> Iterator[dict]:
+        '''
+        把数据区按字节均分为count份,只读取第index份,所有分片合起来正好是完整数据
+        '''
+        if not self._check_shard(index, count): return
+        meta: tuple | None = self._prepare_csv_shard(csv_file)
+        if meta is None: return
+        field_headers, data_start, size = meta
+        data_len: int = size - data_start
+        start: int = data_start + data_len * index // count
+        end: int = data_start + data_len * (index + 1) // count
+        self._e.info("%s csv分片读取,分片: %s/%s, 字节范围: %s-%s", LogLabelEnum.FILE.value, index + 1, count, start, end)
+        yield from self._iter_byte_range(csv_file, field_headers, data_start, start, end)
+
+    def _set_csv_manifest(self, csv_files: list, manifest_file: str) -> bool:
+        '''
+        为多个csv文件生成签名清单,记录每个文件的路径和大小,文件路径相对清单所在目录保存
+        '''
+        base_dir: str = os.path.dirname(os.path.abspath(manifest_file))
+        entries: list = []
+        for csv_file in csv_files:
+            if self._prepare_csv_shard(csv_file) is None: return False
+            entries.append(f"{os.path.relpath(os.path.abspath(csv_file), base_dir)}:{os.path.getsize(csv_file)}")
+        try:
+            manifest: dict = {
+                "files": entries,
+                "signature": self._key_manager.generate_signature_str(entries)
+            }
+            with open(manifest_file, "w", encoding="utf-8") as f: json.dump(manifest, f, ensure_ascii=False, indent=2)
+            self._e.info("%s csv清单已生成: %s, 文件数: %s", LogLabelEnum.SIGNATURE.value, manifest_file, len(entries))
+            return True
         except Exception as err:
             self._e.handle_exception(err)
-            self._e.error("%s 获取csv数据失败", LogLabelEnum.ERROR.value)
-            return []
+            self._e.error("%s 写入csv清单失败", LogLabelEnum.ERROR.value)
+            return False
+
+    def _load_csv_manifest(self, manifest_file: str) -> list | None:
+        # 校验清单签名以及每个文件的大小和元数据,返回 [(文件路径, 表头, 数据区起始字节, 文件大小)]
+        try:
+            with open(manifest_file, "r", encoding="utf-8") as f: manifest: dict = json.load(f)
+        except Exception as err:
+            self._e.handle_exception(err)
+            self._e.error("%s 读取csv清单失败: %s", LogLabelEnum.ERROR.value, manifest_file)
+            return
+        entries: list = manifest.get("files") or []
+        if not entries or not self._key_manager.verify_signature(entries, manifest.get("signature", "")):
+            self._e.error("%s csv清单签名错误: %s", LogLabelEnum.ERROR.value, manifest_file)
+            return
+        base_dir: str = os.path.dirname(os.path.abspath(manifest_file))
+        files: list = []
+        for entry in entries:
+            rel_path, _, size = entry.rpartition(":")
+            csv_file: str = os.path.join(base_dir, rel_path)
+            meta: tuple | None = self._prepare_csv_shard(csv_file)
+            if meta is None: return
+            if meta[2] != int(size):
+                self._e.error("%s csv文件大小与清单不一致,文件已变更: %s", LogLabelEnum.ERROR.value, csv_file)
+                return
+            files.append((csv_file, *meta))
+        return files
+
+    def _iter_manifest_shard(self, manifest_file: str, index: int, count: int) -> Iterator[dict]:
+        '''
+        清单中所有文件的数据区首尾相接,按总字节数均分为count份,只读取第index份
+        '''
+        if not self._check_shard(index, count): return
+        files: list | None = self._load_csv_manifest(manifest_file)
+        if files is None: return
+        total: int = sum(size - data_start for _, _, data_start, size in files)
+        g_start: int = total * index // count
+        g_end: int = total * (index + 1) // count
+        self._e.info("%s csv清单分片读取,分片: %s/%s, 字节范围: %s-%s", LogLabelEnum.FILE.value, index + 1, count, g_start, g_end)
+        base: int = 0
+        for csv_file, field_headers, data_start, size in files:
+            data_len: int = size - data_start
+            start: int = max(g_start, base)
+            end: int = min(g_end, base + data_len)
+            if start < end:
+                yield from self._iter_byte_range(csv_file, field_headers, data_start, data_start + start - base, data_start + end - base)
+            base += data_len
 
 class CsvOperator:
     def __init__(self) -> None:
@@ -177,3 +354,18 @@ class CsvOperator:
 
     def get_csv_data(self, csv_file: str) -> list:
         return self._csv_core._get_csv_data(csv_file) # type: ignore
+
+    def iter_csv_data(self, csv_file: str) -> Iterator[dict]:
+        return self._csv_core._iter_csv_data(csv_file) # type: ignore
+
+    def iter_csv_shard(self, csv_file: str, index: int, count: int) -> Iterator[dict]:
+        return self._csv_core._iter_csv_shard(csv_file, index, count) # type: ignore
+
+    def iter_csv_range(self, csv_file: str, start: int, end: int) -> Iterator[dict]:
+        return self._csv_core._iter_csv_range(csv_file, start, end) # type: ignore
+
+    def generate_csv_manifest(self, csv_files: list, manifest_file: str) -> bool:
+        return self._csv_core._set_csv_manifest(csv_files, manifest_file) # type: ignore
+
+    def iter_manifest_shard(self, manifest_file: str, index: int, count: int) -> Iterator[dict]:
+        return self._csv_core._iter_manifest_shard(manifest_file, index, count) # type: ignore
@@ -16,12 +16,19 @@ class UnitEncry:
     通用加密类:
     1、密钥管理 - 生成密钥和读取已有密钥
     2、加密解密 - 加密解密内容判断
+    密钥对象只解析一次后缓存,签名验证和解密结果按输入缓存
     '''
+    _cache_size: int = 256
+
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance(),
+        e: ExceptionLog | None = None,
     ) -> None:
-        self._e: ExceptionLog = e
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._public_key: rsa.RSAPublicKey | None = None
+        self._private_key: rsa.RSAPrivateKey | None = None
+        self._verified: dict = {}
+        self._decrypted: dict = {}
         self._init_encryp_key()
         self._generate_rsa_key_file()
 
@@ -68,6 +75,8 @@ class UnitEncry:
         )
         # 根据私钥获取公钥
         public_key: rsa.RSAPublicKey = private_key.public_key()
+        self._private_key = private_key
+        self._public_key = public_key
 
         # 序列化私钥为 PEM 编码 + PKCS#8 格式 + 密码加密
         self._rsa_pri_key: bytes = private_key.private_bytes(
@@ -102,12 +111,39 @@ class UnitEncry:
             os.remove(target_file)
             return
 
+    def _get_public_key(self) -> rsa.RSAPublicKey:
+        if self._public_key is None:
+            self._public_key = serialization.load_pem_public_key( # type: ignore
+                self._rsa_pub_key,
+                backend=default_backend()
+            )
+        return self._public_key # type: ignore
+
+    def _get_private_key(self) -> rsa.RSAPrivateKey:
+        # 私钥有密码保护,解密开销较大,只加载一次
+        if self._private_key is None:
+            self._private_key = serialization.load_pem_private_key( # type: ignore
+                self._rsa_pri_key,
+                password=self._key,
+                backend=default_backend()
+            )
+        return self._private_key # type: ignore
+
+    def _remember(self, cache: dict, key: tuple | str, val) -> None:
+        if len(cache) >= self._cache_size: cache.pop(next(iter(cache)))
+        cache[key] = val
+
     def _verify_signature(self, data: list, signature: str) -> bool:
-        public_key: rsa.RSAPublicKey = serialization.load_pem_public_key( # type: ignore
-            self._rsa_pub_key,
-            backend=default_backend()
-        )
+        cache_key: tuple = (str(data), signature)
+        cached: bool | None = self._verified.get(cache_key)
+        if cached is not None: return cached
+        res: bool = self._verify_signature_uncached(data, signature)
+        self._remember(self._verified, cache_key, res)
+        return res
+
+    def _verify_signature_uncached(self, data: list, signature: str) -> bool:
         try:
+            public_key: rsa.RSAPublicKey = self._get_public_key()
             public_key.verify(
                 bytes.fromhex(signature),
                 data=str(data).encode("utf-8"),
@@ -132,11 +168,7 @@ class UnitEncry:
             return False
 
     def generate_signature_str(self, data: list) -> str:
-        private_key: rsa.RSAPrivateKey = serialization.load_pem_private_key( # type: ignore
-            self._rsa_pri_key,
-            password=self._key,
-            backend=default_backend()
-        )
+        private_key: rsa.RSAPrivateKey = self._get_private_key()
         signature: bytes = private_key.sign(
             data=str(data).encode("utf-8"),
             padding=padding.PSS(
@@ -157,6 +189,8 @@ class UnitEncry:
         return encryt_data
 
     def parse_encry_str(self, val: str) -> str | None:
+        cached: str | None = self._decrypted.get(val)
+        if cached is not None: return cached
         try:
             decryp_data: str = self._frenet.decrypt(val.encode()).decode()
         except Exception as e:
@@ -164,4 +198,5 @@ class UnitEncry:
             self._e.error("解密数据失败")
             return
         decode_data: str = base64.urlsafe_b64decode(decryp_data.encode()).decode()
+        self._remember(self._decrypted, val, decode_data)
         return decode_data
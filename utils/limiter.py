@@ -0,0 +1,48 @@
+import time
+import threading
+
+class TokenBucket:
+    '''
+    令牌桶限流器
+    1.每秒补充rate个令牌,桶容量为burst
+    2.rate小于等于0时不限流
+    '''
+    def __init__(
+        self,
+        rate: float,
+        burst: float | None = None
+    ) -> None:
+        self._rate: float = float(rate)
+        self._burst: float = float(burst) if burst else max(self._rate, 1.0)
+        self._tokens: float = self._burst
+        self._last: float = time.monotonic()
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self) -> None:
+        now: float = time.monotonic()
+        self._tokens = min(self._burst, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if self._rate <= 0: return True
+        with self._lock:
+            self._refill()
+            if self._tokens < tokens: return False
+            self._tokens -= tokens
+            return True
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        # 阻塞直到取得令牌
+        if self._rate <= 0: return
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds: float = (tokens - self._tokens) / self._rate
+            time.sleep(wait_seconds)
@@ -0,0 +1,140 @@
+import os
+import gzip
+import json
+import time
+import shutil
+import logging
+import threading
+
+from datetime import datetime
+
+from enums.logEnum import LogSinkFormatEnum
+from enums.loglabelEnum import LogLabelEnum
+
+try:
+    import msgpack
+except ImportError: # msgpack为可选依赖,未安装时只能使用jsonl格式
+    msgpack = None
+
+_LABEL_NAMES: dict = {label.value: label.name for label in LogLabelEnum}
+
+class StructuredLogHandler(logging.Handler):
+    '''
+    结构化日志处理器,每条日志编码为一条记录追加到分段文件中
+    1.记录字段: ts - 时间戳, level - 日志级别, code - eEnum错误码, label - LogLabelEnum名称, msg - 日志内容, exc - 异常追踪
+    2.分段文件超过max_bytes或打开超过rotate_seconds后切换新分段
+    3.compress为True时,关闭的分段在后台线程中gzip压缩
+    '''
+    def __init__(
+        self,
+        log_dir: str,
+        fmt: LogSinkFormatEnum = LogSinkFormatEnum.JSONL,
+        max_bytes: int = 64 * 1024 * 1024,
+        rotate_seconds: float = 3600.0,
+        compress: bool = True
+    ) -> None:
+        super().__init__()
+        if fmt == LogSinkFormatEnum.MSGPACK and msgpack is None: fmt = LogSinkFormatEnum.JSONL
+        self._log_dir: str = log_dir
+        self._fmt: LogSinkFormatEnum = fmt
+        self._max_bytes: int = max_bytes
+        self._rotate_seconds: float = rotate_seconds
+        self._compress: bool = compress
+        self._seq: int = 0
+        self._stream = None
+        self._segment_path: str = ""
+        self._segment_bytes: int = 0
+        self._segment_opened: float = 0.0
+        self._compressing: list = []
+        os.makedirs(self._log_dir, exist_ok=True)
+
+    @property
+    def segment_path(self) -> str:
+        return self._segment_path
+
+    def _open_segment(self) -> None:
+        self._seq += 1
+        suffix: str = "jsonl" if self._fmt == LogSinkFormatEnum.JSONL else "msgpack"
+        self._segment_path = os.path.join(
+            self._log_dir,
+            f"run-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._seq}.{suffix}"
+        )
+        self._stream = open(self._segment_path, "ab")
+        self._segment_bytes = 0
+        self._segment_opened = time.monotonic()
+
+    def _close_segment(self, background: bool = True) -> None:
+        if self._stream is None: return
+        self._stream.close()
+        self._stream = None
+        if not self._compress or self._segment_bytes == 0: return
+        # 运行中切换分段时在后台压缩,关闭处理器时直接压缩并等待后台压缩结束
+        if background:
+            worker: threading.Thread = threading.Thread(target=self._gzip_segment, args=(self._segment_path,), daemon=True)
+            try:
+                worker.start()
+            except RuntimeError: # 解释器退出阶段无法创建线程,直接压缩
+                self._gzip_segment(self._segment_path)
+                return
+            self._compressing = [t for t in self._compressing if t.is_alive()] + [worker]
+        else:
+            self._gzip_segment(self._segment_path)
+            for worker in self._compressing: worker.join()
+            self._compressing = []
+
+    @staticmethod
+    def _gzip_segment(path: str) -> None:
+        try:
+            with open(path, "rb") as src, gzip.open(f"{path}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(path)
+        except OSError:
+            pass # 压缩失败时保留原分段
+
+    def _to_record(self, record: logging.LogRecord) -> dict:
+        msg: str = record.getMessage()
+        # 项目中日志约定以LogLabelEnum的值开头,队列模式下参数已合并,这里从消息前缀识别
+        label: str | None = _LABEL_NAMES.get(msg.split(" ", 1)[0])
+        data: dict = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "code": getattr(record, "code", None),
+            "label": label,
+            "msg": msg,
+            "src": f"{record.module}:{record.lineno}"
+        }
+        if record.exc_info:
+            if not record.exc_text: record.exc_text = logging.Formatter().formatException(record.exc_info)
+            data["exc"] = record.exc_text
+        return data
+
+    def _encode(self, data: dict) -> bytes:
+        if self._fmt == LogSinkFormatEnum.MSGPACK: return msgpack.packb(data, default=str) # type: ignore
+        return (json.dumps(data, ensure_ascii=False, default=str, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            payload: bytes = self._encode(self._to_record(record))
+            self.acquire()
+            try:
+                if self._stream is not None and (
+                    self._segment_bytes + len(payload) > self._max_bytes
+                    or time.monotonic() - self._segment_opened >= self._rotate_seconds
+                ):
+                    self._close_segment()
+                if self._stream is None: self._open_segment()
+                self._stream.write(payload) # type: ignore
+                self._stream.flush() # type: ignore
+                self._segment_bytes += len(payload)
+            finally:
+                self.release()
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        self.acquire()
+        try:
+            self._close_segment(background=False)
+        finally:
+            self.release()
+        super().close()
@@ -1,13 +1,144 @@
 import os
+import time
+import queue
+import atexit
 import logging
 import threading
 
 from typing import Optional
 from datetime import datetime
+from dotenv import load_dotenv
 from rich.logging import RichHandler
+from logging.handlers import QueueHandler, QueueListener
 
 from enums.errEnum import eEnum
+from enums.logEnum import LogQueuePolicyEnum, LogSinkFormatEnum
+from enums.loglabelEnum import LogLabelEnum
 from template.logTemplate import LogData
+from utils.limiter import TokenBucket
+from utils.log_sink import StructuredLogHandler
+
+_LABEL_VALUES: dict = {label.value: label for label in LogLabelEnum}
+_SUMMARY_FMT: str = "%s 日志采样, 规则: %s, 已抑制 %s 条日志"
+
+class BoundedQueueHandler(QueueHandler):
+    '''
+    调用方只把日志记录放入有界队列,格式化和写入由后台监听线程完成
+    1.DROP - 队列满时丢弃并按日志级别计数,ERROR及以上级别的日志不丢弃,阻塞等待
+    2.BLOCK - 队列满时调用方阻塞等待
+    '''
+    def __init__(
+        self,
+        log_queue: queue.Queue,
+        policy: LogQueuePolicyEnum = LogQueuePolicyEnum.DROP
+    ) -> None:
+        super().__init__(log_queue)
+        self._policy: LogQueuePolicyEnum = policy
+        self._dropped: dict = {}
+        self._dropped_lock: threading.Lock = threading.Lock()
+
+    @property
+    def dropped(self) -> dict:
+        with self._dropped_lock:
+            return dict(self._dropped)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 只在调用方合并参数,防止参数对象入队后被修改;异常信息保留给处理器格式化
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._policy == LogQueuePolicyEnum.BLOCK or record.levelno >= logging.ERROR:
+            self.queue.put(record) # type: ignore
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped[record.levelname] = self._dropped.get(record.levelname, 0) + 1
+
+class LogSampler(logging.Filter):
+    '''
+    热点日志采样和限流,挂在记录器上,在格式化之前丢弃日志
+    1.规则按消息格式字符串或LogLabelEnum标签匹配,格式字符串优先
+    2.sample_rate - 保留比例,按计数均匀保留,例如0.1为每10条保留1条
+    3.rate - 每秒最多输出条数,令牌桶限流,小于等于0时不限流
+    4.被丢弃的日志按规则计数,每隔summary_interval秒输出一条汇总
+    ERROR及以上级别的日志不采样
+    '''
+    def __init__(
+        self,
+        logger: logging.Logger,
+        summary_interval: float = 10.0
+    ) -> None:
+        super().__init__()
+        self._logger: logging.Logger = logger
+        self._summary_interval: float = summary_interval
+        self._rules: dict = {}
+        self._suppressed: dict = {}
+        self._last_summary: float = time.monotonic()
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def has_rules(self) -> bool:
+        return bool(self._rules)
+
+    def set_rule(
+        self,
+        key: str | LogLabelEnum,
+        sample_rate: float = 1.0,
+        rate: float = 0.0
+    ) -> None:
+        rule_key: str | LogLabelEnum = key
+        with self._lock:
+            if sample_rate >= 1.0 and rate <= 0:
+                self._rules.pop(rule_key, None)
+                return
+            # 规则状态: [保留比例, 累计额度, 令牌桶]
+            self._rules[rule_key] = [max(sample_rate, 0.0), 0.0, TokenBucket(rate) if rate > 0 else None]
+
+    def _match_rule(self, record: logging.LogRecord) -> tuple:
+        if record.msg in self._rules: return record.msg, self._rules[record.msg]
+        # 项目中日志的第一个参数约定为LogLabelEnum的值
+        if record.args and isinstance(record.args, tuple):
+            label: LogLabelEnum | None = _LABEL_VALUES.get(record.args[0]) if isinstance(record.args[0], str) else None
+            if label is not None and label in self._rules: return label, self._rules[label]
+        return None, None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR or not self._rules or record.msg is _SUMMARY_FMT: return True
+        summary: dict | None = None
+        with self._lock:
+            key, rule = self._match_rule(record)
+            keep: bool = True
+            if rule is not None:
+                rule[1] += rule[0]
+                if rule[1] >= 1.0: rule[1] -= 1.0
+                else: keep = False
+                if keep and rule[2] is not None: keep = rule[2].try_acquire()
+                if not keep: self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            if self._suppressed and time.monotonic() - self._last_summary >= self._summary_interval:
+                summary = self._take_summary()
+        if summary: self._emit_summary(summary)
+        return keep
+
+    def _take_summary(self) -> dict:
+        # 需要在持锁时调用
+        summary: dict = self._suppressed
+        self._suppressed = {}
+        self._last_summary = time.monotonic()
+        return summary
+
+    def _emit_summary(self, summary: dict) -> None:
+        for key, count in summary.items():
+            name: str = key.name if isinstance(key, LogLabelEnum) else key
+            self._logger.info(_SUMMARY_FMT, LogLabelEnum.COUNT.value, name, count)
+
+    def flush(self) -> None:
+        with self._lock:
+            summary: dict = self._take_summary()
+        if summary: self._emit_summary(summary)
 
 class ExceptionLog:
     __instance: Optional['ExceptionLog'] = None
@@ -22,16 +153,29 @@ class ExceptionLog:
             return ExceptionLog.__instance
 
     def __init__(
-        self
+        self,
+        queue_mode: bool | None = None,
+        queue_size: int | None = None,
+        queue_policy: str | None = None
     ) -> None:
         if hasattr(self, "_initialized") and self._initialized:
             return
         else:
             '''
             初始化日志记录器以及处理器
+            开启队列模式时,处理器挂在后台监听线程上,记录器只挂一个队列处理器
+            工具模块依赖本模块,这里直接读取环境变量
             '''
+            load_dotenv()
+            self._queue_mode: bool = queue_mode if queue_mode is not None else os.getenv("LOG_QUEUE", "").lower() in ("1", "true", "yes")
+            self._queue_size: int = int(queue_size or os.getenv("LOG_QUEUE_SIZE") or 10000)
+            self._queue_policy: LogQueuePolicyEnum = LogQueuePolicyEnum.get_policy(queue_policy or os.getenv("LOG_QUEUE_POLICY") or "drop")
+            self._queue_handler: BoundedQueueHandler | None = None
+            self._listener: QueueListener | None = None
+            self._sampler: LogSampler | None = None
             self._err_log: str = "logs/err"
             self._info_log: str = "logs/info"
+            self._sink_log: str = "logs/structured"
 
             self.logger: logging.Logger = logging.getLogger("ExceptionLog")
             if self.logger.handlers:
@@ -84,8 +228,84 @@ class ExceptionLog:
             info_handler.setFormatter(info_handler_fmt)
             self.logger.addHandler(info_handler)
 
+            # 创建处理器c - 可选的结构化日志,按大小和时间切分
+            sink_fmt: LogSinkFormatEnum | None = LogSinkFormatEnum.get_format(os.getenv("LOG_SINK", ""))
+            if sink_fmt is not None:
+                sink_handler: StructuredLogHandler = StructuredLogHandler(
+                    self._sink_log,
+                    fmt=sink_fmt,
+                    max_bytes=int(os.getenv("LOG_SINK_MAX_BYTES") or 64 * 1024 * 1024),
+                    rotate_seconds=float(os.getenv("LOG_SINK_ROTATE_SECONDS") or 3600),
+                    compress=os.getenv("LOG_SINK_COMPRESS", "true").lower() in ("1", "true", "yes")
+                )
+                sink_handler.setLevel(logging.INFO)
+                self.logger.addHandler(sink_handler)
+
+            if self._queue_mode: self._start_queue()
+            self._load_sample_rules(os.getenv("LOG_SAMPLE_RULES", ""))
             self._initialized: bool = True
 
+    def _load_sample_rules(self, rules: str) -> None:
+        '''
+        环境变量格式: 键=保留比例[:每秒条数],多条规则用;分隔,键为LogLabelEnum名称或消息格式字符串
+        例如 LOG_SAMPLE_RULES="SUCCESS=0.1;INFO=1:200"
+        '''
+        for item in rules.split(";"):
+            if "=" not in item: continue
+            key, _, val = item.rpartition("=")
+            sample_rate, _, rate = val.partition(":")
+            try:
+                label: LogLabelEnum | None = LogLabelEnum.__members__.get(key.strip())
+                self.set_sampling(label or key.strip(), float(sample_rate or 1.0), float(rate or 0.0))
+            except ValueError:
+                self.logger.error("日志采样规则格式错误: %s", item)
+
+    def set_sampling(
+        self,
+        key: str | LogLabelEnum,
+        sample_rate: float = 1.0,
+        rate: float = 0.0
+    ) -> None:
+        '''
+        为一个调用点设置采样比例和每秒限流条数,key为消息格式字符串或LogLabelEnum标签
+        sample_rate为1且rate小于等于0时取消该规则
+        '''
+        if self._sampler is None:
+            self._sampler = LogSampler(self.logger, float(os.getenv("LOG_SAMPLE_SUMMARY_INTERVAL") or 10.0))
+            self.logger.addFilter(self._sampler)
+            # 进程退出时输出最后一次抑制汇总
+            atexit.register(self._sampler.flush)
+        self._sampler.set_rule(key, sample_rate, rate)
+
+    def _start_queue(self) -> None:
+        handlers: list = list(self.logger.handlers)
+        for handler in handlers: self.logger.removeHandler(handler)
+        self._queue_handler = BoundedQueueHandler(queue.Queue(maxsize=self._queue_size), self._queue_policy)
+        self._listener = QueueListener(self._queue_handler.queue, *handlers, respect_handler_level=True) # type: ignore
+        self._listener.start()
+        self.logger.addHandler(self._queue_handler)
+        # 进程退出时写完队列中剩余的日志
+        atexit.register(self.stop_queue)
+
+    def stop_queue(self) -> None:
+        '''
+        停止后台监听线程并写完剩余日志,处理器重新挂回记录器,之后的日志同步写入
+        '''
+        if self._listener is None or self._queue_handler is None: return
+        self._listener.stop()
+        self.logger.removeHandler(self._queue_handler)
+        for handler in self._listener.handlers: self.logger.addHandler(handler)
+        self._listener = None
+        dropped: dict = self._queue_handler.dropped
+        if dropped:
+            self.logger.error("日志队列已满,共丢弃日志: %s 条, 按级别统计: %s", sum(dropped.values()), dropped)
+
+    @property
+    def dropped(self) -> dict:
+        # 队列模式下因队列已满被丢弃的日志数,按日志级别统计
+        if self._queue_handler is None: return {}
+        return self._queue_handler.dropped
+
     @property
     def err_file_dir(self) -> str:
         return self._err_log
@@ -102,6 +322,10 @@ class ExceptionLog:
     def info_file_path(self) -> str:
         return self._info_file_name
 
+    @property
+    def sink_file_dir(self) -> str:
+        return self._sink_log
+
     def handle_exception(self, e: Exception) -> None:
         # 由于IOerror和ConnectionError是OSError的子类，所以这里不用match-case进行匹配
         if isinstance(e, TypeError):
@@ -109,39 +333,44 @@ class ExceptionLog:
             self.logger.error(
                 f"类型错误: {err_data.message}",
                 extra={"code": err_data.code},
-                exc_info=True
+                exc_info=True,
+                stacklevel=2
             )
         elif isinstance(e, AttributeError):
             err_data: LogData = LogData(eEnum.ATTRIBUTEFAIL, "")
             self.logger.error(
                 f"属性错误: {err_data.message}",
                 extra={"code": err_data.code},
-                exc_info=True
+                exc_info=True,
+                stacklevel=2
             )
         elif isinstance(e, ConnectionError):
             err_data: LogData = LogData(eEnum.CONNECTFAIL, "")
             self.logger.error(
                 f"链接错误: {err_data.message}",
                 extra={"code": err_data.code},
-                exc_info=True
+                exc_info=True,
+                stacklevel=2
             )
         elif isinstance(e, OSError):
             err_data: LogData = LogData(eEnum.OSFAIL, "")
             self.logger.error(
                 f"OS错误: {err_data.message}",
                 extra={"code": err_data.code},
-                exc_info=True
+                exc_info=True,
+                stacklevel=2
             )
         else:
             err_data: LogData = LogData(eEnum.UNKNOWNFAIL, "")
             self.logger.error(
                 f"未知错误: {err_data.message}",
                 extra={"code": err_data.code},
-                exc_info=True
+                exc_info=True,
+                stacklevel=2
             )
 
     def info(self, logmsgformat: str, *args) -> None:
-        self.logger.info(logmsgformat, *args)
+        self.logger.info(logmsgformat, *args, stacklevel=2)
 
     def error(self, logmsgformat: str, *args) -> None:
-        self.logger.error(logmsgformat, *args)
+        self.logger.error(logmsgformat, *args, stacklevel=2)
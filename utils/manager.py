@@ -1,19 +1,39 @@
 import time
 import copy
+import heapq
 import random
+import gevent
 import gevent.lock
 
+from collections import deque
 from gevent.lock import Semaphore
+from gevent.event import AsyncResult
+from gevent.queue import Queue, Empty
 from typing import Optional
 from datetime import datetime
 
 from enums.nosqlEnum import NosqlEnum
+from enums.managerEnum import TokenCheckoutEnum
 from enums.loglabelEnum import LogLabelEnum
-from template.nosqlTemplate import MetaUserData
 from utils.logs import ExceptionLog
+from utils.container import Container
 from utils.nosql import NosqlOperator
+from utils.file import get_env_val
+from utils.broker_client import TokenBrokerClient
 
 class StandardTokenManager:
+    '''
+    token管理器,支持两种取用方式:
+    1.random - 全局锁内随机选择用户,每次取用/归还同步写缓存数据库
+    2.queue - 打乱后的空闲队列,取用/归还均为O(1)且不加锁,占用状态在内存中维护,
+      由后台协程批量同步到缓存数据库的is_occupancy字段
+    池为空时取用方进入先进先出的等待队列,归还的token直接交给最早的等待者
+    每次取用都会获得带到期时间的租约,持有方通过renew续约.后台回收协程按到期时间小根堆回收过期租约,
+    租约到期时间同时写入存储,进程崩溃遗留的过期占用在重新扫描存储时回收
+    取用时可以传入持有方标识,归还和续约时标识不一致的请求被忽略,
+    租约过期被回收并交给新持有方后,原持有方迟到的归还不会释放新持有方的token
+    3.broker - 取用、归还、续约都转发给本机的token代理进程,多个worker进程不会重复占用同一个账号
+    '''
     __instance: Optional['StandardTokenManager'] = None
     __lock: Semaphore = gevent.lock.Semaphore()
 
@@ -27,35 +47,132 @@ class StandardTokenManager:
 
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance(),
-        nosql: NosqlOperator = NosqlOperator.create()
+        e: ExceptionLog | None = None,
+        nosql: NosqlOperator | None = None,
+        checkout_mode: str | None = None
     ) -> None:
         if hasattr(self, "__initialized") and self.__initialized:
             return
         else:
-            self._e: ExceptionLog = e
-            self._nosql: NosqlOperator = nosql
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._checkout_mode: TokenCheckoutEnum = TokenCheckoutEnum.get_mode(checkout_mode or get_env_val("TOKEN_CHECKOUT_MODE") or TokenCheckoutEnum.RANDOM.value)
+            # 代理模式下租约和存储都由代理进程管理,本进程不打开缓存数据库
+            self._broker: TokenBrokerClient | None = TokenBrokerClient(e=self._e) if self._checkout_mode == TokenCheckoutEnum.BROKER else None
+            self._nosql: NosqlOperator = (nosql or Container.get_instance().nosql) if self._broker is None else nosql # type: ignore
             self._active_pool: set = set()
             self._max_wait_seconds: int = 10
+            # queue模式使用的数据结构
+            self._free_list: deque = deque()
+            self._occupied: set = set()
+            self._sync_queue: Queue = Queue()
+            self._sync_worker: gevent.Greenlet | None = None
+            # 等待队列 - 先进先出,归还token时直接唤醒最早的等待者
+            self._waiters: deque = deque()
+            self._rescan_interval: float = 1.0 # 等待期间重新扫描存储的间隔,用于发现其他进程归还的token
+            # 租约 - 用户名 -> 到期时间戳,小根堆中过期的旧条目在出堆时丢弃
+            self._lease_ttl: float = float(get_env_val("TOKEN_LEASE_TTL") or 600)
+            self._reap_interval: float = min(max(self._lease_ttl / 10, 1.0), 30.0)
+            self._leases: dict = {}
+            self._lease_heap: list = []
+            self._holders: dict = {} # 用户名 -> 持有方标识,未传入标识的取用不记录
+            self._reaper: gevent.Greenlet | None = None
+            self._broker_ttl_loaded: bool = False
+            # 批量取用/归还 - 同一批启动或停止的用户在窗口期内合并为一次acquire_many/release_many
+            self._batch_window: float = float(get_env_val("TOKEN_BATCH_WINDOW") or 0.005)
+            self._checkout_batch: list = []
+            self._checkin_batch: list = []
             self.__initialized: bool = True
 
     @property
     def pool(self) -> set:
         return copy.deepcopy(self._active_pool)
 
+    @property
+    def is_broker(self) -> bool:
+        return self._broker is not None
+
+    @property
+    def lease_ttl(self) -> float:
+        if self._broker is not None and not self._broker_ttl_loaded:
+            # 租约时长以代理进程的配置为准,只查询一次
+            broker_ttl: float | None = self._broker.lease_ttl()
+            if broker_ttl is not None:
+                self._lease_ttl = float(broker_ttl)
+                self._broker_ttl_loaded = True
+        return self._lease_ttl
+
+    @staticmethod
+    def _format_lease(expiry: float) -> str:
+        return str(datetime.fromtimestamp(expiry).isoformat())
+
+    def _grant_lease(self, username: str) -> float:
+        # 发放或续期租约,需要在持锁时调用
+        expiry: float = time.time() + self._lease_ttl
+        self._leases[username] = expiry
+        heapq.heappush(self._lease_heap, (expiry, username))
+        if self._reaper is None or self._reaper.dead: self._reaper = gevent.spawn(self._reap_loop)
+        return expiry
+
+    def _reap_loop(self) -> None:
+        while True:
+            gevent.sleep(self._reap_interval)
+            now: float = time.time()
+            expired: list = []
+            with StandardTokenManager.__lock:
+                while self._lease_heap and self._lease_heap[0][0] <= now:
+                    expiry, username = heapq.heappop(self._lease_heap)
+                    # 已续约或已归还的旧条目直接丢弃
+                    if self._leases.get(username) == expiry: expired.append(username)
+            for username in expired:
+                self._e.error("%s 用户: %s 租约已过期,自动回收", LogLabelEnum.WARNING.value, username)
+                self.cast_token(username)
+
+    def _reclaim_expired(self, all_data: dict) -> list:
+        '''
+        回收存储中租约已过期的占用用户(通常是崩溃进程遗留),本进程持有的租约由回收协程处理
+        '''
+        now: str = self._format_lease(time.time())
+        expired: list = [
+            username for username, info in all_data.items()
+            if info.get(NosqlEnum.STATUS.value)
+            and info.get(NosqlEnum.LEASE_EXPIRE.value)
+            and info.get(NosqlEnum.LEASE_EXPIRE.value) <= now
+            and username not in self._leases
+        ]
+        if not expired: return []
+        reclaimed: list = list(self._nosql.update_status_many(expired, False).keys())
+        self._e.error("%s 回收存储中过期租约的用户数: %s", LogLabelEnum.WARNING.value, len(reclaimed))
+        return reclaimed
+
+    def _holds_unlocked(self, username: str, holder: str | None) -> bool:
+        # 未传入持有方标识时不校验,需要在持锁时调用
+        if holder is None or self._holders.get(username) == holder: return True
+        self._e.info("%s 用户: %s 已不属于持有方: %s,忽略该请求", LogLabelEnum.WARNING.value, username, holder)
+        return False
+
+    def holds(self, username: str, holder: str | None = None) -> bool:
+        with StandardTokenManager.__lock: return self._holds_unlocked(username, holder)
+
+    def renew(self, username: str, holder: str | None = None) -> bool:
+        '''
+        续约 - 持有方定期调用,延长租约到期时间
+        '''
+        if self._broker is not None: return self._broker.renew(username, holder)
+        with StandardTokenManager.__lock:
+            if not self._holds_unlocked(username, holder): return False
+            if username not in self._leases:
+                self._e.info("%s 用户: %s 无有效租约,续约失败", LogLabelEnum.WARNING.value, username)
+                return False
+            expiry: float = self._grant_lease(username)
+        return self._nosql.update_by_key(username, NosqlEnum.LEASE_EXPIRE.value, self._format_lease(expiry))
+
     def _lock_atomic_token(self, username: str) -> bool:
-        curr_data: dict | None = self._nosql.get_some_nosql_data(username)
-        if curr_data is None:
-            self._e.info("缓存数据库无此用户数据,时间: %s", str(datetime.now().isoformat()))
-            return False
-        if curr_data.get(NosqlEnum.STATUS.value) is False:
-            lock_data: MetaUserData = MetaUserData(
-                password=curr_data.get(NosqlEnum.PASSWORD.value, ""),
-                Authorization=curr_data.get(NosqlEnum.AUTHORIZATION.value, ""),
-                is_occupancy=True
-            )
-            return self._nosql.update(username, lock_data)
-        self._e.info("缓存数据库此用户已锁定,时间: %s", str(datetime.now().isoformat()))
+        # 占用状态和租约到期时间在一次存储操作中写入
+        expiry: float = time.time() + self._lease_ttl
+        if username in self._nosql.update_status_many([username], True, self._format_lease(expiry)):
+            self._grant_lease(username)
+            return True
+        self._e.info("缓存数据库此用户已锁定或不存在,时间: %s", str(datetime.now().isoformat()))
         return False
 
     def _cast_lock_token(self, username: str) -> bool:
@@ -66,12 +183,8 @@ class StandardTokenManager:
         if curr_data.get(NosqlEnum.STATUS.value) is False:
             self._e.info("缓存数据库此用户未锁定")
             return False
-        cast_data: MetaUserData = MetaUserData(
-            password=curr_data.get(NosqlEnum.PASSWORD.value, ""),
-            Authorization=curr_data.get(NosqlEnum.AUTHORIZATION.value, ""),
-            is_occupancy=False
-        )
-        return self._nosql.update(username, cast_data)
+        # 归还时同时清空租约,只修改状态和租约,不覆盖其他字段
+        return bool(self._nosql.update_status_many([username], False))
 
     def _random_token(self) -> tuple | None:
         if not self._active_pool:
@@ -80,65 +193,348 @@ class StandardTokenManager:
         chose_username: str = random.choice(list(self._active_pool))
         lock_token: bool = self._lock_atomic_token(chose_username)
         if not lock_token:
+            # 已被其他进程占用,移出活跃池避免反复抢占
+            self._active_pool.discard(chose_username)
             self._e.error("%s 锁定用户失败,用户ID: %s, 时间: %s", LogLabelEnum.ERROR.value, chose_username, str(datetime.now().isoformat()))
             return
         self._active_pool.discard(chose_username)
         self._e.info(
-            "%s 【随机选择】从 %s 个用户中选中成功取出活跃池用户: %s, 池剩余活跃用户数: %s, 用户数据是: %s",
+            "%s 【随机选择】从 %s 个用户中选中成功取出活跃池用户: %s, 池剩余活跃用户数: %s",
             LogLabelEnum.SUCCESS.value,
             len(self._active_pool) + 1,
             chose_username,
-            len(self._active_pool),
-            self._active_pool
+            len(self._active_pool)
         )
         return chose_username, self._nosql.get_auth(chose_username)
 
-    def get_access_token(self, timeout: float = 10.0) -> tuple | None:
+    def _load_free_list(self) -> None:
+        '''
+        补充空闲队列.已在队列中的用户全部保留(内存中归还但尚未同步的用户在存储中仍是占用状态),
+        再追加存储中空闲且未被本进程占用的用户
+        '''
+        all_data: dict | None = self._nosql.get_all_nosql_data()
+        if all_data is None:
+            self._e.info("缓存数据库无用户数据,时间: %s", str(datetime.now().isoformat()))
+            return
+        queued: list = [username for username in dict.fromkeys(self._free_list) if username not in self._occupied]
+        skip: set = self._occupied.union(queued)
+        candidates: list = []
+        for username, info in all_data.items():
+            if not info.get(NosqlEnum.AUTHORIZATION.value):
+                self._e.info("%s 缓存数据库存在脏数据,用户名: %s", LogLabelEnum.ERROR.value, username)
+                continue
+            # 内存中的占用状态优先于尚未同步的数据库状态
+            if not info.get(NosqlEnum.STATUS.value) and username not in skip: candidates.append(username)
+        candidates.extend(username for username in self._reclaim_expired(all_data) if username not in skip)
+        random.shuffle(candidates)
+        self._free_list = deque(queued + candidates)
+        self._e.info("%s 从数据库补充 %d 个空闲用户到空闲队列,队列长度: %d", LogLabelEnum.COUNT_TABLE.value, len(candidates), len(self._free_list))
+
+    def _queue_token(self) -> tuple | None:
+        if not self._free_list: self._load_free_list()
+        while self._free_list:
+            chose_username: str = self._free_list.popleft()
+            # 重新加载队列期间被取走的用户会留在新队列中,取用时跳过
+            if chose_username in self._occupied: continue
+            self._occupied.add(chose_username)
+            self._grant_lease(chose_username)
+            self._push_sync(chose_username, True)
+            return chose_username, self._nosql.get_auth(chose_username)
+        return
+
+    def _cast_queue_token(self, username: str) -> bool:
+        if username not in self._occupied:
+            self._e.info("%s 用户: %s 未被占用,无需释放", LogLabelEnum.WARNING.value, username)
+            return False
+        self._occupied.discard(username)
+        self._leases.pop(username, None)
+        self._holders.pop(username, None)
+        self._free_list.append(username)
+        self._push_sync(username, False)
+        return True
+
+    def _push_sync(self, username: str, status: bool) -> None:
+        self._sync_queue.put((username, status))
+        if self._sync_worker is None or self._sync_worker.dead:
+            self._sync_worker = gevent.spawn(self._sync_loop)
+
+    def _sync_loop(self) -> None:
+        while True:
+            username, status = self._sync_queue.get()
+            # 合并同一批次中同一用户的多次变更,只写最终状态
+            batch: dict = {username: status}
+            try:
+                while True:
+                    username, status = self._sync_queue.get_nowait()
+                    batch[username] = status
+            except Empty:
+                pass
+            # 按状态分组,每组一次批量写入
+            for status in (True, False):
+                keys: list = [k for k, v in batch.items() if v is status]
+                if not keys: continue
+                if not status:
+                    self._nosql.update_status_many(keys, False)
+                    continue
+                # 占用状态和租约到期时间一起写入;已是占用状态的用户(直接交接的token)只续写租约
+                changed: dict = self._nosql.update_status_many(keys, True, self._format_lease(time.time() + self._lease_ttl))
+                renewed: dict = {k: self._format_lease(self._leases[k]) for k in keys if k not in changed and k in self._leases}
+                if renewed: self._nosql.update_lease_many(renewed)
+
+    def _reload_active_pool(self) -> None:
+        all_data: dict | None = self._nosql.get_all_nosql_data()
+        if all_data is None:
+            self._e.info("缓存数据库无用户数据,时间: %s", str(datetime.now().isoformat()))
+            return
+
+        # 构建活跃池
+        candidates: set = set()
+        for username, info in all_data.items():
+            is_occupancy: bool = info.get(NosqlEnum.STATUS.value)
+            token: str = info.get(NosqlEnum.AUTHORIZATION.value)
+            if not token:
+                self._e.info("%s 缓存数据库存在脏数据,用户名: %s", LogLabelEnum.ERROR.value, username)
+                continue
+            if not is_occupancy:
+                candidates.add(username)
+        candidates.update(self._reclaim_expired(all_data))
+
+        # 更新原先活跃池 - 只有一个协程可以更新活跃池
+        with StandardTokenManager.__lock: self._active_pool = candidates.copy()
+        self._e.info("%s 从数据库加载 %d 个空闲用户到活跃池", LogLabelEnum.COUNT_TABLE.value, len(candidates))
+
+    def _try_access_token(self) -> tuple | None:
+        # 不等待,尝试取用一次.池为空时扫描一次存储
+        if self._checkout_mode == TokenCheckoutEnum.QUEUE: return self._queue_token()
+        # 从活跃池中取数据 - 只有一个协程可以从活跃池取数据
+        with StandardTokenManager.__lock:
+            if self._active_pool:
+                result: tuple | None = self._random_token()
+                if result is not None: return result
+        # 池为空 或 抢占失败 → 动态扫描数据库
+        self._reload_active_pool()
+        with StandardTokenManager.__lock:
+            if self._active_pool: return self._random_token()
+        return
+
+    def _has_idle_token(self) -> bool:
+        if self._checkout_mode == TokenCheckoutEnum.QUEUE: return bool(self._free_list)
+        return bool(self._active_pool)
+
+    def _handoff_token(self, username: str) -> bool:
+        '''
+        归还的token直接交给最早的等待者,token保持占用状态,不写存储.需要在持锁时调用
+        '''
+        while self._waiters:
+            waiter: AsyncResult = self._waiters.popleft()
+            if waiter.ready(): continue
+            expiry: float = self._grant_lease(username)
+            # 原持有方的标识作废,等待者拿到token后记录自己的标识
+            self._holders.pop(username, None)
+            # 交接不改变占用状态,但存储中的租约仍是上一个持有方的,需要写入新的到期时间,
+            # 否则重启后的过期回收会回收仍在使用的token
+            if self._checkout_mode == TokenCheckoutEnum.QUEUE: self._push_sync(username, True)
+            else: self._nosql.update_lease_many({username: self._format_lease(expiry)})
+            waiter.set((username, self._nosql.get_auth(username)))
+            self._e.info("%s 用户: %s 的访问令牌已直接交给等待者,剩余等待者: %s", LogLabelEnum.RETRY.value, username, len(self._waiters))
+            return True
+        return False
+
+    def get_access_token(self, timeout: float = 10.0, holder: str | None = None) -> tuple | None:
+        if self._broker is not None: return self._broker.acquire(timeout, holder)
+        result: tuple | None = self._wait_access_token(timeout)
+        if result is not None and holder is not None:
+            with StandardTokenManager.__lock: self._holders[result[0]] = holder
+        return result
+
+    def _wait_access_token(self, timeout: float) -> tuple | None:
         s_time: float = time.time()
-        while time.time() - s_time < timeout:
-            # 从活跃池中取数据 - 只有一个协程可以从活跃池取数据
+        result: tuple | None = self._try_access_token()
+        if result is not None: return result
+        # 池已耗尽 → 进入等待队列,由cast_token直接唤醒
+        waiter: AsyncResult = AsyncResult()
+        with StandardTokenManager.__lock:
+            has_idle: bool = self._has_idle_token()
+            if not has_idle: self._waiters.append(waiter)
+        if has_idle:
+            # 入队前已有token归还,直接重试
+            result = self._try_access_token()
+            if result is not None: return result
+            with StandardTokenManager.__lock: self._waiters.append(waiter)
+        while True:
+            remaining: float = timeout - (time.time() - s_time)
+            if remaining <= 0: break
+            waiter.wait(timeout=min(remaining, self._rescan_interval))
+            if waiter.ready(): return waiter.get()
+            # 定期扫描存储,发现其他进程归还的token
+            with StandardTokenManager.__lock: is_first: bool = bool(self._waiters) and self._waiters[0] is waiter
+            if not is_first: continue
+            result = self._try_access_token()
+            if result is None: continue
             with StandardTokenManager.__lock:
-                if self._active_pool:
-                    result: tuple | None = self._random_token()
-                    if result is not None:
-                        user, res = result
-                        return user, res
-            
-            # 池为空 或 抢占失败 → 动态扫描数据库
-            all_data: dict | None = self._nosql.get_all_nosql_data()
-            if all_data is None:
-                self._e.info("缓存数据库无用户数据,时间: %s", str(datetime.now().isoformat()))
-                continue # 没到超时时间继续循环
-
-            # 构建活跃池
-            candidates: set = set()
-            for username, info in all_data.items():
-                is_occupancy: bool = info.get(NosqlEnum.STATUS.value)
-                token: str = info.get(NosqlEnum.AUTHORIZATION.value)
-                if not token:
-                    self._e.info("%s 缓存数据库存在脏数据,用户名: %s", LogLabelEnum.ERROR.value, username)
-                    continue
-                if not is_occupancy:
-                    candidates.add(username)
-
-            # 更新原先活跃池 - 只有一个协程可以更新活跃池
-            with StandardTokenManager.__lock: self._active_pool = candidates.copy()
-            self._e.info("%s 从数据库加载 %d 个空闲用户到活跃池", LogLabelEnum.COUNT_TABLE.value, len(candidates))
-            result: tuple | None = self._random_token()
-            if result is not None:
-                user, res = result
-                return user, res
-            time.sleep(0.1)
+                if waiter.ready():
+                    # 扫描期间也收到了交接的token,多出的一个交给下一个等待者或归还
+                    extra: tuple = result
+                    result = waiter.get()
+                    if not self._handoff_token(extra[0]): self._release_unlocked(extra[0])
+                else:
+                    self._waiters.remove(waiter)
+            return result
+        with StandardTokenManager.__lock:
+            if waiter.ready(): return waiter.get()
+            if waiter in self._waiters: self._waiters.remove(waiter)
         self._e.error("获取访问令牌超时,时间: %s", str(datetime.now().isoformat()))
         return
 
-    def cast_token(self, username: str) -> None:
+    def _release_unlocked(self, username: str) -> bool:
+        # 归还token到池中,需要在持锁时调用
+        if self._checkout_mode == TokenCheckoutEnum.QUEUE: return self._cast_queue_token(username)
+        if not self._cast_lock_token(username): return False
+        self._leases.pop(username, None)
+        self._holders.pop(username, None)
+        self._active_pool.add(username)
+        return True
+
+    def cast_token(self, username: str, holder: str | None = None) -> None:
+        '''
+        归还token.传入holder时只有当前持有方可以归还;回收协程不传入,无条件归还
+        '''
+        if self._broker is not None:
+            if not self._broker.release(username, holder):
+                self._e.error("%s 用户: %s 通过token代理释放访问令牌失败", LogLabelEnum.ERROR.value, username)
+            return
         with StandardTokenManager.__lock:
-            if not self._cast_lock_token(username):
+            if not self._holds_unlocked(username, holder): return
+            if self._is_held(username) and self._handoff_token(username): return
+            if not self._release_unlocked(username):
                 self._e.error("%s 用户: %s 释放访问令牌失败,时间: %s", LogLabelEnum.ERROR.value, username, str(datetime.now().isoformat()))
             else:
-                self._active_pool.add(username)
                 self._e.info("%s 用户: %s 释放访问令牌成功,时间: %s", LogLabelEnum.SUCCESS.value, username, str(datetime.now().isoformat()))
 
+    def _is_held(self, username: str) -> bool:
+        # 只有确实处于占用状态的token才能直接交接
+        if not self._waiters: return False
+        if self._checkout_mode == TokenCheckoutEnum.QUEUE: return username in self._occupied
+        curr_data: dict | None = self._nosql.get_some_nosql_data(username)
+        return curr_data is not None and curr_data.get(NosqlEnum.STATUS.value) is True
+
+    def acquire_many(self, n: int, holders: list | None = None) -> list:
+        '''
+        批量取用n个token,返回 [(用户名, Authorization), ...],可用用户不足n个时返回实际取到的部分
+        1.random模式整批在一次存储事务中锁定
+        2.queue模式在内存中完成取用,占用状态由后台协程合并为一次批量写入
+        holders为每个请求的持有方标识,第i个结果记录holders[i]
+        '''
+        if n <= 0: return []
+        if self._broker is not None: return self._broker.acquire_many(n, holders)
+        with StandardTokenManager.__lock:
+            if self._checkout_mode == TokenCheckoutEnum.QUEUE:
+                if len(self._free_list) < n: self._load_free_list()
+                candidates: list = []
+                while self._free_list and len(candidates) < n:
+                    chose_username: str = self._free_list.popleft()
+                    if chose_username in self._occupied: continue
+                    self._occupied.add(chose_username)
+                    self._grant_lease(chose_username)
+                    self._push_sync(chose_username, True)
+                    candidates.append(chose_username)
+                res: list = [(username, self._nosql.get_auth(username)) for username in candidates]
+            else:
+                candidates: list = random.sample(list(self._active_pool), min(n, len(self._active_pool)))
+                self._active_pool.difference_update(candidates)
+                # 活跃池不足时只向存储补查一次缺少的数量
+                if len(candidates) < n: candidates.extend(self._nosql.get_idle_keys(n - len(candidates), set(candidates)))
+                locked: dict = self._nosql.update_status_many(candidates, True, self._format_lease(time.time() + self._lease_ttl))
+                for username in locked: self._grant_lease(username)
+                res: list = list(locked.items())
+            for (username, _), holder in zip(res, holders or []):
+                if holder is not None: self._holders[username] = holder
+        self._e.info("%s 批量取用token完成,请求数: %s, 取用数: %s", LogLabelEnum.COUNT.value, n, len(res))
+        return res
+
+    def release_many(self, usernames: list, holders: dict | None = None) -> list:
+        '''
+        批量归还token,返回成功归还的用户名列表
+        1.random模式整批在一次存储事务中解锁
+        2.queue模式在内存中完成归还,占用状态由后台协程合并为一次批量写入
+        holders为 用户名 -> 持有方标识,标识不一致的用户不归还
+        '''
+        if not usernames: return []
+        if self._broker is not None: return self._broker.release_many(usernames, holders)
+        with StandardTokenManager.__lock:
+            if holders: usernames = [username for username in usernames if self._holds_unlocked(username, holders.get(username))]
+            # 有等待者时优先直接交接
+            handoff: list = [username for username in usernames if self._is_held(username) and self._handoff_token(username)]
+            if handoff: usernames = [username for username in usernames if username not in handoff]
+            if self._checkout_mode == TokenCheckoutEnum.QUEUE:
+                released: list = [username for username in usernames if username in self._occupied]
+                for username in released:
+                    self._occupied.discard(username)
+                    self._free_list.append(username)
+                    self._push_sync(username, False)
+            else:
+                released: list = list(self._nosql.update_status_many(list(usernames), False).keys())
+                self._active_pool.update(released)
+            for username in released:
+                self._leases.pop(username, None)
+                self._holders.pop(username, None)
+        self._e.info("%s 批量归还token完成,交接数: %s, 归还数: %s", LogLabelEnum.COUNT.value, len(handoff), len(released))
+        return handoff + released
+
+    def refresh(self, username: str, stale_auth: str, timeout: float = 30.0) -> str | None:
+        '''
+        代理模式下由代理进程重新登录并写入存储,本进程不打开缓存数据库.只有持有该token的连接可以刷新
+        '''
+        if self._broker is None:
+            self._e.error("%s 非代理模式不支持通过管理器刷新token", LogLabelEnum.ERROR.value)
+            return
+        return self._broker.refresh(username, stale_auth, timeout)
+
+    def checkout(self, timeout: float = 10.0, holder: str | None = None) -> tuple | None:
+        '''
+        供用户启动时调用.窗口期内的取用请求合并为一次acquire_many,
+        一批locust用户启动时只加锁、写存储(或访问代理)一次;批量取用不足的部分退回get_access_token等待
+        '''
+        waiter: AsyncResult = AsyncResult()
+        self._checkout_batch.append((waiter, holder))
+        if len(self._checkout_batch) == 1: gevent.spawn(self._flush_checkout_batch)
+        result: tuple | None = waiter.get()
+        if result is not None: return result
+        return self.get_access_token(timeout, holder)
+
+    def _flush_checkout_batch(self) -> None:
+        gevent.sleep(self._batch_window)
+        batch: list = self._checkout_batch
+        self._checkout_batch = []
+        try:
+            results: list = self.acquire_many(len(batch), [holder for _, holder in batch])
+        except Exception as err:
+            self._e.handle_exception(err)
+            results: list = []
+        for i, (waiter, _) in enumerate(batch): waiter.set(tuple(results[i]) if i < len(results) else None)
+
+    def checkin(self, username: str, holder: str | None = None) -> None:
+        '''
+        供用户停止时调用,不等待结果.窗口期内的归还请求合并为一次release_many
+        '''
+        self._checkin_batch.append((username, holder))
+        if len(self._checkin_batch) == 1: gevent.spawn(self._flush_checkin_batch)
+
+    def _flush_checkin_batch(self) -> None:
+        gevent.sleep(self._batch_window)
+        batch: list = self._checkin_batch
+        self._checkin_batch = []
+        usernames: list = [username for username, _ in batch]
+        holders: dict = {username: holder for username, holder in batch if holder is not None}
+        try:
+            released: list = self.release_many(usernames, holders or None)
+        except Exception as err:
+            self._e.handle_exception(err)
+            released: list = []
+        if len(released) < len(usernames):
+            self._e.error("%s 批量归还token存在失败,归还数: %s, 失败用户: %s", LogLabelEnum.ERROR.value, len(released), sorted(set(usernames) - set(released)))
+
     def clear(self) -> None:
-        with StandardTokenManager.__lock: self._active_pool.clear()
+        with StandardTokenManager.__lock:
+            self._active_pool.clear()
+            self._free_list.clear()
@@ -0,0 +1,164 @@
+import hmac
+import json
+import time
+import math
+import base64
+import random
+import hashlib
+import gevent
+
+from typing import Callable, Iterable
+from gevent.pywsgi import WSGIServer
+
+from enums.mockEnum import MockLatencyEnum
+from enums.serverEnum import ServerEnum
+from enums.actionEnum import ActionEnum
+from enums.nosqlEnum import NosqlEnum
+from enums.loglabelEnum import LogLabelEnum
+from utils.logs import ExceptionLog
+from utils.file import get_env_val
+
+def parse_latency(spec: str, rng: random.Random) -> Callable[[], float]:
+    '''
+    解析延迟分布,返回每次调用产生一个延迟秒数的函数,例如 fixed:5、uniform:1,20、normal:10,3、exp:8、lognormal:10,0.5
+    '''
+    name, _, params = (spec or "fixed:0").partition(":")
+    args: list = [float(arg) / 1000 for arg in params.split(",") if arg.strip()] or [0.0]
+    match MockLatencyEnum.get_dist(name):
+        case MockLatencyEnum.UNIFORM: return lambda: rng.uniform(args[0], args[-1])
+        case MockLatencyEnum.NORMAL: return lambda: max(rng.gauss(args[0], args[-1] if len(args) > 1 else 0.0), 0.0)
+        case MockLatencyEnum.EXP: return lambda: rng.expovariate(1 / args[0]) if args[0] > 0 else 0.0
+        case MockLatencyEnum.LOGNORMAL:
+            # 第二个参数是形状参数,不按毫秒换算
+            sigma: float = args[1] * 1000 if len(args) > 1 else 0.5
+            return lambda: rng.lognormvariate(math.log(args[0]), sigma) if args[0] > 0 else 0.0
+        case _: return lambda: args[0]
+
+class MockServer:
+    '''
+    本地模拟被测服务,用于在没有真实服务和网络的情况下测量工具自身的开销和上限
+    1./user/login - 任意账号密码登录成功,返回JWT格式的token,exp为当前时间加token_ttl
+    2./user/info - 校验token签名和exp,失效时返回401,成功时返回payload_size字节的填充数据
+    3.响应均为code/message/data三段式;每个请求按latency分布延迟,按error_rate概率返回500
+    4.seed固定时延迟和错误序列可复现
+    '''
+    def __init__(
+        self,
+        host: str | None = None,
+        port: int | None = None,
+        latency: str | None = None,
+        error_rate: float | None = None,
+        token_ttl: float | None = None,
+        payload_size: int | None = None,
+        seed: int | None = None,
+        e: ExceptionLog | None = None
+    ) -> None:
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._host: str = host or get_env_val("MOCK_HOST") or "127.0.0.1"
+        self._port: int = int(port if port is not None else (get_env_val("MOCK_PORT") or 8000))
+        self._rng: random.Random = random.Random(seed if seed is not None else (int(get_env_val("MOCK_SEED")) if get_env_val("MOCK_SEED") else None))
+        self._latency_spec: str = latency or get_env_val("MOCK_LATENCY") or "fixed:0"
+        self._latency: Callable[[], float] = parse_latency(self._latency_spec, self._rng)
+        self._error_rate: float = float(error_rate if error_rate is not None else (get_env_val("MOCK_ERROR_RATE") or 0))
+        self._token_ttl: float = float(token_ttl or get_env_val("MOCK_TOKEN_TTL") or 3600)
+        self._payload: str = "x" * int(payload_size if payload_size is not None else (get_env_val("MOCK_PAYLOAD_SIZE") or 0))
+        self._secret: bytes = hashlib.sha256(str(self._rng.random()).encode()).digest()
+        self._server: WSGIServer | None = None
+        self._stats: dict = {"login": 0, "info": 0, "unauthorized": 0, "error": 0}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    @staticmethod
+    def _b64(raw: bytes) -> str:
+        return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+    def _issue_token(self, phone: str) -> str:
+        header: str = self._b64(json.dumps({"alg": "HS256", "typ": "JWT"}).encode())
+        payload: str = self._b64(json.dumps({"sub": phone, "exp": int(time.time() + self._token_ttl)}).encode())
+        sig: str = self._b64(hmac.new(self._secret, f"{header}.{payload}".encode(), hashlib.sha256).digest())
+        # 不带Bearer前缀,与TokenRefresher解析exp的格式一致
+        return f"{header}.{payload}.{sig}"
+
+    def _verify_token(self, auth: str) -> dict | None:
+        token: str = auth[len("Bearer "):] if auth.startswith("Bearer ") else auth
+        parts: list = token.split(".")
+        if len(parts) != 3: return
+        sig: str = self._b64(hmac.new(self._secret, f"{parts[0]}.{parts[1]}".encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(sig, parts[2]): return
+        try:
+            payload: dict = json.loads(base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4)))
+        except ValueError:
+            return
+        if payload.get("exp", 0) < time.time(): return
+        return payload
+
+    @staticmethod
+    def _reply(start_response: Callable, status: str, code: int, message: str, data: dict | None) -> Iterable[bytes]:
+        body: bytes = json.dumps({"code": code, "message": message, "data": data}, ensure_ascii=False).encode("utf-8")
+        start_response(status, [("Content-Type", "application/json; charset=utf-8"), ("Content-Length", str(len(body)))])
+        return [body]
+
+    def _app(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+        delay: float = self._latency()
+        if delay > 0: gevent.sleep(delay)
+        if self._error_rate > 0 and self._rng.random() < self._error_rate:
+            self._stats["error"] += 1
+            return self._reply(start_response, "500 Internal Server Error", 500, "模拟服务异常", None)
+        path: str = environ.get("PATH_INFO", "")
+        method: str = environ.get("REQUEST_METHOD", "GET")
+        if path == ActionEnum.LOGIN_TEST.value and method == "POST":
+            try:
+                length: int = int(environ.get("CONTENT_LENGTH") or 0)
+                body: dict = json.loads(environ["wsgi.input"].read(length) or b"{}")
+            except ValueError:
+                return self._reply(start_response, "400 Bad Request", 400, "请求体不是json", None)
+            phone: str = str(body.get("phone", ""))
+            if not phone or not body.get("password"):
+                return self._reply(start_response, "400 Bad Request", 400, "账号或密码为空", None)
+            self._stats["login"] += 1
+            return self._reply(start_response, "200 OK", ServerEnum.SUCCESS.value, "success", {"token": self._issue_token(phone)})
+        if path == ActionEnum.USER_INFO.value and method == "GET":
+            # wsgi中请求头名称转为大写并加HTTP_前缀
+            auth: str = environ.get(f"HTTP_{NosqlEnum.AUTHORIZATION.value.upper()}", "")
+            payload: dict | None = self._verify_token(auth)
+            if payload is None:
+                self._stats["unauthorized"] += 1
+                return self._reply(start_response, "401 Unauthorized", 401, "token无效或已过期", None)
+            self._stats["info"] += 1
+            return self._reply(start_response, "200 OK", ServerEnum.SUCCESS.value, "success", {"phone": payload.get("sub"), "payload": self._payload})
+        return self._reply(start_response, "404 Not Found", 404, "接口不存在", None)
+
+    def start(self) -> None:
+        self._server = WSGIServer((self._host, self._port), self._app, log=None)
+        self._server.start()
+        # 端口为0时由系统分配,记录实际监听的端口
+        self._port = self._server.server_port
+        self._e.info(
+            "%s 模拟服务已启动: %s, 延迟分布: %s, 错误率: %s, token有效期: %ss, 填充字节数: %s",
+            LogLabelEnum.GREENLIGHT.value,
+            self.url,
+            self._latency_spec,
+            self._error_rate,
+            self._token_ttl,
+            len(self._payload)
+        )
+
+    def serve_forever(self) -> None:
+        if self._server is None: self.start()
+        self._server.serve_forever() # type: ignore
+
+    def stop(self) -> None:
+        if self._server is None: return
+        self._server.stop()
+        self._server = None
+        self._e.info("%s 模拟服务已停止,请求统计: %s", LogLabelEnum.REDLIGHT.value, self._stats)
+
+# 在项目根目录执行: python -m utils.mock_server,压测时把LQZENTAOHOST指向该地址
+if __name__ == "__main__":
+    MockServer().serve_forever()
@@ -1,5 +1,6 @@
+import os
 import json
-import copy
+import atexit
 import threading
 
 from pathlib import Path
@@ -7,10 +8,20 @@ from datetime import datetime
 from typing import Optional
 
 from utils.logs import ExceptionLog
-from enums.nosqlEnum import NosqlEnum
+from utils.file import get_env_val
+from utils.sqlite_nosql import SqliteNosqlCore
+from enums.nosqlEnum import NosqlEnum, NosqlStorageEnum
 from template.nosqlTemplate import UserData, MetaUserData
 
 class NosqlCore:
+    '''
+    缓存数据库核心类
+    1.启动时加载一次json文件,之后内存字典是唯一可信数据源,读操作不访问磁盘
+    2.维护Authorization -> 用户名的索引,按token查用户无需遍历
+    3.写操作只标记脏数据,由后台刷盘线程按时间间隔或脏数据数量批量落盘
+    4.journal模式下每次写操作只追加一条日志记录,后台线程分组fsync,
+      日志记录数达到阈值后压缩为快照.启动时由快照 + 日志尾部重建数据
+    '''
     __instance: Optional['NosqlCore'] = None
     __lock: threading.Lock = threading.Lock()
 
@@ -24,20 +35,45 @@ class NosqlCore:
 
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance(),
+        e: ExceptionLog | None = None,
+        flush_interval: float | None = None,
+        flush_dirty_count: int | None = None,
+        storage: str | None = None,
+        compact_records: int | None = None,
+        data_dir: str | None = None
     ) -> None:
         if hasattr(self, "__initialized") and self.__initialized:
             return
         else:
-            self._e: ExceptionLog = e
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
             self._data_folder: str = "nosql"
+            # 数据目录 - 参数优先,其次读取环境变量,默认为项目根目录下的nosql
+            self._data_dir: str = data_dir or get_env_val("NOSQL_DATA_DIR")
             self._data_file: str = "user_data.json"
+            self._journal_data_file: str = "user_data.journal"
+            self._storage: NosqlStorageEnum = NosqlStorageEnum.get_storage(storage or get_env_val("NOSQL_STORAGE") or NosqlStorageEnum.JSON.value)
+            # 刷盘配置 - 参数优先,其次读取环境变量
+            self._flush_interval: float = float(flush_interval or get_env_val("NOSQL_FLUSH_INTERVAL") or 1.0)
+            self._flush_dirty_count: int = int(flush_dirty_count or get_env_val("NOSQL_FLUSH_DIRTY_COUNT") or 500)
+            self._data_lock: threading.RLock = threading.RLock()
+            self._flush_event: threading.Event = threading.Event()
+            self._dirty_keys: set = set()
+            self._auth_index: dict = {}
+            # journal模式配置 - 日志记录数达到阈值后触发压缩
+            self._compact_records: int = int(compact_records or get_env_val("NOSQL_COMPACT_RECORDS") or 10000)
+            self._journal_records: int = 0
+            # 日志文件的落盘与压缩互斥,压缩替换文件对象时不会有进行中的fsync
+            self._journal_io_lock: threading.RLock = threading.RLock()
             self._init_nosql()
+            self._load_nosql_data()
+            if self._storage == NosqlStorageEnum.JOURNAL: self._init_journal()
+            self._start_flusher()
+            atexit.register(self._flush_nosql_data)
             self.__initialized: bool = True
 
     def _init_nosql(self) -> None:
-        target_path: Path = Path(__file__).parent.parent / self._data_folder
-        if not target_path.exists(): target_path.mkdir()
+        target_path: Path = Path(self._data_dir) if self._data_dir else Path(__file__).parent.parent / self._data_folder
+        if not target_path.exists(): target_path.mkdir(parents=True)
         nosql_file: Path = target_path / self._data_file
         if not nosql_file.exists():
             nosql_file.touch()
@@ -47,41 +83,197 @@ class NosqlCore:
             self._e.info("缓存数据库已存在")
         self._nosql_file: str = str(nosql_file)
 
+    def _load_nosql_data(self) -> None:
+        try:
+            with open(self._nosql_file, "r", encoding="utf-8") as f: n_data: dict = json.load(f)
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库加载数据失败,失败原因: %s", e)
+            n_data: dict = {}
+        with self._data_lock:
+            self._nosql_data: dict = n_data
+            self._auth_index.clear()
+            for k, v in n_data.items():
+                auth: str | None = v.get(NosqlEnum.AUTHORIZATION.value)
+                if auth: self._auth_index[auth] = k
+        self._e.info("缓存数据库加载数据完成,用户数: %s", len(n_data))
+
+    def _start_flusher(self) -> None:
+        flusher: threading.Thread = threading.Thread(
+            target=self._flush_loop,
+            name="NosqlFlusher",
+            daemon=True
+        )
+        flusher.start()
+
+    def _flush_loop(self) -> None:
+        while True:
+            # 到达刷盘间隔或脏数据数量达到阈值时被唤醒
+            self._flush_event.wait(self._flush_interval)
+            self._flush_event.clear()
+            if self._dirty_keys: self._flush_nosql_data()
+
+    def _mark_dirty(self, key: str) -> None:
+        if self._storage == NosqlStorageEnum.JOURNAL: self._append_journal(key)
+        self._dirty_keys.add(key)
+        if len(self._dirty_keys) >= self._flush_dirty_count: self._flush_event.set()
+
+    def _index_auth(self, key: str, old: dict | None, new: dict | None) -> None:
+        old_auth: str | None = old.get(NosqlEnum.AUTHORIZATION.value) if old else None
+        new_auth: str | None = new.get(NosqlEnum.AUTHORIZATION.value) if new else None
+        if old_auth and self._auth_index.get(old_auth) == key: self._auth_index.pop(old_auth, None)
+        if new_auth: self._auth_index[new_auth] = key
+
+    def _flush_nosql_data(self) -> bool:
+        if self._storage == NosqlStorageEnum.JOURNAL: return self._sync_journal()
+        # 持锁只做浅拷贝,序列化和写文件在锁外完成
+        with self._data_lock:
+            if not self._dirty_keys: return True
+            dirty_count: int = len(self._dirty_keys)
+            snapshot: dict = {k: v.copy() for k, v in self._nosql_data.items()}
+            self._dirty_keys.clear()
+        if self._write_nosql_data(snapshot):
+            self._e.info("缓存数据库批量刷盘完成,脏数据数: %s", dirty_count)
+            return True
+        # 写入失败重新标记,等待下一次刷盘
+        with self._data_lock: self._dirty_keys.update(snapshot.keys())
+        return False
+
     def _write_nosql_data(self, data: dict) -> bool:
         try:
-            with self.__lock:
-                with open(self._nosql_file, "w", encoding="utf-8") as f: json.dump(data, f, ensure_ascii=False, indent=4)
-            self._e.info("缓存数据库写入数据成功")
+            tmp_file: str = f"{self._nosql_file}.tmp"
+            with NosqlCore.__lock:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+                    f.flush()
+                    os.fsync(f.fileno())
+                # 先写临时文件再替换,避免刷盘中途崩溃损坏数据文件
+                os.replace(tmp_file, self._nosql_file)
             return True
         except Exception as e:
             self._e.handle_exception(e)
             self._e.error("缓存数据库写入数据失败,失败原因: %s", e)
             return False
 
-    def _get_nosql_data(self) -> dict | None:
-        if not hasattr(self, "_nosql_data"): self._init_nosql()
+    def _init_journal(self) -> None:
+        journal_file: Path = Path(self._nosql_file).with_name(self._journal_data_file)
+        self._journal_file: str = str(journal_file)
+        self._sealed_journal_file: str = f"{self._journal_file}.sealed"
+        # 快照之后依次回放上次压缩未完成的日志和当前日志
+        replay_count: int = 0
+        for f_name in (self._sealed_journal_file, self._journal_file):
+            replay_count += self._replay_journal(f_name)
+        self._journal_records = replay_count
+        self._journal_fp = open(self._journal_file, "a", encoding="utf-8")
+        # 残留的半行记录补齐换行,避免和新追加的记录粘连
+        if self._journal_fp.tell() > 0:
+            with open(self._journal_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n": self._journal_fp.write("\n")
+        self._e.info("缓存数据库日志模式已启用,回放日志记录数: %s", replay_count)
+        # 存在未完成的压缩或日志过长时,启动后立即压缩
+        if os.path.exists(self._sealed_journal_file) or replay_count >= self._compact_records:
+            self._compact_journal()
+
+    def _replay_journal(self, journal_file: str) -> int:
+        if not os.path.exists(journal_file): return 0
+        replay_count: int = 0
+        with open(journal_file, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record: dict = json.loads(line)
+                except ValueError:
+                    # 崩溃时可能残留半行记录,直接跳过
+                    self._e.info("缓存数据库日志存在损坏记录,已跳过")
+                    continue
+                key: str = record.get("k", "")
+                old: dict | None = self._nosql_data.get(key)
+                if record.get("op") == "del":
+                    self._nosql_data.pop(key, None)
+                    self._index_auth(key, old, None)
+                else:
+                    self._nosql_data[key] = record.get("v", {})
+                    self._index_auth(key, old, self._nosql_data[key])
+                replay_count += 1
+        return replay_count
+
+    def _append_journal(self, key: str) -> None:
+        # 每条记录保存用户的完整数据,回放时幂等
+        record: dict | None = self._nosql_data.get(key)
+        if record is None: line: str = json.dumps({"op": "del", "k": key}, ensure_ascii=False)
+        else: line: str = json.dumps({"op": "set", "k": key, "v": record}, ensure_ascii=False)
+        self._journal_fp.write(line + "\n")
+        self._journal_records += 1
+        if self._journal_records >= self._compact_records: self._flush_event.set()
+
+    def _sync_journal(self) -> bool:
         try:
-            with open(self._nosql_file, "r", encoding="utf-8") as f: n_data: dict = json.load(f)
-            return copy.deepcopy(n_data) # 返回深拷贝
+            with self._journal_io_lock:
+                with self._data_lock:
+                    dirty_count: int = len(self._dirty_keys)
+                    self._dirty_keys.clear()
+                    self._journal_fp.flush()
+                    fileno: int = self._journal_fp.fileno()
+                    need_compact: bool = self._journal_records >= self._compact_records
+                # 分组fsync - 一次系统调用落盘这一批的所有记录,只释放数据锁,写操作可以继续追加
+                os.fsync(fileno)
+            if dirty_count: self._e.info("缓存数据库日志分组落盘完成,记录数: %s", dirty_count)
+            if need_compact: return self._compact_journal()
+            return True
         except Exception as e:
             self._e.handle_exception(e)
-            self._e.error("缓存数据库获取数据失败,失败原因: %s", e)
-            return
+            self._e.error("缓存数据库日志落盘失败,失败原因: %s", e)
+            return False
+
+    def _compact_journal(self) -> bool:
+        # 持数据锁封存当前日志并拷贝快照,写快照在数据锁外完成,不阻塞写操作;
+        # 整个压缩过程持有日志锁,与落盘和另一次压缩互斥
+        with self._journal_io_lock:
+            with self._data_lock:
+                self._journal_fp.flush()
+                os.fsync(self._journal_fp.fileno())
+                self._journal_fp.close()
+                if os.path.exists(self._sealed_journal_file):
+                    # 上次压缩未完成,把当前日志合并到已封存的日志之后
+                    with open(self._sealed_journal_file, "a", encoding="utf-8") as sealed, open(self._journal_file, "r", encoding="utf-8") as curr:
+                        for line in curr: sealed.write(line)
+                    os.remove(self._journal_file)
+                else:
+                    os.replace(self._journal_file, self._sealed_journal_file)
+                self._journal_fp = open(self._journal_file, "a", encoding="utf-8")
+                compact_count: int = self._journal_records
+                self._journal_records = 0
+                snapshot: dict = {k: v.copy() for k, v in self._nosql_data.items()}
+            if not self._write_nosql_data(snapshot):
+                self._e.error("缓存数据库日志压缩失败,保留已封存日志等待重试")
+                return False
+            os.remove(self._sealed_journal_file)
+        self._e.info("缓存数据库日志压缩完成,压缩记录数: %s, 用户数: %s", compact_count, len(snapshot))
+        return True
+
+    def _get_nosql_data(self) -> dict | None:
+        # 记录值均为不可变类型,逐条浅拷贝即可隔离调用方的修改
+        with self._data_lock: return {k: v.copy() for k, v in self._nosql_data.items()}
+
+    def _has_nosql_key(self, key: str) -> bool:
+        return str(key) in self._nosql_data
+
+    def _get_nosql_record(self, key: str) -> dict | None:
+        with self._data_lock:
+            record: dict | None = self._nosql_data.get(str(key))
+            return record.copy() if record is not None else None
+
+    def _get_nosql_auth(self, key: str) -> str | None:
+        record: dict | None = self._nosql_data.get(str(key))
+        if record is None: return None
+        return record.get(NosqlEnum.AUTHORIZATION.value)
 
     def _get_nosql_data_by_auth(self, key: str) -> dict | None:
-        if not hasattr(self, "_nosql_data"): self._init_nosql()
-        try:
-            with open(self._nosql_file, "r", encoding="utf-8") as f: n_data: dict = json.load(f)
-            if not n_data: return
-            res: dict = {}
-            for k, v in n_data.items():
-                if v.get("Authorization") != key: continue
-                else: res.setdefault(k, v)
-            return copy.deepcopy(res)
-        except Exception as e:
-            self._e.handle_exception(e)
-            self._e.error("缓存数据库获取数据失败,失败原因: %s", e)
-            return
+        with self._data_lock:
+            if not self._nosql_data: return
+            username: str | None = self._auth_index.get(key)
+            if username is None or username not in self._nosql_data: return {}
+            return {username: self._nosql_data[username].copy()}
 
     def _insert_nosql_data(self, data: UserData) -> bool:
         # 直接插入缓存数据库.如果数据存在那么直接覆盖.login_time直接更新
@@ -89,25 +281,46 @@ class NosqlCore:
             self._e.error("数据库插入数据类型错误, 需要类型: %s, 实际类型: %s", type(UserData), type(data))
             return False
         try:
-            nosql_data: dict | None = self._get_nosql_data()
-            if nosql_data is None: return False
             tmp_meta_data: dict = data.metadata.info
             tmp_meta_data.update({NosqlEnum.LOGIN_TIME.value: str(datetime.now().isoformat())})
             tmp_meta_data.update({NosqlEnum.UPDATE_TIME.value: str(datetime.now().isoformat())})
-            nosql_data.update({str(data.key): tmp_meta_data})
+            with self._data_lock:
+                self._index_auth(str(data.key), self._nosql_data.get(str(data.key)), tmp_meta_data)
+                self._nosql_data[str(data.key)] = tmp_meta_data
+                self._mark_dirty(str(data.key))
             self._e.info("缓存数据库插入数据成功,时间: %s", str(datetime.now().isoformat()))
-            return self._write_nosql_data(nosql_data)
+            return True
         except Exception as e:
             self._e.handle_exception(e)
             self._e.error("缓存数据库插入数据失败,失败原因: %s, 时间: %s", e, str(datetime.now().isoformat()))
             return False
 
+    def _insert_nosql_data_many(self, data: list) -> int:
+        # 批量插入,一次加锁完成整批写入,返回插入成功的数量
+        insert_count: int = 0
+        login_time: str = str(datetime.now().isoformat())
+        with self._data_lock:
+            for item in data:
+                if not isinstance(item, UserData):
+                    self._e.error("数据库插入数据类型错误, 需要类型: %s, 实际类型: %s", type(UserData), type(item))
+                    continue
+                tmp_meta_data: dict = item.metadata.info
+                tmp_meta_data.update({NosqlEnum.LOGIN_TIME.value: login_time, NosqlEnum.UPDATE_TIME.value: login_time})
+                self._index_auth(str(item.key), self._nosql_data.get(str(item.key)), tmp_meta_data)
+                self._nosql_data[str(item.key)] = tmp_meta_data
+                self._mark_dirty(str(item.key))
+                insert_count += 1
+        self._e.info("缓存数据库批量插入数据成功,数量: %s, 时间: %s", insert_count, login_time)
+        return insert_count
+
     def _delete_nosql_data(self, key: str) -> bool:
         try:
-            nosql_data: dict | None = self._get_nosql_data()
-            if nosql_data is None: return False
-            nosql_data.pop(key, None)
-            return self._write_nosql_data(nosql_data)
+            with self._data_lock:
+                old: dict | None = self._nosql_data.pop(str(key), None)
+                if old is None: return True
+                self._index_auth(str(key), old, None)
+                self._mark_dirty(str(key))
+            return True
         except Exception as e:
             self._e.handle_exception(e)
             self._e.error("缓存数据库删除数据失败,失败原因: %s", e)
@@ -118,74 +331,149 @@ class NosqlCore:
             if not key:
                 self._e.error("键值不能为空")
                 return False
-            nosql_data: dict | None = self._get_nosql_data()
-            if nosql_data is None:
-                self._e.error("缓存数据库无数据")
-                return False
-            if nosql_data.get(str(key)) is None:
-                self._e.info("用户数据不存在")
-                return False
-            temp_mod_data: dict | None = nosql_data.get(str(key)) # 这里必须进行类型转换才可以设置时间
-            if temp_mod_data is None:
-                self._e.error("无法获取用户数据，键值: %s", key)
-                return False
-            if not isinstance(temp_mod_data, dict):
-                self._e.error("数据格式错误,期望dict类型,实际类型: %s", type(temp_mod_data))
-                return False
-            tmp_login_time: str | None = temp_mod_data.get(NosqlEnum.LOGIN_TIME.value) # type: ignore
-            temp_mod_data.update(data.info)
-            temp_mod_data.update({NosqlEnum.LOGIN_TIME.value: tmp_login_time})
-            temp_mod_data.update({NosqlEnum.UPDATE_TIME.value: str(datetime.now().isoformat())})
-            return self._write_nosql_data(nosql_data)
+            with self._data_lock:
+                if not self._nosql_data:
+                    self._e.error("缓存数据库无数据")
+                    return False
+                temp_mod_data: dict | None = self._nosql_data.get(str(key))
+                if temp_mod_data is None:
+                    self._e.info("用户数据不存在")
+                    return False
+                if not isinstance(temp_mod_data, dict):
+                    self._e.error("数据格式错误,期望dict类型,实际类型: %s", type(temp_mod_data))
+                    return False
+                old_data: dict = temp_mod_data.copy()
+                tmp_login_time: str | None = temp_mod_data.get(NosqlEnum.LOGIN_TIME.value) # type: ignore
+                temp_mod_data.update(data.info)
+                temp_mod_data.update({NosqlEnum.LOGIN_TIME.value: tmp_login_time})
+                temp_mod_data.update({NosqlEnum.UPDATE_TIME.value: str(datetime.now().isoformat())})
+                self._index_auth(str(key), old_data, temp_mod_data)
+                self._mark_dirty(str(key))
+            return True
         except Exception as e:
             self._e.handle_exception(e)
             self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
             return False
 
-    def _update_nosql_data_by_key(self, key: str, field: str, val: str) -> bool:
+    def _update_nosql_data_by_key(self, key: str, field: str, val: str | bool) -> bool:
         try:
             if not key or not field: return False
-            nosql_data: dict | None = self._get_nosql_data()
-            if nosql_data is None: return False
             if not NosqlEnum.is_in_nosql_field(field):
                 self._e.error("修改字段不存在")
                 return False
             if field == NosqlEnum.LOGIN_TIME.value:
                 self._e.error("登录时间不可修改")
                 return False
-            tmp_mod_data: dict | None = nosql_data.get(str(key))
-            if tmp_mod_data is None:
-                self._e.error("用户数据不存在")
-                return False
-            else:
-                tmp_mod_data.update({field: val})
-                return self._write_nosql_data(nosql_data)
+            with self._data_lock:
+                tmp_mod_data: dict | None = self._nosql_data.get(str(key))
+                if tmp_mod_data is None:
+                    self._e.error("用户数据不存在")
+                    return False
+                else:
+                    old_data: dict = tmp_mod_data.copy()
+                    tmp_mod_data.update({field: val})
+                    self._index_auth(str(key), old_data, tmp_mod_data)
+                    self._mark_dirty(str(key))
+                    return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
+            return False
+
+    def _refresh_nosql_auth(self, key: str, auth: str) -> bool:
+        '''
+        重新登录后替换token,login_time和update_time一并刷新,占用状态和租约保持不变
+        '''
+        try:
+            if not key or not auth: return False
+            now: str = str(datetime.now().isoformat())
+            with self._data_lock:
+                tmp_mod_data: dict | None = self._nosql_data.get(str(key))
+                if tmp_mod_data is None:
+                    self._e.error("用户数据不存在")
+                    return False
+                old_data: dict = tmp_mod_data.copy()
+                tmp_mod_data.update({
+                    NosqlEnum.AUTHORIZATION.value: auth,
+                    NosqlEnum.LOGIN_TIME.value: now,
+                    NosqlEnum.UPDATE_TIME.value: now
+                })
+                self._index_auth(str(key), old_data, tmp_mod_data)
+                self._mark_dirty(str(key))
+                return True
         except Exception as e:
             self._e.handle_exception(e)
             self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
             return False
 
+    def _get_idle_nosql_keys(self, limit: int, exclude: set | None = None) -> list:
+        # 找到足够数量的空闲用户即停止遍历
+        res: list = []
+        if limit <= 0: return res
+        with self._data_lock:
+            for k, v in self._nosql_data.items():
+                if v.get(NosqlEnum.STATUS.value) or not v.get(NosqlEnum.AUTHORIZATION.value): continue
+                if exclude and k in exclude: continue
+                res.append(k)
+                if len(res) >= limit: break
+        return res
+
+    def _update_nosql_status_many(self, keys: list, status: bool, lease_expire: str | None = None) -> dict:
+        # 批量修改占用状态和租约到期时间,仅修改状态确实发生变化的用户,返回 用户名 -> Authorization
+        res: dict = {}
+        try:
+            update_time: str = str(datetime.now().isoformat())
+            with self._data_lock:
+                for key in keys:
+                    tmp_mod_data: dict | None = self._nosql_data.get(str(key))
+                    if tmp_mod_data is None or bool(tmp_mod_data.get(NosqlEnum.STATUS.value)) == status: continue
+                    tmp_mod_data.update({
+                        NosqlEnum.STATUS.value: status,
+                        NosqlEnum.LEASE_EXPIRE.value: lease_expire,
+                        NosqlEnum.UPDATE_TIME.value: update_time
+                    })
+                    self._mark_dirty(str(key))
+                    res[str(key)] = tmp_mod_data.get(NosqlEnum.AUTHORIZATION.value)
+            return res
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库批量更新占用状态失败,失败原因: %s", e)
+            return res
+
+    def _update_nosql_lease_many(self, leases: dict) -> int:
+        # 续写占用中用户的租约到期时间,占用状态不变.leases为 用户名 -> 到期时间,返回更新的数量
+        update_count: int = 0
+        update_time: str = str(datetime.now().isoformat())
+        with self._data_lock:
+            for key, lease_expire in leases.items():
+                tmp_mod_data: dict | None = self._nosql_data.get(str(key))
+                if tmp_mod_data is None or not tmp_mod_data.get(NosqlEnum.STATUS.value): continue
+                tmp_mod_data.update({NosqlEnum.LEASE_EXPIRE.value: lease_expire, NosqlEnum.UPDATE_TIME.value: update_time})
+                self._mark_dirty(str(key))
+                update_count += 1
+        return update_count
+
 class NosqlOperator:
     def __init__(self) -> None:
         raise RuntimeError("操作类不允许通过构造器实例化")
 
     @classmethod
-    def create(cls) -> 'NosqlOperator':
-        nosql_core: NosqlCore = NosqlCore.get_instance()
+    def create(cls, storage: str | None = None) -> 'NosqlOperator':
+        # 按配置选择后端 - sqlite使用独立的核心类,json/journal共用NosqlCore
+        tmp_storage: NosqlStorageEnum = NosqlStorageEnum.get_storage(storage or get_env_val("NOSQL_STORAGE") or NosqlStorageEnum.JSON.value)
+        if tmp_storage == NosqlStorageEnum.SQLITE: nosql_core: NosqlCore | SqliteNosqlCore = SqliteNosqlCore.get_instance()
+        else: nosql_core: NosqlCore | SqliteNosqlCore = NosqlCore.get_instance()
         nosql_op: NosqlOperator = cls.__new__(cls)
-        nosql_op._nosql_core: NosqlCore = nosql_core # type: ignore
+        nosql_op._nosql_core: NosqlCore | SqliteNosqlCore = nosql_core # type: ignore
         return nosql_op
 
     def in_nosql(self, key: str) -> bool:
         if not key: return False
-        temp_nosql_data: dict | None = self._nosql_core._get_nosql_data() # type: ignore
-        if temp_nosql_data is None: return False
-        return str(key) in temp_nosql_data
+        return self._nosql_core._has_nosql_key(key) # type: ignore
 
     def get_auth(self, key: str) -> str | None:
-        if not self.in_nosql(key): return None
-        tmp_data: dict = self._nosql_core._get_nosql_data() # type: ignore
-        return tmp_data.get(str(key)).get("Authorization") # type: ignore
+        if not key: return None
+        return self._nosql_core._get_nosql_auth(key) # type: ignore
 
     def get_data_by_auth(self, auth: str) -> dict | None:
         return self._nosql_core._get_nosql_data_by_auth(auth) # type: ignore
@@ -194,10 +482,8 @@ class NosqlOperator:
         return self._nosql_core._get_nosql_data() # type: ignore
 
     def get_some_nosql_data(self, key: str) -> dict | None:
-        if not self.in_nosql(key): return None
-        tmp_data: dict = self._nosql_core._get_nosql_data() # type: ignore
-        if tmp_data is None: return None
-        res_data: dict | None = tmp_data.get(str(key))
+        if not key: return None
+        res_data: dict | None = self._nosql_core._get_nosql_record(key) # type: ignore
         if res_data is None: return None
         else: res_data.setdefault("username", key)
         return res_data
@@ -205,11 +491,32 @@ class NosqlOperator:
     def update(self, key: str, data: MetaUserData) -> bool:
         return self._nosql_core._update_nosql_data(key, data) # type: ignore
 
-    def update_by_key(self, key: str, field: str, val: str) -> bool:
+    def update_by_key(self, key: str, field: str, val: str | bool) -> bool:
         return self._nosql_core._update_nosql_data_by_key(key, field, val) # type: ignore
 
+    def refresh_auth(self, key: str, auth: str) -> bool:
+        return self._nosql_core._refresh_nosql_auth(key, auth) # type: ignore
+
     def delete(self, key: str) -> bool:
         return self._nosql_core._delete_nosql_data(key) # type: ignore
 
     def insert(self, data: UserData) -> bool:
         return self._nosql_core._insert_nosql_data(data) # type: ignore
+
+    def insert_many(self, data: list) -> int:
+        if not data: return 0
+        return self._nosql_core._insert_nosql_data_many(data) # type: ignore
+
+    def get_idle_keys(self, limit: int, exclude: set | None = None) -> list:
+        return self._nosql_core._get_idle_nosql_keys(limit, exclude) # type: ignore
+
+    def update_status_many(self, keys: list, status: bool, lease_expire: str | None = None) -> dict:
+        if not keys: return {}
+        return self._nosql_core._update_nosql_status_many(keys, status, lease_expire) # type: ignore
+
+    def update_lease_many(self, leases: dict) -> int:
+        if not leases: return 0
+        return self._nosql_core._update_nosql_lease_many(leases) # type: ignore
+
+    def flush(self) -> bool:
+        return self._nosql_core._flush_nosql_data() # type: ignore
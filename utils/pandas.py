@@ -1,19 +1,176 @@
 import os
-import copy
+import math
+import queue
+import shutil
 import threading
 import pandas as pd
 
 from typing import Optional
 from utils.logs import ExceptionLog
+from utils.file import get_env_val
+from enums.loglabelEnum import LogLabelEnum
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # pyarrow为可选依赖,未安装时只支持csv流式写出
+    pa = None
+    pq = None
+
+_STREAM_STOP: object = object()
+
+class ResultStreamWriter:
+    '''
+    后台线程把结果分块追加写入磁盘
+    1.csv - 追加写入,只在第一个分块写表头
+    2.parquet - 每个分块写成一个row group,需要安装pyarrow
+    3.待写分块放在有界队列中,写盘跟不上时生产方阻塞,内存占用不超过max_pending个分块
+    列以第一个分块为准,之后分块缺少的列补空值,多出的列丢弃
+    '''
+    def __init__(
+        self,
+        file_path: str,
+        e: ExceptionLog | None = None,
+        fmt: str | None = None,
+        max_pending: int | None = None
+    ) -> None:
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._file_path: str = file_path
+        self._fmt: str = (fmt or os.path.splitext(file_path)[1].lstrip(".") or "csv").lower()
+        self._max_pending: int = int(max_pending or get_env_val("RESULT_STREAM_PENDING") or 4)
+        self._queue: queue.Queue = queue.Queue(maxsize=self._max_pending)
+        self._columns: list | None = None
+        self._dropped: set = set()
+        self._parquet_writer = None
+        self._schema = None
+        self._coerce_logged: bool = False
+        self._rows: int = 0
+        self._failed: bool = False
+        self._thread: threading.Thread | None = None
+
+    @property
+    def file_path(self) -> str:
+        return self._file_path
+
+    @property
+    def rows(self) -> int:
+        return self._rows
+
+    def start(self) -> bool:
+        if self._fmt not in ("csv", "parquet"):
+            self._e.error("%s 不支持的流式写出格式: %s", LogLabelEnum.ERROR.value, self._fmt)
+            return False
+        if self._fmt == "parquet" and pq is None:
+            self._e.error("%s 未安装pyarrow,无法流式写出parquet文件", LogLabelEnum.ERROR.value)
+            return False
+        os.makedirs(os.path.dirname(os.path.abspath(self._file_path)), exist_ok=True)
+        # 每次写出都从空文件开始,避免追加到上一次运行的结果后面
+        if os.path.exists(self._file_path): os.remove(self._file_path)
+        self._thread = threading.Thread(target=self._write_loop, name="result-stream-writer", daemon=True)
+        self._thread.start()
+        self._e.info("%s 结果流式写出已启动,格式: %s, 文件: %s", LogLabelEnum.SUCCESS.value, self._fmt, self._file_path)
+        return True
+
+    def put(self, chunk: pd.DataFrame) -> None:
+        # 队列满时阻塞,对生产方形成背压
+        self._queue.put(chunk)
+
+    def close(self) -> bool:
+        if self._thread is None: return False
+        self._queue.put(_STREAM_STOP)
+        self._thread.join()
+        self._thread = None
+        self._e.info("%s 结果流式写出结束,共写入: %s 行, 文件: %s", LogLabelEnum.SUCCESS.value, self._rows, self._file_path)
+        return not self._failed
+
+    def _write_loop(self) -> None:
+        while True:
+            chunk = self._queue.get()
+            if chunk is _STREAM_STOP: break
+            if self._failed: continue # 写出失败后继续消费队列,避免生产方阻塞
+            try:
+                self._write_chunk(chunk)
+            except Exception as e:
+                self._failed = True
+                self._e.handle_exception(e)
+                self._e.error("%s 结果分块写出失败,之后的分块不再写入: %s", LogLabelEnum.ERROR.value, self._file_path)
+        if self._parquet_writer is not None:
+            try:
+                self._parquet_writer.close()
+            except Exception as e:
+                self._e.handle_exception(e)
+            self._parquet_writer = None
+
+    def _write_chunk(self, chunk: pd.DataFrame) -> None:
+        is_first: bool = self._columns is None
+        if is_first: self._columns = list(chunk.columns)
+        else:
+            extra: list = [c for c in chunk.columns if c not in self._columns and c not in self._dropped]
+            if extra:
+                self._dropped.update(extra)
+                self._e.info("%s 分块中出现新列,流式写出时丢弃: %s", LogLabelEnum.WARNING.value, extra)
+            chunk = chunk.reindex(columns=self._columns)
+        if self._fmt == "csv":
+            chunk.to_csv(
+                self._file_path,
+                index=False,
+                encoding="utf-8-sig",
+                mode="a",
+                header=is_first
+            )
+        else:
+            if self._parquet_writer is None:
+                self._schema = self._build_schema(chunk)
+                self._parquet_writer = pq.ParquetWriter(self._file_path, self._schema) # type: ignore
+            self._parquet_writer.write_table(self._to_table(chunk))
+        self._rows += len(chunk)
+
+    @staticmethod
+    def _build_schema(chunk: pd.DataFrame):
+        # 以第一个分块推断schema,全部为空值的列推断为null类型,提升为string以容纳之后分块的值
+        schema = pa.Schema.from_pandas(chunk, preserve_index=False) # type: ignore
+        return pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema]) # type: ignore
+
+    def _to_table(self, chunk: pd.DataFrame):
+        try:
+            return pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False) # type: ignore
+        except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError, ValueError): # type: ignore
+            # 列类型与schema不一致时逐列转换为schema中的类型,无法转换的值置空,写出线程不中断
+            coerced: pd.DataFrame = chunk.copy()
+            for field in self._schema: coerced[field.name] = self._coerce_column(coerced[field.name], field.type) # type: ignore
+            if not self._coerce_logged:
+                self._coerce_logged = True
+                self._e.info("%s 分块列类型与首个分块不一致,已按首个分块的类型转换: %s", LogLabelEnum.WARNING.value, self._file_path)
+            return pa.Table.from_pandas(coerced, schema=self._schema, preserve_index=False, safe=False) # type: ignore
+
+    @staticmethod
+    def _coerce_column(col: pd.Series, target) -> pd.Series:
+        if pa.types.is_string(target) or pa.types.is_large_string(target): # type: ignore
+            return col.map(lambda v: None if v is None or (isinstance(v, float) and math.isnan(v)) else str(v)).astype(object)
+        if pa.types.is_integer(target) or pa.types.is_floating(target): # type: ignore
+            numeric: pd.Series = pd.to_numeric(col, errors="coerce")
+            if pa.types.is_floating(target): return numeric.astype(float) # type: ignore
+            return numeric.where(numeric == numeric.round()).astype("Int64")
+        if pa.types.is_boolean(target): # type: ignore
+            return col.map(lambda v: v if isinstance(v, bool) else None).astype(object)
+        if pa.types.is_timestamp(target): # type: ignore
+            return pd.to_datetime(col, errors="coerce")
+        return col
 
 class InsertManager:
     '''
     该类的职责是
     1.专门处理数据插入逻辑
     2.处理数据读取逻辑
+    测试结果按列追加到列表中,均摊O(1);每满chunk_size行生成一个DataFrame分块,
+    保存时只做一次合并
+    开启流式写出后分块交给后台线程写盘,不在内存中保留.开启方式:
+    1.调用start_stream(文件路径),结束时调用stop_stream或save_test_result
+    2.设置环境变量RESULT_STREAM_FILE(.csv或.parquet),创建实例时自动开启
     '''
     __instance: Optional['InsertManager'] = None
-    __lock: threading.Lock = threading.Lock()
+    # 可重入锁 - get_instance持锁创建实例时,__init__中的start_stream会再次加锁
+    __lock: threading.RLock = threading.RLock()
 
     @staticmethod
     async def get_instance() -> 'InsertManager':
@@ -25,51 +182,177 @@ class InsertManager:
 
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance()
+        e: ExceptionLog | None = None,
+        chunk_size: int | None = None
     ) -> None:
         if hasattr(self, "_initialized") and self._initialized:
             return
         else:
-            self._test_result_bf: pd.DataFrame = pd.DataFrame()
-            self._e: ExceptionLog = e
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._chunk_size: int = int(chunk_size or get_env_val("RESULT_CHUNK_SIZE") or 100000)
+            self._columns: dict = {}
+            self._row_count: int = 0
+            self._chunks: list = []
+            self._stream: ResultStreamWriter | None = None
             self._initialized: bool = True
+            stream_file: str = get_env_val("RESULT_STREAM_FILE")
+            if stream_file: self.start_stream(stream_file)
 
     @property
     def is_test_result_bf_empty(self) -> bool:
-        return self._test_result_bf.empty
+        return self._row_count == 0 and not self._chunks
+
+    @property
+    def _test_result_bf(self) -> pd.DataFrame:
+        with InsertManager.__lock:
+            self._seal_chunk()
+            if not self._chunks: return pd.DataFrame()
+            if len(self._chunks) == 1: return self._chunks[0]
+            # 所有分块只合并一次
+            merged: pd.DataFrame = pd.concat(self._chunks, ignore_index=True)
+            self._chunks = [merged]
+            return merged
+
+    def _seal_chunk(self) -> pd.DataFrame | None:
+        # 当前的列缓冲转换为一个DataFrame分块,需要在持锁时调用
+        # 流式写出时返回分块,由调用方在释放锁之后交给写出线程
+        if self._row_count == 0: return
+        chunk: pd.DataFrame = pd.DataFrame(self._columns)
+        self._columns = {}
+        self._row_count = 0
+        if self._stream is not None: return chunk
+        self._chunks.append(chunk)
 
     def _clear_test_result_bf(self) -> None:
-        self._test_result_bf = pd.DataFrame()
+        with InsertManager.__lock:
+            self._columns = {}
+            self._row_count = 0
+            self._chunks = []
 
     def add_test_result_bf(self, result: dict) -> None:
+        '''
+        结果字典的值按引用保存,调用方之后不应再修改其中的可变对象
+        '''
         if not isinstance(result, dict):
             self._e.error("参数类型错误: %s", type(result))
             return
-        temp_dict: dict = copy.deepcopy(result)
         with InsertManager.__lock:
-            new_entry: pd.DataFrame = pd.DataFrame(
-                [temp_dict]
-            )
-            self._test_result_bf = pd.concat(
-                [self._test_result_bf, new_entry],
-                ignore_index=True
-            )
-            self._e.info("添加测试结果: %s", temp_dict)
+            for k, v in result.items():
+                col: list | None = self._columns.get(k)
+                if col is None:
+                    # 新出现的列,之前的行补空值
+                    col = [None] * self._row_count
+                    self._columns[k] = col
+                col.append(v)
+            self._row_count += 1
+            # 本行缺少的列补空值
+            if len(result) != len(self._columns):
+                for col in self._columns.values():
+                    if len(col) < self._row_count: col.append(None)
+            chunk: pd.DataFrame | None = self._seal_chunk() if self._row_count >= self._chunk_size else None
+            stream: ResultStreamWriter | None = self._stream
+        if chunk is not None and stream is not None: stream.put(chunk)
+
+    def start_stream(self, file_path: str, fmt: str | None = None) -> bool:
+        '''
+        开启流式写出,fmt为csv或parquet,默认按文件后缀判断
+        开启前已缓存的结果会先写出
+        '''
+        with InsertManager.__lock:
+            if self._stream is not None:
+                self._e.error("%s 结果流式写出已开启: %s", LogLabelEnum.ERROR.value, self._stream.file_path)
+                return False
+            stream: ResultStreamWriter = ResultStreamWriter(file_path, self._e, fmt)
+            if not stream.start(): return False
+            self._seal_chunk()
+            pending: list = self._chunks
+            self._chunks = []
+            self._stream = stream
+        for chunk in pending: stream.put(chunk)
+        return True
+
+    def stop_stream(self) -> str | None:
+        '''
+        写出剩余结果并等待写出线程结束,返回写出的文件路径,失败时返回None
+        '''
+        with InsertManager.__lock:
+            stream: ResultStreamWriter | None = self._stream
+            if stream is None: return
+            chunk: pd.DataFrame | None = self._seal_chunk()
+            self._stream = None
+        if chunk is not None: stream.put(chunk)
+        if not stream.close(): return
+        return stream.file_path
+
+    def convert_to_excel(self, src_path: str, file_path: str) -> bool:
+        '''
+        把流式写出的csv/parquet文件转换为excel,只作为运行结束后的可选步骤
+        '''
+        df: pd.DataFrame | None = self._read_result_file(src_path)
+        if df is None: return False
+        try:
+            df.to_excel(file_path, index=False, engine="openpyxl")
+        except Exception as e:
+            self._e.handle_exception(e)
+            return False
+        self._e.info("数据已转换为Excel文件: %s", file_path)
+        return True
+
+    def _read_result_file(self, src_path: str) -> pd.DataFrame | None:
+        _, ext = os.path.splitext(src_path)
+        try:
+            match ext.lower():
+                case ".csv": return pd.read_csv(src_path, encoding="utf-8-sig")
+                case ".parquet": return pd.read_parquet(src_path)
+                case _:
+                    self._e.error("不支持的文件格式: %s", ext)
+                    return
+        except Exception as e:
+            self._e.handle_exception(e)
+            return
+
+    def _copy_result_file(self, src_path: str, file_path: str) -> bool:
+        # 流式文件另存为csv,不把整个结果读入内存:csv直接复制文件,parquet按row group逐块转换
+        try:
+            if os.path.splitext(src_path)[1].lower() == ".csv":
+                shutil.copyfile(src_path, file_path)
+                return True
+            if pq is None:
+                self._e.error("%s 未安装pyarrow,无法读取parquet文件", LogLabelEnum.ERROR.value)
+                return False
+            parquet_file = pq.ParquetFile(src_path)
+            with open(file_path, "w", encoding="utf-8-sig", newline="") as f:
+                for i in range(parquet_file.num_row_groups):
+                    parquet_file.read_row_group(i).to_pandas().to_csv(f, index=False, header=i == 0)
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("%s 结果文件另存失败: %s", LogLabelEnum.ERROR.value, file_path)
+            return False
 
     def del_test_result(self) -> None:
         self._clear_test_result_bf()
 
     def save_test_result(self, file_path: str) -> None:
-        if not os.path.exists(file_path):
-            self._e.error("目标文件不存在: %s", file_path)
-            return
-
+        '''
+        开启了流式写出时,先结束流式写出;目标是excel时由流式文件转换,否则结果已在流式文件中
+        '''
         _, ext = os.path.splitext(file_path)
         supported_exts: list = [".xlsx", ".xls", ".csv"]
 
         if ext.lower() not in supported_exts:
             self._e.error("不支持的文件格式: %s", ext)
             return
+        # 目标文件及目录不存在时自动创建
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        if self._stream is not None:
+            stream_path: str | None = self.stop_stream()
+            if stream_path is None or os.path.abspath(stream_path) == os.path.abspath(file_path): return
+            if ext.lower() != ".csv":
+                self.convert_to_excel(stream_path, file_path)
+                return
+            if self._copy_result_file(stream_path, file_path): self._e.info("数据已保存为CSV文件: %s", file_path)
+            return
         match ext.lower():
             case ".csv":
                 self._test_result_bf.to_csv(
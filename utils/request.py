@@ -1,20 +1,104 @@
-import copy
 import requests
+import threading
 
-from typing import Union
+from typing import Optional, Union
 from requests import Response
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from utils.logs import ExceptionLog
 from utils.response import ResponseDiv
+from utils.file import get_env_val
 from enums.loglabelEnum import LogLabelEnum
-from template.httpTemplate import StandardReqDataTemplate, StandardReqHeaderSetTemplate
+from template.httpTemplate import StandardReqDataTemplate
+
+class HttpClientPool:
+    '''
+    进程内共享的http客户端
+    1.keep-alive连接池,请求结束后连接归还池中复用,不再每次新建TCP/TLS连接
+    2.pool_hosts - 缓存连接池的主机数量, pool_size - 每个主机的最大连接数,连接用尽时阻塞等待
+    3.对连接错误和502/503/504按指数退避重试
+    '''
+    __instance: Optional['HttpClientPool'] = None
+    __lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def get_instance() -> 'HttpClientPool':
+        if HttpClientPool.__instance: return HttpClientPool.__instance
+        else:
+            with HttpClientPool.__lock:
+                if not HttpClientPool.__instance: HttpClientPool.__instance = HttpClientPool()
+            return HttpClientPool.__instance
+
+    def __init__(
+        self,
+        e: ExceptionLog | None = None,
+        pool_size: int | None = None,
+        pool_hosts: int | None = None,
+        retries: int | None = None,
+        backoff: float | None = None,
+        timeout: float | None = None
+    ) -> None:
+        if hasattr(self, "__initialized") and self.__initialized:
+            return
+        else:
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._pool_size: int = int(pool_size or get_env_val("HTTP_POOL_SIZE") or 100)
+            self._pool_hosts: int = int(pool_hosts or get_env_val("HTTP_POOL_HOSTS") or 10)
+            self._retries: int = int(retries if retries is not None else (get_env_val("HTTP_RETRIES") or 2))
+            self._backoff: float = float(backoff if backoff is not None else (get_env_val("HTTP_BACKOFF") or 0.2))
+            self._timeout: float = float(timeout or get_env_val("HTTP_TIMEOUT") or 30)
+            self._session: requests.Session = self._create_session()
+            self.__initialized: bool = True
+
+    @property
+    def session(self) -> requests.Session:
+        return self._session
+
+    @property
+    def timeout(self) -> float:
+        return self._timeout
+
+    def _create_session(self) -> requests.Session:
+        retry: Retry = Retry(
+            total=self._retries,
+            connect=self._retries,
+            read=self._retries,
+            backoff_factor=self._backoff,
+            status_forcelist=(502, 503, 504),
+            raise_on_status=False # 重试用尽后返回最后一次响应,由调用方校验状态码
+        )
+        adapter: HTTPAdapter = HTTPAdapter(
+            pool_connections=self._pool_hosts,
+            pool_maxsize=self._pool_size,
+            max_retries=retry,
+            pool_block=True
+        )
+        session: requests.Session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        self._e.info(
+            "%s 初始化http连接池完成,每主机连接数: %s, 主机数: %s, 重试次数: %s",
+            LogLabelEnum.SUCCESS.value,
+            self._pool_size,
+            self._pool_hosts,
+            self._retries
+        )
+        return session
+
+    def close(self) -> None:
+        self._session.close()
 
 class RequestAction:
     def __init__(
         self,
-        e: ExceptionLog = ExceptionLog.get_instance()
+        e: ExceptionLog | None = None,
+        session: requests.Session | None = None
     ) -> None:
-        self._e: ExceptionLog = e
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        # 未传入会话时使用进程内共享的连接池
+        self._client: HttpClientPool = HttpClientPool.get_instance()
+        self._session: requests.Session = session if session is not None else self._client.session
 
     def request_meta(
         self,
@@ -23,21 +107,32 @@ class RequestAction:
     ) -> tuple[Response, Union[dict, str, None], StandardReqDataTemplate] | None:
         '''
         1.仅支持json传参
+        2.请求数据只读不修改,不再拷贝
+        '''
+        resp: tuple | None = self.request_lazy(data, is_ssl)
+        if resp is None: return
+        return resp[0], resp[1].get_serialize_client_resp(), resp[2]
+
+    def request_lazy(
+        self,
+        data: StandardReqDataTemplate,
+        is_ssl: bool = False,
+    ) -> tuple[Response, ResponseDiv, StandardReqDataTemplate] | None:
+        '''
+        与request_meta相同,但响应体不在这里解析,返回ResponseDiv由调用方按需解析
+        状态码不符合预期的响应可以直接丢弃,不需要解析
         '''
-        tmp_data: StandardReqDataTemplate = copy.deepcopy(data)
-        if not isinstance(tmp_data, StandardReqDataTemplate):
+        if not isinstance(data, StandardReqDataTemplate):
             self._e.error("%s 请求数据类型错误,需要的类型为: %s, 实际的类型为: %s", LogLabelEnum.ERROR.value, "StandardReqDataTemplate", type(data))
             return
-        req_kwargs: dict = StandardReqHeaderSetTemplate(
-            url=tmp_data.url,
-            method=tmp_data.method,
-            params=tmp_data.params,
-            headers=tmp_data.headers
-            # ssl=is_ssl
-        ).info
-        req_kwargs.update({"json": tmp_data.body})
-        with requests.request(**req_kwargs) as resp:
+        with self._session.request(
+            method=data.method,
+            url=data.url,
+            params=data.params,
+            headers=data.headers,
+            json=data.body,
+            timeout=self._client.timeout
+            # verify=is_ssl
+        ) as resp:
             if resp.encoding is None: resp.encoding = "utf-8"
-            resp_serialize: ResponseDiv = ResponseDiv(resp)
-            resp_data: Union[dict, str, None] = resp_serialize.get_serialize_client_resp()
-            return resp, resp_data, tmp_data
+            return resp, ResponseDiv(resp), data
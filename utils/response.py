@@ -1,31 +1,42 @@
+import copy
 import json
 
 from requests import Response
-from typing import Generic, TypeVar, Union
+from typing import Any, Callable, Generic, TypeVar, Union
 
 from enums.loglabelEnum import LogLabelEnum
 
 from utils.logs import ExceptionLog
 from utils.file import create_dir
 
+try:
+    import orjson
+    json_loads: Callable[[bytes | str], Any] = orjson.loads
+except ImportError: # orjson为可选依赖,未安装时使用标准库
+    json_loads: Callable[[bytes | str], Any] = json.loads
+
 T = TypeVar("T")
 
+_UNSET: Any = object()
+
 class ResponseDiv(Generic[T]):
     '''
     提供校验响应是否是标准三段式的方法
     提供序列化方法
     校验响应结果是否符合请求预期的方法
+    响应体在第一次访问时才解析,解析结果缓存复用;安装了orjson时直接从字节解码
     '''
     def __init__(
         self,
         data: T,
-        e: ExceptionLog = ExceptionLog.get_instance()
+        e: ExceptionLog | None = None
     ) -> None:
-        self._e: ExceptionLog = e
+        self._e: ExceptionLog = e or ExceptionLog.get_instance()
+        self._parsed: Union[dict, str, None] = _UNSET
         if isinstance(data, Response): self._raw_resp: Response = data
         else:
             self._data: T = data
-            self._serialize_data: dict | str | None = None
+            self._serialize_data: Union[dict, str, None] = _UNSET
 
     @staticmethod
     def is_right_serialize(
@@ -44,18 +55,17 @@ class ResponseDiv(Generic[T]):
 
     @property
     def serialize(self) -> Union[dict, str, None]:
-        if not hasattr(self, "_serialize_data"):
+        if not hasattr(self, "_data"): return self.get_serialize_client_resp()
+        if self._serialize_data is _UNSET:
             self._serialize_data = self._try_serialize()
         return self._serialize_data
 
     def _try_serialize(self) -> Union[dict, str]:
+        # 原生json类型直接拷贝,其余类型才走一次序列化转换
+        if isinstance(self._data, (dict, list)): return copy.deepcopy(self._data) # type: ignore
+        if isinstance(self._data, (str, int, float, bool)) or self._data is None: return self._data # type: ignore
         try:
-            json_str: str = json.dumps(
-                self._data,
-                ensure_ascii=False,
-                indent=4
-            )
-            return json.loads(json_str)
+            return json.loads(json.dumps(self._data, ensure_ascii=False))
         except Exception as e:
             self._e.handle_exception(e)
             return str(self._data)
@@ -68,9 +78,22 @@ class ResponseDiv(Generic[T]):
                 type(self._data)
             )
             return
+        if self._parsed is not _UNSET: return self._parsed
         try:
-            resp_data: dict = self._raw_resp.json()
-            return resp_data
+            self._parsed = json_loads(self._raw_resp.content)
         except Exception as e:
             self._e.handle_exception(e)
-            return self._raw_resp.text
+            self._parsed = self._raw_resp.text
+        return self._parsed
+
+    def get_field(self, path: str, default: Any = None) -> Any:
+        '''
+        按点分路径读取字段,例如 code、data.token.路径不存在或响应不是json对象时返回default
+        这里不是部分解析:第一次调用时仍然完整解码响应体并缓存,之后的读取直接走缓存
+        省下的只是不需要读字段的响应(例如状态码不符合预期)的解码开销
+        '''
+        node: Any = self.get_serialize_client_resp() if hasattr(self, "_raw_resp") else self.serialize
+        for key in path.split("."):
+            if not isinstance(node, dict) or key not in node: return default
+            node = node[key]
+        return node
@@ -0,0 +1,351 @@
+import json
+import sqlite3
+import threading
+
+from pathlib import Path
+from datetime import datetime
+from typing import Optional
+
+from utils.logs import ExceptionLog
+from utils.file import get_env_val
+from enums.nosqlEnum import NosqlEnum
+from template.nosqlTemplate import UserData, MetaUserData
+
+class SqliteNosqlCore:
+    '''
+    基于sqlite3的缓存数据库后端,与NosqlCore提供相同的内部方法,由NosqlOperator按配置选择
+    1.WAL模式,同一台机器上的多个locust worker进程可以安全共享同一份数据
+    2.用户名为主键,Authorization和is_occupancy建立二级索引,查询为O(log n)
+    3.首次启用时自动导入已有的user_data.json数据
+    '''
+    __instance: Optional['SqliteNosqlCore'] = None
+    __lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def get_instance() -> 'SqliteNosqlCore':
+        if SqliteNosqlCore.__instance: return SqliteNosqlCore.__instance
+        else:
+            with SqliteNosqlCore.__lock:
+                if not SqliteNosqlCore.__instance: SqliteNosqlCore.__instance = SqliteNosqlCore()
+            return SqliteNosqlCore.__instance
+
+    def __init__(
+        self,
+        e: ExceptionLog | None = None,
+        busy_timeout: float = 30.0,
+        data_dir: str | None = None
+    ) -> None:
+        if hasattr(self, "__initialized") and self.__initialized:
+            return
+        else:
+            self._e: ExceptionLog = e or ExceptionLog.get_instance()
+            self._data_folder: str = "nosql"
+            self._data_dir: str = data_dir or get_env_val("NOSQL_DATA_DIR")
+            self._data_file: str = "user_data.db"
+            self._json_file: str = "user_data.json"
+            self._table: str = "user_data"
+            self._busy_timeout: float = busy_timeout
+            self._batch_size: int = 500 # 单条sql中IN参数的数量上限
+            # gevent下所有协程共享一个系统线程,使用单连接 + 锁即可
+            self._conn_lock: threading.RLock = threading.RLock()
+            self._init_nosql()
+            self.__initialized: bool = True
+
+    @staticmethod
+    def _columns() -> list:
+        # 表字段与NosqlEnum保持一致,新增字段时自动补列
+        return [field.value for field in NosqlEnum]
+
+    def _init_nosql(self) -> None:
+        target_path: Path = Path(self._data_dir) if self._data_dir else Path(__file__).parent.parent / self._data_folder
+        if not target_path.exists(): target_path.mkdir(parents=True)
+        self._nosql_file: str = str(target_path / self._data_file)
+        self._conn: sqlite3.Connection = sqlite3.connect(
+            self._nosql_file,
+            timeout=self._busy_timeout,
+            isolation_level=None, # 手动控制事务
+            check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            column_sql: str = ", ".join(
+                f'"{col}" INTEGER NOT NULL DEFAULT 0' if col == NosqlEnum.STATUS.value else f'"{col}" TEXT'
+                for col in self._columns()
+            )
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS {self._table} ("username" TEXT PRIMARY KEY, {column_sql})')
+            exist_cols: set = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({self._table})")}
+            for col in self._columns():
+                if col not in exist_cols: self._conn.execute(f'ALTER TABLE {self._table} ADD COLUMN "{col}" TEXT')
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self._table}_auth ON {self._table} ("{NosqlEnum.AUTHORIZATION.value}")')
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self._table}_status ON {self._table} ("{NosqlEnum.STATUS.value}")')
+        self._e.info("缓存数据库(sqlite)初始化完成: %s", self._nosql_file)
+        self._import_json_data(target_path / self._json_file)
+
+    def _import_json_data(self, json_file: Path) -> None:
+        with self._conn_lock:
+            if self._conn.execute(f"SELECT 1 FROM {self._table} LIMIT 1").fetchone() is not None: return
+        if not json_file.exists(): return
+        try:
+            with open(str(json_file), "r", encoding="utf-8") as f: n_data: dict = json.load(f)
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库(sqlite)导入json数据失败,失败原因: %s", e)
+            return
+        if not n_data: return
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for k, v in n_data.items(): self._upsert(k, v)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self._e.info("缓存数据库(sqlite)已导入json数据,用户数: %s", len(n_data))
+
+    def _row_to_dict(self, row: sqlite3.Row) -> dict:
+        res: dict = {}
+        for col in self._columns():
+            res[col] = bool(row[col]) if col == NosqlEnum.STATUS.value else row[col]
+        return res
+
+    def _upsert(self, key: str, data: dict) -> None:
+        cols: list = self._columns()
+        vals: list = [int(bool(data.get(col))) if col == NosqlEnum.STATUS.value else data.get(col) for col in cols]
+        col_sql: str = ", ".join(f'"{col}"' for col in cols)
+        self._conn.execute(
+            f'INSERT OR REPLACE INTO {self._table} ("username", {col_sql}) VALUES (?, {", ".join("?" for _ in cols)})',
+            [str(key), *vals]
+        )
+
+    def _flush_nosql_data(self) -> bool:
+        # 每次写操作已在事务中提交,无需额外刷盘
+        return True
+
+    def _get_nosql_data(self) -> dict | None:
+        try:
+            with self._conn_lock:
+                rows: list = self._conn.execute(f"SELECT * FROM {self._table}").fetchall()
+            return {row["username"]: self._row_to_dict(row) for row in rows}
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库获取数据失败,失败原因: %s", e)
+            return
+
+    def _has_nosql_key(self, key: str) -> bool:
+        with self._conn_lock:
+            return self._conn.execute(f'SELECT 1 FROM {self._table} WHERE "username" = ?', (str(key),)).fetchone() is not None
+
+    def _get_nosql_record(self, key: str) -> dict | None:
+        with self._conn_lock:
+            row: sqlite3.Row | None = self._conn.execute(f'SELECT * FROM {self._table} WHERE "username" = ?', (str(key),)).fetchone()
+        if row is None: return None
+        return self._row_to_dict(row)
+
+    def _get_nosql_auth(self, key: str) -> str | None:
+        with self._conn_lock:
+            row: sqlite3.Row | None = self._conn.execute(
+                f'SELECT "{NosqlEnum.AUTHORIZATION.value}" FROM {self._table} WHERE "username" = ?',
+                (str(key),)
+            ).fetchone()
+        if row is None: return None
+        return row[0]
+
+    def _get_nosql_data_by_auth(self, key: str) -> dict | None:
+        try:
+            with self._conn_lock:
+                rows: list = self._conn.execute(
+                    f'SELECT * FROM {self._table} WHERE "{NosqlEnum.AUTHORIZATION.value}" = ?',
+                    (key,)
+                ).fetchall()
+            return {row["username"]: self._row_to_dict(row) for row in rows}
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库获取数据失败,失败原因: %s", e)
+            return
+
+    def _insert_nosql_data(self, data: UserData) -> bool:
+        # 直接插入缓存数据库.如果数据存在那么直接覆盖.login_time直接更新
+        if not isinstance(data, UserData):
+            self._e.error("数据库插入数据类型错误, 需要类型: %s, 实际类型: %s", type(UserData), type(data))
+            return False
+        try:
+            tmp_meta_data: dict = data.metadata.info
+            tmp_meta_data.update({NosqlEnum.LOGIN_TIME.value: str(datetime.now().isoformat())})
+            tmp_meta_data.update({NosqlEnum.UPDATE_TIME.value: str(datetime.now().isoformat())})
+            with self._conn_lock: self._upsert(str(data.key), tmp_meta_data)
+            self._e.info("缓存数据库插入数据成功,时间: %s", str(datetime.now().isoformat()))
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库插入数据失败,失败原因: %s, 时间: %s", e, str(datetime.now().isoformat()))
+            return False
+
+    def _insert_nosql_data_many(self, data: list) -> int:
+        # 批量插入,整批在一个事务中提交,返回插入成功的数量
+        insert_count: int = 0
+        login_time: str = str(datetime.now().isoformat())
+        with self._conn_lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for item in data:
+                    if not isinstance(item, UserData):
+                        self._e.error("数据库插入数据类型错误, 需要类型: %s, 实际类型: %s", type(UserData), type(item))
+                        continue
+                    tmp_meta_data: dict = item.metadata.info
+                    tmp_meta_data.update({NosqlEnum.LOGIN_TIME.value: login_time, NosqlEnum.UPDATE_TIME.value: login_time})
+                    self._upsert(str(item.key), tmp_meta_data)
+                    insert_count += 1
+                self._conn.execute("COMMIT")
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                self._e.handle_exception(e)
+                self._e.error("缓存数据库批量插入数据失败,失败原因: %s", e)
+                return 0
+        self._e.info("缓存数据库批量插入数据成功,数量: %s, 时间: %s", insert_count, login_time)
+        return insert_count
+
+    def _delete_nosql_data(self, key: str) -> bool:
+        try:
+            with self._conn_lock: self._conn.execute(f'DELETE FROM {self._table} WHERE "username" = ?', (str(key),))
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库删除数据失败,失败原因: %s", e)
+            return False
+
+    def _update_nosql_data(self, key: str, data: MetaUserData) -> bool:
+        try:
+            if not key:
+                self._e.error("键值不能为空")
+                return False
+            # login_time保持不变,update_time刷新
+            mod_data: dict = data.info
+            mod_data.pop(NosqlEnum.LOGIN_TIME.value, None)
+            mod_data.update({NosqlEnum.UPDATE_TIME.value: str(datetime.now().isoformat())})
+            cols: list = [col for col in self._columns() if col in mod_data]
+            vals: list = [int(bool(mod_data[col])) if col == NosqlEnum.STATUS.value else mod_data[col] for col in cols]
+            set_sql: str = ", ".join(f'"{col}" = ?' for col in cols)
+            with self._conn_lock:
+                cursor: sqlite3.Cursor = self._conn.execute(
+                    f'UPDATE {self._table} SET {set_sql} WHERE "username" = ?',
+                    [*vals, str(key)]
+                )
+            if cursor.rowcount == 0:
+                self._e.info("用户数据不存在")
+                return False
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
+            return False
+
+    def _update_nosql_data_by_key(self, key: str, field: str, val: str | bool) -> bool:
+        try:
+            if not key or not field: return False
+            if not NosqlEnum.is_in_nosql_field(field):
+                self._e.error("修改字段不存在")
+                return False
+            if field == NosqlEnum.LOGIN_TIME.value:
+                self._e.error("登录时间不可修改")
+                return False
+            tmp_val: str | int = int(bool(val)) if field == NosqlEnum.STATUS.value else val
+            with self._conn_lock:
+                cursor: sqlite3.Cursor = self._conn.execute(
+                    f'UPDATE {self._table} SET "{field}" = ? WHERE "username" = ?',
+                    (tmp_val, str(key))
+                )
+            if cursor.rowcount == 0:
+                self._e.error("用户数据不存在")
+                return False
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
+            return False
+
+    def _refresh_nosql_auth(self, key: str, auth: str) -> bool:
+        # 重新登录后替换token,login_time和update_time一并刷新,占用状态和租约保持不变
+        try:
+            if not key or not auth: return False
+            now: str = str(datetime.now().isoformat())
+            with self._conn_lock:
+                cursor: sqlite3.Cursor = self._conn.execute(
+                    f'UPDATE {self._table} SET "{NosqlEnum.AUTHORIZATION.value}" = ?, "{NosqlEnum.LOGIN_TIME.value}" = ?, '
+                    f'"{NosqlEnum.UPDATE_TIME.value}" = ? WHERE "username" = ?',
+                    (auth, now, now, str(key))
+                )
+            if cursor.rowcount == 0:
+                self._e.error("用户数据不存在")
+                return False
+            return True
+        except Exception as e:
+            self._e.handle_exception(e)
+            self._e.error("缓存数据库更新数据失败,失败原因: %s", e)
+            return False
+
+    def _get_idle_nosql_keys(self, limit: int, exclude: set | None = None) -> list:
+        # 走is_occupancy索引,多取出排除集合大小的数据以抵消被排除的用户
+        if limit <= 0: return []
+        fetch_limit: int = limit + (len(exclude) if exclude else 0)
+        with self._conn_lock:
+            rows: list = self._conn.execute(
+                f'SELECT "username" FROM {self._table} WHERE "{NosqlEnum.STATUS.value}" = 0 '
+                f'AND "{NosqlEnum.AUTHORIZATION.value}" IS NOT NULL AND "{NosqlEnum.AUTHORIZATION.value}" != \'\' LIMIT ?',
+                (fetch_limit,)
+            ).fetchall()
+        res: list = [row[0] for row in rows if not exclude or row[0] not in exclude]
+        return res[:limit]
+
+    def _update_nosql_status_many(self, keys: list, status: bool, lease_expire: str | None = None) -> dict:
+        # 一个事务内完成 查询 + 条件更新,其他进程无法在中间抢占同一批用户
+        res: dict = {}
+        if not keys: return res
+        update_time: str = str(datetime.now().isoformat())
+        with self._conn_lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for i in range(0, len(keys), self._batch_size):
+                    chunk: list = [str(k) for k in keys[i:i + self._batch_size]]
+                    placeholders: str = ", ".join("?" for _ in chunk)
+                    rows: list = self._conn.execute(
+                        f'SELECT "username", "{NosqlEnum.AUTHORIZATION.value}" FROM {self._table} '
+                        f'WHERE "username" IN ({placeholders}) AND "{NosqlEnum.STATUS.value}" = ?',
+                        [*chunk, int(not status)]
+                    ).fetchall()
+                    if not rows: continue
+                    changed: list = [row[0] for row in rows]
+                    self._conn.execute(
+                        f'UPDATE {self._table} SET "{NosqlEnum.STATUS.value}" = ?, "{NosqlEnum.LEASE_EXPIRE.value}" = ?, '
+                        f'"{NosqlEnum.UPDATE_TIME.value}" = ? WHERE "username" IN ({", ".join("?" for _ in changed)})',
+                        [int(status), lease_expire, update_time, *changed]
+                    )
+                    for row in rows: res[row[0]] = row[1]
+                self._conn.execute("COMMIT")
+                return res
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                self._e.handle_exception(e)
+                self._e.error("缓存数据库批量更新占用状态失败,失败原因: %s", e)
+                return {}
+
+    def _update_nosql_lease_many(self, leases: dict) -> int:
+        # 续写占用中用户的租约到期时间,占用状态不变.leases为 用户名 -> 到期时间,返回更新的数量
+        if not leases: return 0
+        update_time: str = str(datetime.now().isoformat())
+        with self._conn_lock:
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                cursor = self._conn.executemany(
+                    f'UPDATE {self._table} SET "{NosqlEnum.LEASE_EXPIRE.value}" = ?, "{NosqlEnum.UPDATE_TIME.value}" = ? '
+                    f'WHERE "username" = ? AND "{NosqlEnum.STATUS.value}" = 1',
+                    [(lease_expire, update_time, str(key)) for key, lease_expire in leases.items()]
+                )
+                self._conn.execute("COMMIT")
+                return cursor.rowcount
+            except Exception as e:
+                self._conn.execute("ROLLBACK")
+                self._e.handle_exception(e)
+                self._e.error("缓存数据库批量更新租约失败,失败原因: %s", e)
+                return 0